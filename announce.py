@@ -0,0 +1,224 @@
+# announce.py
+"""
+Announcements
+Interrupt whatever the receiver is playing with a short clip (doorbell chime,
+TTS) at an announcement volume, then put back the previous URI, position,
+volume and transport state
+"""
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from heos_api import action_failed
+from tracing import propagate
+
+log = logging.getLogger(__name__)
+
+# Transport states in which the clip is audible or about to be
+STARTED_STATES = {"TRANSITIONING", "PLAYING"}
+
+
+def _seconds(hms):
+    try:
+        seconds = 0.0
+        for part in (hms or "").split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except ValueError:
+        return 0.0
+
+
+class Announcer:
+    def __init__(self, device, fader=None, volume=40, poll_interval=0.05, start_timeout=10.0, max_duration=120.0):
+        """
+        device: HeosDevice to announce on
+        fader: optional VolumeFader; a running fade is cancelled so it can't fight the restore
+        volume: default announcement volume
+        poll_interval: seconds between transport checks while the clip plays
+        start_timeout: give up on a clip that hasn't started playing after this long
+        max_duration: restore after this long even if the clip never reports an end (a stream)
+        """
+        self.device = device
+        self.fader = fader
+        self.volume = volume
+        self.poll_interval = poll_interval
+        self.start_timeout = start_timeout
+        self.max_duration = max_duration
+
+        # One announcement at a time; a second one waits and then snapshots the restored state
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="announce")
+        self.active = None
+        self.last_report = None
+
+    def _parallel(self, *calls):
+        """Run device calls concurrently and return their results in order"""
+        futures = [self._executor.submit(propagate(call)) for call in calls]
+        return [future.result() for future in futures]
+
+    def snapshot(self):
+        """What to restore: transport URI and metadata, state, position and volume, fetched in one round
+
+        Parts the renderer didn't report are None, never a stand-in value: "complete"
+        is False when the transport state or media info couldn't be read, and
+        "volume" is None when the volume couldn't.
+        """
+        status, media, position, volume = self._parallel(
+            self.device.get_status, self.device.get_media_info, self.device.get_position_info,
+            self.device.get_volume_level)
+        # NrTracks is in every GetMediaInfo reply, even from an idle renderer; a fault or
+        # connection error parses to nothing
+        media_read = "Error" not in media and media.get("NrTracks") is not None
+        state = status.get("Transport State")
+        if state == "N/A":
+            state = None
+        duration = _seconds(position.get("TrackDuration"))
+        return {
+            "uri": media.get("CurrentURI") if media_read else None,
+            "metadata": media.get("CurrentURIMetaData") or "",
+            "state": state,
+            "volume": volume,
+            # Only tracks with a length can be resumed where they were; streams restart live
+            "position": position.get("RelTime") if duration > 0 else None,
+            "complete": media_read and state is not None,
+        }
+
+    def _wait_for_end(self, report, t0):
+        """Follow the clip through its transport states: started (TRANSITIONING/PLAYING), then ended"""
+        started = None
+        while True:
+            state = self.device.get_status().get("Transport State")
+            elapsed = time.monotonic() - t0
+            if started is None:
+                if state in STARTED_STATES:
+                    started = elapsed
+                    report["clip_started_ms"] = round(elapsed * 1000, 1)
+                elif elapsed > self.start_timeout:
+                    report["outcome"] = "clip did not start"
+                    return
+            elif state not in STARTED_STATES and state is not None:
+                report["outcome"] = "completed"
+                return
+            elif elapsed - started > self.max_duration:
+                report["outcome"] = "clip too long"
+                return
+            time.sleep(self.poll_interval)
+
+    def announce(self, uri, volume=None, metadata="", wait=True):
+        """Play `uri` over the current audio and restore it afterwards; returns the timing report
+
+        With wait=False the announcement runs in the background and only its id is returned.
+        """
+        announcement_id = uuid.uuid4().hex[:12]
+        if not wait:
+            threading.Thread(target=propagate(self._announce), args=(uri, volume, metadata, announcement_id),
+                             name="announcement", daemon=True).start()
+            return {"id": announcement_id, "uri": uri}
+        return self._announce(uri, volume, metadata, announcement_id)
+
+    def _announce(self, uri, volume, metadata, announcement_id):
+        volume = self.volume if volume in (None, "") else int(volume)
+        with self._lock:
+            if self.fader is not None:
+                # The snapshot below must read the volume the fade stopped at
+                self.fader.cancel(wait=True)
+            t0 = time.monotonic()
+            previous = self.snapshot()
+            snapshot_done = time.monotonic()
+            report = {"id": announcement_id, "uri": uri, "volume": volume, "previous": previous,
+                      "snapshot_ms": round((snapshot_done - t0) * 1000, 1), "outcome": None}
+            if not previous["complete"]:
+                # Playing over audio we couldn't record would leave the clip on the receiver
+                report["outcome"] = "skipped: couldn't read what the receiver is playing"
+                self.last_report = report
+                log.warning("Announcement %s skipped: snapshot incomplete %s", uri, previous)
+                return report
+            if previous["volume"] is None:
+                # Without the old level there is nothing to go back to, so leave the volume alone
+                log.warning("Announcement %s plays at the current volume: volume unreadable", uri)
+                report["volume"] = None
+            self.active = report
+            # The interruption starts here: SetAVTransportURI stops the current audio
+            interrupted = time.monotonic()
+            try:
+                self.device.set_uri(uri, metadata)
+                # The volume change lands while the clip buffers, before it is audible
+                if report["volume"] is None:
+                    self.device.play()
+                else:
+                    self._parallel(lambda: self.device.set_volume(volume), self.device.play)
+                self._wait_for_end(report, interrupted)
+                report["clip_ended_ms"] = round((time.monotonic() - interrupted) * 1000, 1)
+            except Exception as e:
+                log.exception("Error playing announcement %s", uri)
+                report["outcome"] = f"error: {e}"
+            finally:
+                self.restore(previous)
+                restored = time.monotonic()
+                report["interrupt_ms"] = round((restored - interrupted) * 1000, 1)
+                report["restore_ms"] = round((restored - interrupted) * 1000 - report.get("clip_ended_ms", 0), 1)
+                self.active = None
+                self.last_report = report
+        log.info("Announcement %s: %s, interrupted %.0f ms", uri, report["outcome"], report["interrupt_ms"],
+                 extra={"announcement": report})
+        return report
+
+    def restore(self, previous):
+        """Put back URI and volume together, resume the position, then play if it was playing"""
+        calls = []
+        if previous["volume"] is not None:
+            calls.append(lambda: self.device.set_volume(previous["volume"]))
+        if previous["uri"]:
+            calls.append(lambda: self.device.set_uri(previous["uri"], previous["metadata"]))
+        self._parallel(*calls)
+        if not previous["uri"]:
+            return
+        seek_failed = previous["position"] and action_failed(self.device.seek(previous["position"]))
+        if previous["state"] in STARTED_STATES:
+            self.device.play()
+            if seek_failed:
+                # Some renderers only seek once the track is loaded
+                self.device.seek(previous["position"])
+
+    def status(self):
+        return {"active": self.active, "last": self.last_report}
+
+
+# Interrupt-time check when run directly: a 1.5 s chime over a playing track on a fake renderer
+if __name__ == "__main__":
+    from heos_api import HeosDevice
+    from fake_renderer import FakeRenderer
+
+    chime, clip_length = "http://127.0.0.1/chime.mp3", 1.5
+    # 20 ms per SOAP call and 150 ms of buffering before audio starts, like a receiver on Wi-Fi
+    renderer = FakeRenderer(latency=0.02, start_delay=0.15,
+                            durations={chime: clip_length, "http://nas/album/track3.flac": 300}).start()
+    device = HeosDevice(renderer.ip, renderer.port)
+    device.set_uri("http://nas/album/track3.flac", "<DIDL-Lite>track 3</DIDL-Lite>")
+    device.play()
+    device.set_volume(25)
+    time.sleep(2.2)
+
+    announcer = Announcer(device, volume=55)
+    report = announcer.announce(chime)
+    time.sleep(0.4)
+
+    volumes = [args["volume"] for _, action, args in renderer.log if action == "SetVolume"]
+    silence = sum(renderer.gaps())
+    print(f"outcome {report['outcome']}: snapshot {report['snapshot_ms']} ms, clip audible after "
+          f"{report['clip_started_ms']} ms, interrupt {report['interrupt_ms']} ms for a "
+          f"{clip_length * 1000:.0f} ms clip (restore {report['restore_ms']} ms), silence {silence * 1000:.0f} ms")
+    print(f"after: {renderer.uri} {renderer.state} at {renderer.position():.1f}s, volume {renderer.volume}, "
+          f"volumes sent {volumes}")
+
+    assert report["outcome"] == "completed"
+    assert renderer.uri == "http://nas/album/track3.flac" and renderer.state == "PLAYING"
+    assert renderer.metadata == "<DIDL-Lite>track 3</DIDL-Lite>" and renderer.volume == 25
+    assert renderer.position() >= 2.0, "the track should resume where it was, not from the start"
+    # The clip itself plus detection (one poll) and a few round trips, nothing like a fixed sleep
+    assert report["interrupt_ms"] < clip_length * 1000 + 500, report["interrupt_ms"]
+    assert report["restore_ms"] < 150, report["restore_ms"]
+    renderer.stop()
+    print("OK")
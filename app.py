@@ -4,31 +4,119 @@ HEOS Dashboard - Main Application
 Connects configuration, API, and stations modules to provide web interface
 """
 import os
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file
+import time
+import logging
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, g
 import json
 import tempfile
 import io
+from contextlib import nullcontext
 
 # Import configuration
 from config import setup_configuration, save_config, check_device_connection, update_config_from_heos
 
 # Import HEOS API
-from heos_api import HeosDevice
+from heos_api import HeosDevice, action_failed
 
-# Import station management
-from stations import StationManager
+# Import playback scheduling
+from scheduler import DAY_NAMES
 
-# Initialize configuration
-config = setup_configuration()
+# Import shared services and the state client (used when running under serve.py)
+from state_server import create_services, start_services, StateClient, RemoteService, RemoteStationManager
+
+# Import static asset pipeline (fingerprinted, precompressed files)
+from assets import StaticAssets
+
+# Import structured logging (queued, so request threads never wait on log output)
+import logs
+
+# Import request tracing (spans around routes, SOAP calls and storage)
+import tracing
+
+# Import DIDL-Lite metadata for items played from media servers
+from media_server import build_didl
+
+# Import opt-in per-request profiling
+from profiling import RequestProfiler
+
+logs.setup_logging()
+log = logging.getLogger(__name__)
 
 # Initialize Flask application
 app = Flask(__name__)
 
-# Initialize device connection
-device = HeosDevice(config["device"]["ip"], config["device"]["port"])
-
-# Initialize station manager
-station_manager = StationManager(config["app"]["stations_file"])
+# When a state daemon socket is given, every worker process shares one device,
+# station list and config through it instead of keeping its own copies
+STATE_SOCKET = os.environ.get("HEOS_STATE_SOCKET")
+
+if STATE_SOCKET:
+    state = StateClient(STATE_SOCKET)
+    config = state.fetch_config()
+    save_config = state.save_config
+    device = RemoteService(state, "device")
+    station_manager = RemoteStationManager(state, "stations")
+    scheduler = RemoteService(state, "scheduler")
+    now_playing = RemoteService(state, "now_playing")
+    icy = RemoteService(state, "icy")
+    fader = RemoteService(state, "fader")
+    catalog = RemoteService(state, "catalog")
+    station_search = RemoteService(state, "search")
+    traces = RemoteService(state, "traces")
+    media = RemoteService(state, "media")
+    play_queue = RemoteService(state, "queue")
+    switch_timer = RemoteService(state, "switch_timing")
+    announcer = RemoteService(state, "announcer")
+    station_changes = RemoteService(state, "station_changes")
+    station_sync = RemoteService(state, "station_sync")
+    # The daemon already serializes station edits with the changes it pulls from peers
+    station_lock = nullcontext()
+
+    @app.before_request
+    def sync_shared_config():
+        """Pick up config changes made through other workers (static files don't read the config)"""
+        if request.endpoint not in ("static", "assets"):
+            state.sync_config(config)
+else:
+    state = None
+
+    # Initialize configuration
+    config = setup_configuration()
+
+    # Initialize device connection, station manager, scheduler and state pollers
+    services = create_services(config)
+    device = services["device"]
+    station_manager = services["stations"]
+    scheduler = services["scheduler"]
+    now_playing = services["now_playing"]
+    icy = services["icy"]
+    fader = services["fader"]
+    catalog = services["catalog"]
+    station_search = services["search"]
+    traces = services["traces"]
+    media = services["media"]
+    play_queue = services["queue"]
+    switch_timer = services["switch_timing"]
+    announcer = services["announcer"]
+    station_changes = services["station_changes"]
+    station_sync = services["station_sync"]
+    # Held by the sync thread while it applies pulled changes; route edits take it as well
+    station_lock = station_sync.lock
+
+# Serve the vendored, fingerprinted static files. This refuses to start without the
+# vendor files, so it runs before any background thread is started
+static_assets = StaticAssets(app, cdn_fallback=config["ui"].get("cdn_fallback", False))
+
+# Under the debug reloader the parent process only watches files; background
+# threads start in the serving child (see __main__ below)
+if state is None and __name__ != "__main__":
+    start_services(services)
+
+# Apply the config's logging section and tag every request with an id
+logs.setup_logging(config.get("logging"))
+logs.init_app(app)
+tracing.init_app(app, traces, config.get("tracing"))
+request_profiler = RequestProfiler(config.get("profiling"))
+request_profiler.init_app(app)
 
 @app.route("/", methods=["GET"])
 def index():
@@ -49,9 +137,46 @@ def index():
         current_station=request.args.get('station', ''),
         device_name=device_name,
         device_model=device_model,
-        connection_status=connection_status
+        connection_status=connection_status,
+        device_health=device.get_health()
     )
 
+@app.route("/api/now_playing", methods=["GET"])
+def api_now_playing():
+    """Latest device state snapshot (transport, track, position, volume, mute)"""
+    state = now_playing.get_state()
+
+    # For internet radio the track title lives in the stream, not in UPnP state
+    stream_uri = state.get("current_uri") or state.get("track_uri") or ""
+    state["stream_title"] = None
+    if stream_uri.startswith(("http://", "https://")):
+        state["stream_title"] = icy.get_metadata(stream_uri)["title"]
+    return jsonify(state)
+
+@app.route("/api/icy", methods=["GET"])
+def api_icy():
+    """Current ICY stream title for a station URI"""
+    uri = request.args.get("uri", "")
+    if not uri.startswith(("http://", "https://")):
+        return jsonify({"success": False, "message": "An http(s) stream URI is required"}), 400
+    # Only streams the dashboard already knows about, so the server can't be pointed at arbitrary hosts
+    playing = now_playing.get_state()
+    known = {station.get("uri") for station in station_manager.stations}
+    known.update((playing.get("current_uri"), playing.get("track_uri")))
+    if uri not in known:
+        return jsonify({"success": False, "message": "Not a saved station or the playing stream"}), 403
+    return jsonify(icy.get_metadata(uri))
+
+@app.route("/api/logging", methods=["GET"])
+def logging_status():
+    """Log queue depth and records dropped because the queue was full (this process)"""
+    return jsonify(logs.stats())
+
+@app.route("/api/device_health", methods=["GET"])
+def device_health():
+    """Report circuit breaker state so the dashboard can tell when the device is back"""
+    return jsonify(device.get_health())
+
 @app.route("/preset_play", methods=["POST"])
 def preset_play():
     """Play a preset station"""
@@ -59,28 +184,42 @@ def preset_play():
     station_name = request.form.get("name")
     
     if uri:
-        device.set_uri(uri)
-        device.play()
+        _switch(station_name, uri)
     
     # Redirect to home with station name parameter
     return redirect(url_for('index', station=station_name))
 
+def _switch(name, uri, metadata=""):
+    """Switch to a station/track and hand the timestamps to the click-to-sound timer"""
+    # Count from the request's arrival (stamped by logs.init_app), not from here
+    clicked = time.monotonic() - (time.perf_counter() - g.get("request_started", time.perf_counter()))
+    reply = device.set_uri(uri, metadata)
+    uri_set = time.monotonic()
+    error = "SetAVTransportURI failed" if action_failed(reply) else None
+    if error is None and action_failed(device.play()):
+        error = "Play failed"
+    switch_timer.begin(name, uri, clicked, uri_set, time.monotonic(), error)
+    now_playing.poke()
+
 @app.route("/play", methods=["POST"])
 def play():
     """Start playback"""
     device.play()
+    now_playing.poke()
     return redirect(url_for('index'))
 
 @app.route("/pause", methods=["POST"])
 def pause():
     """Pause playback"""
     device.pause()
+    now_playing.poke()
     return redirect(url_for('index'))
 
 @app.route("/stop", methods=["POST"])
 def stop():
     """Stop playback"""
     device.stop()
+    now_playing.poke()
     return redirect(url_for('index'))
 
 @app.route("/setvolume", methods=["POST"])
@@ -88,19 +227,88 @@ def set_volume():
     """Set volume level"""
     level = request.form.get("level")
     if level:
+        # A manual change wins over any running fade
+        fader.cancel()
         device.set_volume(level)
+        now_playing.poke()
     return redirect(url_for('index'))
 
+@app.route("/fade", methods=["POST"])
+def fade_volume():
+    """Fade the volume to a target level over a number of seconds"""
+    try:
+        target = request.form.get("target")
+        duration = request.form.get("duration", "5")
+        start = request.form.get("start")
+
+        if target is None:
+            return jsonify({"success": False, "message": "Target volume is required"}), 400
+
+        fade = fader.fade(int(target), float(duration), start=int(start) if start else None)
+        now_playing.poke()
+        return jsonify({"success": True, "fade": fade})
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/duck", methods=["POST"])
+def duck_volume():
+    """Quickly lower the volume (announcements); /unduck restores it"""
+    try:
+        level = int(request.form.get("level", "10"))
+        duration = float(request.form.get("duration", "0.5"))
+        return jsonify({"success": True, "fade": fader.duck(level, duration)})
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/unduck", methods=["POST"])
+def unduck_volume():
+    """Restore the volume from before /duck"""
+    try:
+        duration = float(request.form.get("duration", "1.0"))
+        return jsonify({"success": True, "fade": fader.restore(duration)})
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/announce", methods=["POST"])
+def announce():
+    """Play a clip (chime, TTS) over the current audio, then restore what was playing"""
+    uri = request.form.get("uri", "")
+    if not uri.startswith(("http://", "https://")):
+        return jsonify({"success": False, "message": "An http(s) clip URI is required"}), 400
+    try:
+        volume = request.form.get("volume", type=int)
+        if volume is None:
+            volume = config["ui"].get("announce_volume", 40)
+        return jsonify({"success": True, "announcement": announcer.announce(uri, volume, wait=False)})
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/api/announce", methods=["GET"])
+def api_announce():
+    """Running announcement and the timing report of the last one"""
+    return jsonify(announcer.status())
+
+@app.route("/api/fade", methods=["GET"])
+def api_fade():
+    """Running fade and step-timing jitter of the last one"""
+    return jsonify(fader.status())
+
 @app.route("/poweroff", methods=["POST"])
 def power_off():
     """Power off the device"""
     device.power_off()
+    now_playing.poke()
     return redirect(url_for('index'))
 
 @app.route("/manage_stations", methods=["GET"])
 def manage_stations():
     """Render station management page"""
-    return render_template("manage_stations.html", stations=station_manager.stations, config=config)
+    return render_template("manage_stations.html", stations=station_manager.stations, config=config,
+                           catalog_info=catalog.info())
 
 @app.route("/add_station", methods=["POST"])
 def add_station():
@@ -112,7 +320,8 @@ def add_station():
         if not name or not uri:
             return jsonify({"success": False, "message": "Name and URI are required"}), 400
         
-        station_manager.add_station(name, uri)
+        with station_lock:
+            station_manager.add_station(name, uri)
         return redirect(url_for('manage_stations'))
     
     except Exception as e:
@@ -127,7 +336,8 @@ def remove_station():
         if not name:
             return jsonify({"success": False, "message": "Station name is required"}), 400
         
-        station_manager.remove_station(name)
+        with station_lock:
+            station_manager.remove_station(name)
         return redirect(url_for('manage_stations'))
     
     except Exception as e:
@@ -143,7 +353,8 @@ def remove_multiple_stations():
         if not names:
             return jsonify({"success": False, "message": "No station names provided"}), 400
         
-        result = station_manager.remove_stations(names)
+        with station_lock:
+            result = station_manager.remove_stations(names)
         
         if result:
             return jsonify({"success": True}), 200
@@ -166,7 +377,7 @@ def export_stations():
         )
 
     except Exception as e:
-        print(f"[EXPORT ERROR] {e}")
+        log.exception("Error exporting stations")
         return jsonify({"success": False, "message": str(e)})
 
 @app.route("/import_stations", methods=["POST"])
@@ -206,13 +417,13 @@ def import_stations():
                 raise ValueError("Invalid station format in JSON file")
             
             # Add stations
-            if replace:
-                station_manager._stations = stations_data
-                station_manager.save()
-            else:
-                # Add each station
-                for station in stations_data:
-                    station_manager.add_station(station['name'], station['uri'])
+            with station_lock:
+                if replace:
+                    station_manager.replace_stations(stations_data)
+                else:
+                    # Add or update them all in one batch (and one save)
+                    station_manager.apply_changes([{"name": s['name'], "station": {"name": s['name'], "uri": s['uri']}}
+                                                   for s in stations_data])
             
         finally:
             # Clean up the temp file
@@ -223,6 +434,260 @@ def import_stations():
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
+@app.route("/stations/changes", methods=["GET"])
+def stations_changes():
+    """Station changes after revision `since`, for another dashboard to pull"""
+    try:
+        since = request.args.get("since", 0, type=int)
+        limit = max(1, min(request.args.get("limit", 1000, type=int), 5000))
+        return jsonify(station_changes.changes(since, limit))
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/stations/sync", methods=["POST"])
+def stations_sync():
+    """Pull station changes now from one peer (`peer`) or all configured ones"""
+    try:
+        peer = request.form.get("peer")
+        if peer and peer.rstrip("/") not in station_sync.status()["peers"]:
+            return jsonify({"success": False, "message": "Not a configured sync peer"}), 400
+        reports = [station_sync.pull(peer)] if peer else station_sync.pull_all()
+        return jsonify({"success": not any("error" in report for report in reports), "reports": reports})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/api/stations/sync", methods=["GET"])
+def api_stations_sync():
+    """Local revision plus the revision reached on each peer"""
+    return jsonify({"local": station_changes.status(), "sync": station_sync.status()})
+
+@app.route("/schedules", methods=["GET"])
+def schedules():
+    """Render the schedule management page"""
+    return render_template("schedules.html", scenes=scheduler.list_scenes(),
+                           stations=station_manager.stations, day_names=DAY_NAMES)
+
+@app.route("/api/schedules", methods=["GET"])
+def api_schedules():
+    """List scheduled scenes with their next firing time"""
+    return jsonify(scheduler.list_scenes())
+
+@app.route("/add_schedule", methods=["POST"])
+def add_schedule():
+    """Add a scheduled scene"""
+    try:
+        time_of_day = request.form.get("time")
+        if not time_of_day:
+            return jsonify({"success": False, "message": "Time is required"}), 400
+
+        scheduler.add_scene(
+            request.form.get("name"),
+            time_of_day,
+            days=request.form.getlist("days"),
+            uri=request.form.get("uri"),
+            volume=request.form.get("volume"),
+            power=request.form.get("power"),
+            fade=request.form.get("fade")
+        )
+        return redirect(url_for('schedules'))
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/remove_schedule", methods=["POST"])
+def remove_schedule():
+    """Remove a scheduled scene"""
+    try:
+        scene_id = request.form.get("id")
+
+        if not scene_id:
+            return jsonify({"success": False, "message": "Schedule id is required"}), 400
+
+        scheduler.remove_scene(scene_id)
+        return redirect(url_for('schedules'))
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/import_catalog", methods=["POST"])
+def import_catalog():
+    """Ingest a radio-directory dump (CSV, JSON or NDJSON) into the station catalog"""
+    try:
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({"success": False, "message": "No file selected"}), 400
+
+        file = request.files['file']
+        extension = os.path.splitext(file.filename)[1].lower()
+        if extension not in ('.csv', '.json', '.ndjson', '.jsonl'):
+            return jsonify({"success": False, "message": "Only CSV, JSON and NDJSON dumps are supported"}), 400
+
+        # Keep the extension so the ingester can tell the format
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=extension)
+        file.save(temp_file.name)
+        temp_file.close()
+
+        try:
+            catalog.import_dump(temp_file.name)
+        finally:
+            os.unlink(temp_file.name)
+
+        return redirect(url_for('manage_stations'))
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/api/catalog", methods=["GET"])
+def api_catalog():
+    """Page through the station catalog"""
+    start = max(0, request.args.get("start", 0, type=int))
+    count = max(1, min(request.args.get("count", 50, type=int), 500))
+    return jsonify({"info": catalog.info(), "stations": catalog.page(start, count)})
+
+@app.route("/api/stations/search", methods=["GET"])
+def api_station_search():
+    """Typeahead search over presets, or the catalog with source=catalog"""
+    query = request.args.get("q", "")
+    limit = max(1, min(request.args.get("limit", 10, type=int), 100))
+    if request.args.get("source") == "catalog":
+        results = catalog.search(query, limit)
+    else:
+        results = station_search.search(query, limit)
+    return jsonify({"query": query, "results": results})
+
+@app.route("/add_catalog_station", methods=["POST"])
+def add_catalog_station():
+    """Copy a catalog entry into the preset station list"""
+    try:
+        index = request.form.get("index", type=int)
+        if index is None:
+            return jsonify({"success": False, "message": "Catalog index is required"}), 400
+
+        entry = catalog.get(index)
+        if entry is None:
+            return jsonify({"success": False, "message": "No such catalog station"}), 404
+        with station_lock:
+            station_manager.add_station(entry["name"], entry["uri"])
+        return redirect(url_for('manage_stations'))
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/browse", methods=["GET"])
+def browse():
+    """Page through a media server's folders"""
+    servers = media.servers()
+    server_id = request.args.get("server") or (servers[0]["id"] if servers else None)
+    page, error = None, None
+    if server_id:
+        try:
+            page = media.browse(server_id, request.args.get("id", "0"), request.args.get("start", 0, type=int))
+        except Exception as e:
+            error = str(e)
+    return render_template("browse.html", servers=servers, server_id=server_id, page=page, error=error,
+                           queue=play_queue.list())
+
+@app.route("/api/media_servers", methods=["GET"])
+def api_media_servers():
+    """Known media servers; ?refresh=1 runs discovery again"""
+    if request.args.get("refresh") == "1":
+        return jsonify(media.discover())
+    return jsonify(media.servers())
+
+@app.route("/api/browse", methods=["GET"])
+def api_browse():
+    """One page of a media server container"""
+    server_id = request.args.get("server")
+    if not server_id:
+        return jsonify({"success": False, "message": "Media server is required"}), 400
+    try:
+        return jsonify(media.browse(server_id, request.args.get("id", "0"),
+                                    request.args.get("start", 0, type=int), request.args.get("count", type=int)))
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 502
+
+@app.route("/play_media", methods=["POST"])
+def play_media():
+    """Play an item from a media server, with its metadata so the receiver shows title and art"""
+    try:
+        server_id = request.form.get("server")
+        object_id = request.form.get("id")
+        if not server_id or not object_id:
+            return jsonify({"success": False, "message": "Media server and item are required"}), 400
+
+        item = media.get_item(server_id, object_id)
+        _switch(item["title"], item["uri"], build_didl(item))
+        return redirect(url_for('browse', server=server_id, id=request.form.get("parent", "0"),
+                                start=request.form.get("start", 0, type=int)))
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/api/time_to_audio", methods=["GET"])
+def api_time_to_audio():
+    """Click-to-sound percentiles per station, format and device, plus recent switches"""
+    limit = max(1, min(request.args.get("limit", 50, type=int), 500))
+    window = request.args.get("minutes", type=int)
+    since = time.time() - window * 60 if window else None
+    return jsonify({"summary": switch_timer.summary(since),
+                    "history": switch_timer.history(limit, request.args.get("station"))})
+
+@app.route("/api/queue", methods=["GET"])
+def api_queue():
+    """Play queue contents and position"""
+    return jsonify(play_queue.list())
+
+@app.route("/queue/add", methods=["POST"])
+def queue_add():
+    """Queue a media server item (server + id) or any URI (uri + name)"""
+    try:
+        server_id = request.form.get("server")
+        if server_id:
+            item = media.get_item(server_id, request.form.get("id"))
+            play_queue.enqueue(item["uri"], item["title"], build_didl(item))
+            return redirect(url_for('browse', server=server_id, id=request.form.get("parent", "0"),
+                                    start=request.form.get("start", 0, type=int)))
+
+        uri = request.form.get("uri")
+        if not uri:
+            return jsonify({"success": False, "message": "A URI or media item is required"}), 400
+        play_queue.enqueue(uri, request.form.get("name"))
+        return redirect(url_for('browse'))
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/queue/play", methods=["POST"])
+def queue_play():
+    """Start the queue at an item"""
+    try:
+        play_queue.play(request.form.get("index", 0, type=int))
+        now_playing.poke()
+        return redirect(url_for('browse'))
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/queue/skip", methods=["POST"])
+def queue_skip():
+    """Move to the next queued item"""
+    play_queue.skip()
+    now_playing.poke()
+    return redirect(url_for('browse'))
+
+@app.route("/queue/remove", methods=["POST"])
+def queue_remove():
+    """Remove a queued item (not the one playing)"""
+    item_id = request.form.get("id")
+    if not item_id:
+        return jsonify({"success": False, "message": "Queue item id is required"}), 400
+    play_queue.remove(item_id)
+    return redirect(url_for('browse'))
+
+@app.route("/queue/clear", methods=["POST"])
+def queue_clear():
+    """Empty the queue"""
+    play_queue.clear()
+    return redirect(url_for('browse'))
+
 @app.route("/settings", methods=["GET"])
 def settings():
     """Render settings page"""
@@ -244,8 +709,7 @@ def update_device_config():
             config["device"]["friendly_name"] = friendly_name
 
         if save_config(config):
-            global device
-            device = HeosDevice(ip, int(port))
+            device.set_address(ip, int(port))
             return jsonify({"success": True})  # ✅ This is the key fix
         else:
             return jsonify({"success": False, "message": "Failed to save configuration"})
@@ -392,6 +856,78 @@ def rediscover_device():
             "message": f"Discovery failed: {str(e)}"
         })
 
+def _waterfall(trace):
+    """Order a trace's spans depth-first for display, with nesting depth"""
+    children = {}
+    for entry in trace["spans"]:
+        children.setdefault(entry["parent"], []).append(entry)
+    rows = []
+
+    def walk(parent, depth):
+        for entry in sorted(children.get(parent, []), key=lambda e: e["start_ms"]):
+            rows.append(dict(entry, depth=depth))
+            walk(entry["id"], depth + 1)
+
+    walk(0, 0)
+    return dict(trace, rows=rows)
+
+@app.route("/debug/login", methods=["GET", "POST"])
+def debug_login():
+    """Browser sign-in for the /debug/ pages: the token is posted once and traded for a cookie"""
+    if not request_profiler.options["token"]:
+        return jsonify({"success": False, "message": "No debug token is configured"}), 404
+    # Only back to another debug page, never to an arbitrary URL
+    next_page = request.values.get("next", "")
+    if not next_page.startswith("/debug/") or next_page.startswith("/debug/login"):
+        next_page = url_for("debug_profiles")
+    if request.method == "POST":
+        if request_profiler.check_token(request.form.get("token")):
+            return request_profiler.sign_in(redirect(next_page), secure=request.is_secure)
+        return render_template("debug_login.html", next_page=next_page, failed=True), 403
+    return render_template("debug_login.html", next_page=next_page, failed=False)
+
+@app.route("/debug/traces", methods=["GET"])
+def debug_traces():
+    """Slowest recent requests as waterfalls"""
+    # Traces carry paths, query strings and timings: the same token as /debug/profiles
+    if not request_profiler.token_matches(request):
+        return jsonify({"success": False, "message": "The debug token is missing"}), 404
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+    window = request.args.get("minutes", type=int)
+    since = time.time() - window * 60 if window else None
+    slowest = [_waterfall(trace) for trace in traces.slowest(limit, since)]
+    return render_template("debug_traces.html", traces=slowest, limit=limit, minutes=window)
+
+@app.route("/debug/traces/<trace_id>", methods=["GET"])
+def debug_trace(trace_id):
+    """One trace as JSON"""
+    if not request_profiler.token_matches(request):
+        return jsonify({"success": False, "message": "The debug token is missing"}), 404
+    trace = traces.get(trace_id)
+    if trace is None:
+        return jsonify({"success": False, "message": "Trace not found"}), 404
+    return jsonify(trace)
+
+@app.route("/debug/profiles", methods=["GET"])
+def debug_profiles():
+    """List saved request profiles"""
+    if not request_profiler.authorized(request):
+        return jsonify({"success": False, "message": "Profiling is disabled or the token is missing"}), 404
+    return render_template("debug_profiles.html", captures=request_profiler.store.list(),
+                           options=request_profiler.options)
+
+@app.route("/debug/profiles/<capture_id>", methods=["GET"])
+def debug_profile(capture_id):
+    """Download one capture (pstats or collapsed stacks), or ?view=summary for a text report"""
+    if not request_profiler.authorized(request):
+        return jsonify({"success": False, "message": "Profiling is disabled or the token is missing"}), 404
+    meta = request_profiler.store.get(capture_id)
+    if meta is None:
+        return jsonify({"success": False, "message": "Profile not found"}), 404
+    if request.args.get("view") == "summary":
+        return request_profiler.store.summary(meta), 200, {"Content-Type": "text/plain; charset=utf-8"}
+    return send_file(os.path.abspath(request_profiler.store.path(meta)), as_attachment=True, download_name=meta["file"])
+
 
 # Run the application when executed directly
 if __name__ == "__main__":
@@ -405,6 +941,10 @@ if __name__ == "__main__":
     print(f"Server: http://{host}:{port}")
     print(f"Debug mode: {'On' if debug else 'Off'}")
     print(f"Default theme: {config['ui']['theme'].capitalize()}")
-    print(f"Loaded {len(station_manager.stations)} stations\n")
+    print(f"Loaded {len(station_manager.stations)} stations")
+    print("For production use multiple workers: python serve.py\n")
+
+    if state is None and (not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+        start_services(services)
     
     app.run(debug=debug, port=port, host=host)
\ No newline at end of file
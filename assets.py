@@ -0,0 +1,356 @@
+# assets.py
+"""
+Static Assets
+Vendored, fingerprinted static files with gzip/brotli variants built ahead of
+time, served with immutable caching, plus compression of HTML/JSON responses
+"""
+import os
+import sys
+import gzip
+import json
+import base64
+import hashlib
+import logging
+import mimetypes
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import requests
+from flask import request, send_file, url_for, abort
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are built
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIRNAME = "dist"
+MANIFEST_NAME = "manifest.json"
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".html")
+COMPRESSIBLE_TYPES = ("text/html", "application/json")
+MIN_COMPRESS_SIZE = 1024
+ONE_YEAR = 365 * 24 * 3600
+
+# Pinned third-party files: logical name -> (download URL, Subresource Integrity hash).
+# They are committed under static/vendor (`python assets.py fetch` downloads them
+# again): on an isolated LAN a CDN link leaves pages unstyled, so the app refuses to
+# start without them unless ui.cdn_fallback is set.
+VENDOR = {
+    "vendor/bootstrap.min.css": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css",
+        "sha384-9ndCyUaIbzAi2FUVXJi0CjmCapSmO7SnpJef0486qhLnuZ2cdeRhO02iuK6FUUVM",
+    ),
+    # No template uses a Popper-based component (dropdown, tooltip), so not the bundle
+    "vendor/bootstrap.min.js": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.min.js",
+        "sha384-fbbOQedDUMZZ5KreZpsbe1LCZPVmfTnH7ois6mU1QK+m14rQ1l2bGBq41eYeM/fS",
+    ),
+}
+
+
+class AssetError(RuntimeError):
+    """Raised when pinned vendor files are missing or fail their integrity check"""
+
+
+def _sri(data):
+    return "sha384-" + base64.b64encode(hashlib.sha384(data).digest()).decode()
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def fetch_vendor(static_dir=STATIC_DIR):
+    """Download the pinned vendor files, refusing anything that fails its integrity check"""
+    for name, (url, integrity) in VENDOR.items():
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        if _sri(response.content) != integrity:
+            raise ValueError(f"Integrity check failed for {url}")
+        path = os.path.join(static_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, response.content)
+        print(f"Fetched {name} ({len(response.content)} bytes)")
+
+
+def missing_vendor(static_dir=STATIC_DIR):
+    """Vendor files that are absent or don't match their pinned integrity hash"""
+    missing = []
+    for name, (url, integrity) in VENDOR.items():
+        try:
+            with open(os.path.join(static_dir, name), "rb") as f:
+                if _sri(f.read()) == integrity:
+                    continue
+        except OSError:
+            pass
+        missing.append(name)
+    return missing
+
+
+def source_files(static_dir=STATIC_DIR):
+    """Logical names (relative, forward slashes) of every file to fingerprint"""
+    names = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if not (root == static_dir and d == DIST_DIRNAME))
+        for filename in sorted(files):
+            if not filename.startswith("."):
+                names.append(os.path.relpath(os.path.join(root, filename), static_dir).replace(os.sep, "/"))
+    return names
+
+
+def needs_build(static_dir=STATIC_DIR):
+    manifest = os.path.join(static_dir, DIST_DIRNAME, MANIFEST_NAME)
+    if not os.path.exists(manifest):
+        return True
+    built = os.path.getmtime(manifest)
+    return any(os.path.getmtime(os.path.join(static_dir, name)) > built for name in source_files(static_dir))
+
+
+def build(static_dir=STATIC_DIR):
+    """Write content-hashed copies plus .gz/.br variants into static/dist and a manifest"""
+    dist = os.path.join(static_dir, DIST_DIRNAME)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for name in source_files(static_dir):
+        with open(os.path.join(static_dir, name), "rb") as f:
+            data = f.read()
+        stem, ext = os.path.splitext(name)
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        built = f"{stem}.{digest}{ext}"
+        path = os.path.join(dist, built)
+        entry = {"path": built, "size": len(data), "integrity": _sri(data)}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            variants = [("gzip", ".gz", lambda d: gzip.compress(d, 9, mtime=0))]
+            if brotli is not None:
+                variants.append(("br", ".br", lambda d: brotli.compress(d, quality=11)))
+            for encoding, suffix, compress in variants:
+                if not os.path.exists(path + suffix):
+                    _write_atomic(path + suffix, compress(data))
+                entry[encoding] = os.path.getsize(path + suffix)
+        manifest[name] = entry
+
+    # Drop fingerprints no longer referenced by the manifest
+    keep = set()
+    for entry in manifest.values():
+        keep.update({entry["path"], entry["path"] + ".gz", entry["path"] + ".br"})
+    for root, _, files in os.walk(dist):
+        for filename in files:
+            relative = os.path.relpath(os.path.join(root, filename), dist).replace(os.sep, "/")
+            if relative != MANIFEST_NAME and relative not in keep and not filename.endswith(".tmp"):
+                os.remove(os.path.join(root, filename))
+
+    _write_atomic(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    try:
+        with open(os.path.join(static_dir, DIST_DIRNAME, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def accepted_encodings(header):
+    """Encodings from an Accept-Encoding header, ignoring those with q=0"""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if coding and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticAssets:
+    def __init__(self, app=None, static_dir=STATIC_DIR, cdn_fallback=False):
+        """cdn_fallback: link missing vendor files from the CDN instead of refusing to start"""
+        self.static_dir = static_dir
+        self.cdn_fallback = cdn_fallback
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Build stale assets, expose asset_url() to templates and compress responses"""
+        missing = missing_vendor(self.static_dir)
+        if missing and not self.cdn_fallback:
+            raise AssetError(f"Vendor files missing or corrupt: {', '.join(missing)}. Run `python assets.py fetch` "
+                             "on a machine with internet access and keep static/vendor with the app "
+                             "(or set ui.cdn_fallback to link them from the CDN)")
+        if missing:
+            log.warning("Vendor files missing, linking them from the CDN: %s", ", ".join(missing))
+        try:
+            if needs_build(self.static_dir):
+                build(self.static_dir)
+        except OSError as e:
+            log.error("Error building static assets: %s", e)
+        self.manifest = load_manifest(self.static_dir)
+
+        app.jinja_env.globals["asset_url"] = self.url
+        app.add_url_rule("/assets/<path:filename>", "assets", self.serve)
+        app.after_request(self.compress_response)
+
+    def url(self, name):
+        """URL of the fingerprinted file, else /static (or the CDN for vendor files, with cdn_fallback)"""
+        entry = self.manifest.get(name)
+        if entry:
+            return url_for("assets", filename=entry["path"])
+        if name in VENDOR and self.cdn_fallback:
+            return VENDOR[name][0]
+        return url_for("static", filename=name)
+
+    def serve(self, filename):
+        dist = os.path.join(self.static_dir, DIST_DIRNAME)
+        path = os.path.realpath(os.path.join(dist, filename))
+        if not path.startswith(os.path.realpath(dist) + os.sep) or filename == MANIFEST_NAME or not os.path.isfile(path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding"))
+        encoding = None
+        for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if candidate in accepted and os.path.exists(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+
+        # The fingerprint changes with the content, so the URL can be cached forever
+        response = send_file(path, mimetype=mimetype, max_age=ONE_YEAR, conditional=True,
+                             etag=f"{os.path.basename(filename)}-{encoding or 'identity'}")
+        response.headers["Cache-Control"] = f"public, max-age={ONE_YEAR}, immutable"
+        response.headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+    def compress_response(self, response):
+        """gzip HTML and JSON responses for clients that accept it"""
+        if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+                or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add("Accept-Encoding")
+        if "gzip" not in accepted_encodings(request.headers.get("Accept-Encoding")):
+            return response
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return response
+        response.set_data(gzip.compress(data, 6))
+        response.headers["Content-Encoding"] = "gzip"
+        return response
+
+
+def page_weight(app, path="/"):
+    """Bytes transferred for a page and its assets, with and without compression"""
+    client = app.test_client()
+    report = {}
+    for label, headers in (("identity", {}), ("gzip", {"Accept-Encoding": "gzip"}), ("br", {"Accept-Encoding": "br, gzip"})):
+        page = client.get(path, headers=headers)
+        html = page.get_data(as_text=False)
+        text = gzip.decompress(html).decode() if page.headers.get("Content-Encoding") == "gzip" else html.decode()
+        total, requests_made, external = len(html), 1, []
+        for marker in ('href="', 'src="'):
+            for chunk in text.split(marker)[1:]:
+                url = chunk.split('"', 1)[0]
+                if url.startswith(("/assets/", "/static/")):
+                    asset = client.get(url, headers=headers)
+                    total += len(asset.get_data())
+                    requests_made += 1
+                elif url.startswith("http"):
+                    external.append(url)
+        report[label] = {"html": len(html), "total": total, "requests": requests_made, "external": external}
+    return report
+
+
+class _BlockingResources(HTMLParser):
+    """Stylesheets and non-deferred scripts: what the browser waits for before the first paint"""
+
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "link" and attrs.get("rel") == "stylesheet" and attrs.get("href"):
+            self.urls.append(attrs["href"])
+        elif tag == "script" and attrs.get("src") and "defer" not in attrs and "async" not in attrs:
+            self.urls.append(attrs["src"])
+
+
+def first_paint(page_url, timeout=20):
+    """Fetch a page and its render-blocking resources the way a cold browser would
+
+    Stylesheets load in parallel in a browser, so the first paint waits for the
+    slowest one; a CDN that is unreachable from the LAN shows up as an error
+    after the time the request hung.
+    """
+    session = requests.Session()
+    started = time.perf_counter()
+    page = session.get(page_url, timeout=timeout)
+    html_ms = (time.perf_counter() - started) * 1000
+    parser = _BlockingResources()
+    parser.feed(page.text)
+
+    resources = []
+    for url in parser.urls:
+        url = urljoin(page_url, url)
+        fetch_started = time.perf_counter()
+        entry = {"url": url}
+        try:
+            response = session.get(url, timeout=timeout)
+            entry.update(status=response.status_code, bytes=len(response.content))
+        except requests.RequestException as e:
+            entry["error"] = type(e).__name__
+        entry["ms"] = round((time.perf_counter() - fetch_started) * 1000, 1)
+        resources.append(entry)
+    slowest = max((entry["ms"] for entry in resources), default=0)
+    return {"html_ms": round(html_ms, 1), "resources": resources,
+            "first_paint_ms": round(html_ms + slowest, 1),
+            "styled": all(entry.get("status") == 200 for entry in resources)}
+
+
+# Build from the command line: python assets.py [fetch|build|check|weight|paint]
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "fetch":
+        fetch_vendor()
+        command = "build"
+    if command == "build":
+        manifest = build()
+        for name, entry in sorted(manifest.items()):
+            variants = ", ".join(f"{encoding} {entry[encoding]}" for encoding in ("gzip", "br") if encoding in entry)
+            print(f"{name} -> {entry['path']} ({entry['size']} bytes{'; ' + variants if variants else ''})")
+        if brotli is None:
+            print("brotli module not installed; only gzip variants were built")
+    elif command == "check":
+        # For build scripts: fail unless the pinned vendor files are in place
+        missing = missing_vendor()
+        if missing:
+            print(f"Missing or corrupt vendor files: {', '.join(missing)} (run `python assets.py fetch`)")
+            sys.exit(1)
+        print("Vendor files present and verified")
+    elif command == "paint":
+        report = first_paint(sys.argv[2] if len(sys.argv) > 2 else "http://127.0.0.1:5050/")
+        for entry in report["resources"]:
+            outcome = entry.get("error") or f"{entry['status']}, {entry['bytes']} bytes"
+            print(f"  {entry['url']}: {outcome} in {entry['ms']} ms")
+        print(f"HTML {report['html_ms']} ms, first paint after {report['first_paint_ms']} ms, "
+              f"{'styled' if report['styled'] else 'UNSTYLED (a blocking resource failed)'}")
+    elif command == "weight":
+        from app import app
+        for label, result in page_weight(app, sys.argv[2] if len(sys.argv) > 2 else "/").items():
+            print(f"{label:>8}: {result['total']} bytes in {result['requests']} requests "
+                  f"(HTML {result['html']}), external: {result['external'] or 'none'}")
+    else:
+        print("Usage: python assets.py [fetch|build|check|weight [PATH]|paint [URL]]")
@@ -0,0 +1,472 @@
+# catalog.py
+"""
+Station Catalog
+Compact storage for large radio-directory dumps (CSV/JSON/NDJSON): columnar
+arrays, interned codec/country/tag tables and a memory-mapped on-disk index
+"""
+import os
+import sys
+import csv
+import json
+import logging
+import mmap
+import time
+import struct
+import threading
+from array import array
+
+from search import StationSearchIndex
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"HEOSCAT1"
+
+# Field names used by common directory dumps (Radio Browser, SHOUTcast, Icecast YP)
+NAME_FIELDS = ("name", "station", "title", "server_name")
+URI_FIELDS = ("url_resolved", "url", "uri", "stream_url", "listen_url")
+CODEC_FIELDS = ("codec", "server_type", "format")
+COUNTRY_FIELDS = ("countrycode", "country_code", "country")
+TAG_FIELDS = ("tags", "genre", "genres")
+BITRATE_FIELDS = ("bitrate", "br")
+
+
+class StationRecord:
+    """One catalog entry, materialized on access"""
+
+    __slots__ = ("index", "name", "uri", "codec", "country", "tags", "bitrate")
+
+    def __init__(self, index, name, uri, codec, country, tags, bitrate):
+        self.index = index
+        self.name = name
+        self.uri = uri
+        self.codec = codec
+        self.country = country
+        self.tags = tags
+        self.bitrate = bitrate
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def _pick(row, fields):
+    for field in fields:
+        value = row.get(field)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _text(value):
+    """A dump field as a stripped string; numbers are accepted, other types give an empty string"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    return value.strip() if isinstance(value, str) else ""
+
+
+def _bitrate(value):
+    """A dump bitrate clamped to what the 16-bit column holds; anything unparsable is 0"""
+    try:
+        return max(0, min(int(value or 0), 65535))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+class _Interner:
+    """Maps repeated strings (codecs, countries, tags) to small integer ids"""
+
+    def __init__(self, values=None):
+        self.values = list(values or [""])
+        self.ids = {value: i for i, value in enumerate(self.values)}
+
+    def intern(self, value):
+        value = sys.intern((value or "").strip())
+        found = self.ids.get(value)
+        if found is None:
+            if len(self.values) >= 65535:
+                return 0
+            found = len(self.values)
+            self.values.append(value)
+            self.ids[value] = found
+        return found
+
+
+class CatalogBuilder:
+    """Accumulates stations straight into compact columns while a dump is read"""
+
+    def __init__(self, dedupe=True):
+        self.offsets = array("I", [0])   # name/uri boundaries: record i spans offsets[2i:2i+3]
+        self.text = bytearray()
+        self.codecs = array("H")
+        self.countries = array("H")
+        self.bitrates = array("H")
+        self.tag_offsets = array("I", [0])
+        self.tag_ids = array("H")
+        self.codec_table = _Interner()
+        self.country_table = _Interner()
+        self.tag_table = _Interner()
+        self._seen = set() if dedupe else None
+        # Rows left out of the catalog, reported after an import
+        self.invalid = 0
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self.codecs)
+
+    def add(self, name, uri, codec=None, country=None, tags=None, bitrate=None):
+        """Add one station; returns False for missing fields or duplicates"""
+        name, uri = _text(name), _text(uri)
+        if not name or not uri:
+            self.invalid += 1
+            return False
+        if self._seen is not None:
+            if uri in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen.add(uri)
+
+        self.text += name.encode("utf-8")
+        self.offsets.append(len(self.text))
+        self.text += uri.encode("utf-8")
+        self.offsets.append(len(self.text))
+
+        self.codecs.append(self.codec_table.intern(_text(codec).upper()))
+        self.countries.append(self.country_table.intern(_text(country).upper()))
+        self.bitrates.append(_bitrate(bitrate))
+
+        if isinstance(tags, str):
+            tags = tags.split(",")
+        elif not isinstance(tags, (list, tuple)):
+            tags = ()
+        for tag in tags:
+            tag = _text(tag).lower()
+            if tag:
+                self.tag_ids.append(self.tag_table.intern(tag))
+        self.tag_offsets.append(len(self.tag_ids))
+        return True
+
+    def add_row(self, row):
+        """Add a dict row from a dump, mapping the usual field names"""
+        if not isinstance(row, dict):
+            self.invalid += 1
+            return False
+        return self.add(_pick(row, NAME_FIELDS), _pick(row, URI_FIELDS), _pick(row, CODEC_FIELDS),
+                        _pick(row, COUNTRY_FIELDS), _pick(row, TAG_FIELDS), _pick(row, BITRATE_FIELDS))
+
+    def build(self):
+        self._seen = None
+        return StationCatalog(len(self), self.offsets, self.text, self.codecs, self.countries, self.bitrates,
+                              self.tag_offsets, self.tag_ids, self.codec_table.values,
+                              self.country_table.values, self.tag_table.values)
+
+
+def iter_dump(path, fmt=None):
+    """Yield dict rows from a CSV, JSON (array) or NDJSON dump"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+    elif fmt in ("ndjson", "jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Counted as an invalid row rather than failing the whole import
+                        log.debug("Unparsable line %d in %s", number, path)
+                        yield None
+    elif fmt == "json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        yield from (data.get("stations", []) if isinstance(data, dict) else data)
+    else:
+        raise ValueError(f"Unsupported dump format: {fmt}")
+
+
+def ingest(path, fmt=None, dedupe=True):
+    """Read a directory dump into an in-memory catalog"""
+    builder = CatalogBuilder(dedupe=dedupe)
+    for row in iter_dump(path, fmt):
+        builder.add_row(row)
+    if builder.invalid or builder.duplicates:
+        log.warning("Skipped %d invalid rows and %d duplicates in %s", builder.invalid, builder.duplicates, path)
+    return builder.build()
+
+
+class StationCatalog:
+    def __init__(self, count, offsets, text, codecs, countries, bitrates, tag_offsets, tag_ids,
+                 codec_table, country_table, tag_table, mapped=None):
+        """Columns may be arrays (freshly built) or memoryviews into a mapped index file"""
+        self.count = count
+        self._offsets = offsets
+        self._text = text
+        self._codecs = codecs
+        self._countries = countries
+        self._bitrates = bitrates
+        self._tag_offsets = tag_offsets
+        self._tag_ids = tag_ids
+        self.codec_table = codec_table
+        self.country_table = country_table
+        self.tag_table = tag_table
+        self._mapped = mapped
+
+    def __len__(self):
+        return self.count
+
+    def name(self, i):
+        return bytes(self._text[self._offsets[2 * i]:self._offsets[2 * i + 1]]).decode("utf-8")
+
+    def uri(self, i):
+        return bytes(self._text[self._offsets[2 * i + 1]:self._offsets[2 * i + 2]]).decode("utf-8")
+
+    def tags(self, i):
+        return [self.tag_table[t] for t in self._tag_ids[self._tag_offsets[i]:self._tag_offsets[i + 1]]]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return StationRecord(i, self.name(i), self.uri(i), self.codec_table[self._codecs[i]],
+                             self.country_table[self._countries[i]], self.tags(i), self._bitrates[i])
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def names(self):
+        """Iterate (index, name) without building full records"""
+        for i in range(self.count):
+            yield i, self.name(i)
+
+    def info(self):
+        return {
+            "stations": self.count,
+            "codecs": len(self.codec_table) - 1,
+            "countries": len(self.country_table) - 1,
+            "tags": len(self.tag_table) - 1,
+            "bytes": len(self._text) + 4 * len(self._offsets) + 2 * (3 * self.count + len(self._tag_ids))
+                     + 4 * len(self._tag_offsets),
+            "mapped": self._mapped is not None,
+        }
+
+    # On-disk index
+
+    def save(self, path):
+        """Write the catalog as a binary index that `open` can memory-map"""
+        sections = [
+            ("offsets", array("I", self._offsets).tobytes()),
+            ("text", bytes(self._text)),
+            ("codecs", array("H", self._codecs).tobytes()),
+            ("countries", array("H", self._countries).tobytes()),
+            ("bitrates", array("H", self._bitrates).tobytes()),
+            ("tag_offsets", array("I", self._tag_offsets).tobytes()),
+            ("tag_ids", array("H", self._tag_ids).tobytes()),
+        ]
+        header = {
+            "count": self.count,
+            "byteorder": sys.byteorder,
+            "codec_table": list(self.codec_table),
+            "country_table": list(self.country_table),
+            "tag_table": list(self.tag_table),
+            "sections": {},
+        }
+        # Section offsets depend on the header length, so lay them out after encoding it once
+        position = 0
+        for name, data in sections:
+            header["sections"][name] = [position, len(data)]
+            position += len(data) + (-len(data) % 8)
+        header_bytes = json.dumps(header).encode("utf-8")
+        base = len(MAGIC) + 4 + len(header_bytes)
+        base += -base % 8
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b"\0" * (base - f.tell()))
+            for name, data in sections:
+                f.write(data)
+                f.write(b"\0" * (-len(data) % 8))
+        os.replace(tmp_path, path)
+        return True
+
+    @classmethod
+    def open(cls, path, use_mmap=True):
+        """Open a saved index; with mmap only the header is parsed up front"""
+        with open(path, "rb") as f:
+            if use_mmap:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = f.read()
+
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a station catalog index")
+        (header_len,) = struct.unpack("<I", buffer[len(MAGIC):len(MAGIC) + 4])
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(buffer[start:start + header_len]))
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {header['byteorder']}-endian machine")
+        base = start + header_len
+        base += -base % 8
+
+        view = memoryview(buffer)
+
+        def section(name, typecode=None):
+            offset, length = header["sections"][name]
+            data = view[base + offset:base + offset + length]
+            return data.cast(typecode) if typecode else data
+
+        return cls(header["count"], section("offsets", "I"), section("text"), section("codecs", "H"),
+                   section("countries", "H"), section("bitrates", "H"), section("tag_offsets", "I"),
+                   section("tag_ids", "H"), header["codec_table"], header["country_table"],
+                   header["tag_table"], mapped=buffer if use_mmap else None)
+
+
+class CatalogStore:
+    """Holds the app's current catalog and handles dump imports"""
+
+    def __init__(self, catalog_file):
+        self.catalog_file = catalog_file
+        self._lock = threading.Lock()
+        self.catalog = None
+        self._search_index = None
+        try:
+            if os.path.exists(catalog_file):
+                self.catalog = StationCatalog.open(catalog_file)
+                log.info("Opened catalog with %d stations from %s", len(self.catalog), catalog_file)
+        except Exception as e:
+            log.error("Error opening catalog: %s", e)
+
+    def import_dump(self, path, fmt=None):
+        """Ingest a dump, replace the on-disk index and reopen it memory-mapped"""
+        catalog = ingest(path, fmt)
+        with self._lock:
+            catalog.save(self.catalog_file)
+            self.catalog = StationCatalog.open(self.catalog_file)
+            self._search_index = None
+        log.info("Imported %d stations into %s", len(catalog), self.catalog_file)
+        return len(catalog)
+
+    def info(self):
+        return self.catalog.info() if self.catalog is not None else {"stations": 0}
+
+    def get(self, index):
+        """The station at `index`, or None without a catalog or outside it (no wrapping from the end)"""
+        catalog = self.catalog
+        if catalog is None or not 0 <= index < len(catalog):
+            return None
+        return catalog[index].to_dict()
+
+    def page(self, start=0, count=50):
+        catalog = self.catalog
+        if catalog is None:
+            return []
+        start = max(0, start)
+        end = min(len(catalog), start + count)
+        return [catalog[i].to_dict() for i in range(start, end)]
+
+    def search(self, query, limit=10):
+        """Typeahead search over catalog names; results carry the catalog index"""
+        with self._lock:
+            # The index and the catalog it was built from are read together: an import
+            # swapping self.catalog afterwards must not pair old indexes with new records
+            catalog = self.catalog
+            if catalog is None:
+                return []
+            if self._search_index is None:
+                # Built on first use so opening a big catalog stays instant
+                index = StationSearchIndex()
+                index.rebuild((i, name, None) for i, name in catalog.names())
+                self._search_index = index
+            index = self._search_index
+        results = index.search(query, limit)
+        for result in results:
+            result["index"] = result.pop("key")
+            result["uri"] = catalog.uri(result["index"])
+        return results
+
+
+def _synthetic_dump(path, count):
+    """Write a Radio-Browser-like NDJSON dump for benchmarking"""
+    import random
+    rng = random.Random(42)
+    codecs = ["MP3", "AAC", "AAC+", "OGG", "FLAC"]
+    countries = ["US", "DE", "GB", "FR", "NL", "BR", "JP", "CA", "AU", "IT"]
+    tags = ["news", "talk", "jazz", "rock", "pop", "classical", "dance", "country", "oldies", "public radio"]
+    words = ["Radio", "FM", "Classic", "Jazz", "Smooth", "City", "Public", "Hits", "Rock", "Wave", "Sound", "Live"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({
+                "name": f"{rng.choice(words)} {rng.choice(words)} {i}",
+                "url_resolved": f"http://stream{i % 997}.example.net:8000/live/{i}.mp3",
+                "codec": rng.choice(codecs),
+                "countrycode": rng.choice(countries),
+                "tags": ",".join(rng.sample(tags, rng.randint(0, 3))),
+                "bitrate": rng.choice([64, 96, 128, 192, 320]),
+            }) + "\n")
+
+
+def benchmark(count=100000):
+    """Compare load time and memory of the dict-list representation with the catalog"""
+    import gc
+    import tempfile
+    import tracemalloc
+
+    def measure(label, load):
+        # Time and memory are taken in separate runs: tracemalloc slows allocation down a lot
+        gc.collect()
+        start = time.perf_counter()
+        load()
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        tracemalloc.start()
+        result = load()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:<34} {elapsed * 1000:>9.1f} ms {current / 1e6:>9.1f} MB")
+        return result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "dump.ndjson")
+        stations_json = os.path.join(tmp, "stations.json")
+        index = os.path.join(tmp, "catalog.idx")
+        _synthetic_dump(dump, count)
+
+        rows = list(iter_dump(dump))
+        with open(stations_json, "w") as f:
+            json.dump(rows, f)
+        del rows
+
+        print(f"{count} stations{'':<19} {'time':>12} {'memory':>12}")
+        measure("dict list (json.load)", lambda: json.load(open(stations_json)))
+        catalog = measure("catalog ingest (NDJSON)", lambda: ingest(dump))
+        catalog.save(index)
+        measure("catalog open (read into memory)", lambda: StationCatalog.open(index, use_mmap=False))
+        mapped = measure("catalog open (mmap)", lambda: StationCatalog.open(index))
+        print(f"index file: {os.path.getsize(index) / 1e6:.1f} MB, "
+              f"stations.json: {os.path.getsize(stations_json) / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        for i in range(0, count, 7):
+            mapped[i]
+        per_lookup = (time.perf_counter() - start) / len(range(0, count, 7))
+        print(f"random record access (mmap): {per_lookup * 1e6:.2f} us")
+
+
+# Command line: python catalog.py ingest DUMP [INDEX] | info INDEX | bench [COUNT]
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "ingest":
+        index_path = sys.argv[3] if len(sys.argv) > 3 else "catalog.idx"
+        start = time.perf_counter()
+        built = ingest(sys.argv[2])
+        built.save(index_path)
+        print(f"Ingested {len(built)} stations into {index_path} in {time.perf_counter() - start:.2f}s")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "info":
+        print(json.dumps(StationCatalog.open(sys.argv[2]).info(), indent=2))
+    elif len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    else:
+        print("Usage: python catalog.py ingest DUMP [INDEX] | info INDEX | bench [COUNT]")
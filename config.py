@@ -4,11 +4,16 @@ Handles loading/saving config and device discovery
 """
 import os
 import json
+import logging
 import requests
 import xml.etree.ElementTree as ET
 from pathlib import Path
 import socket
 
+from tracing import span
+
+log = logging.getLogger(__name__)
+
 # Default configuration if no config file exists
 DEFAULT_CONFIG = {
     "device": {
@@ -22,11 +27,45 @@ DEFAULT_CONFIG = {
         "port": 5050,
         "host": "0.0.0.0",
         "debug": True,
-        "stations_file": "stations.json"
+        "stations_file": "stations.json",
+        "schedules_file": "schedules.json",
+        "queue_file": "queue.json",
+        "switch_times_file": "switch_times.json",
+        "soap_record_file": None,
+        "station_changes_file": "station_changes.json",
+        "sync_peers": [],
+        "sync_interval": 60,
+        "sync_state_file": "sync_state.json",
+        "catalog_file": "catalog.idx",
+        "workers": 4,
+        "state_socket": "heos-state.sock",
+        "media_servers": []
     },
     "ui": {
         "theme": "light",
-        "default_volume": 30
+        "default_volume": 30,
+        "announce_volume": 40,
+        "cdn_fallback": False
+    },
+    "logging": {
+        "level": "INFO",
+        "format": "text",
+        "file": None,
+        "levels": {}
+    },
+    "tracing": {
+        "enabled": True,
+        "sample_rate": 0.05,
+        "slow_ms": 250,
+        "file": "traces.jsonl"
+    },
+    "profiling": {
+        "enabled": False,
+        "token": "",
+        "paths": [],
+        "mode": "cprofile",
+        "dir": "profiles",
+        "keep": 20
     }
 }
 
@@ -39,13 +78,12 @@ def load_config():
         try:
             with open(CONFIG_FILE, 'r') as f:
                 config = json.load(f)
-                print(f"Configuration loaded from {CONFIG_FILE}")
+                log.info("Configuration loaded from %s", CONFIG_FILE)
                 return config
         except Exception as e:
-            print(f"Error loading config: {e}")
-            print("Using default configuration")
+            log.error("Error loading config: %s; using default configuration", e)
     else:
-        print(f"Config file {CONFIG_FILE} not found, creating with defaults")
+        log.info("Config file %s not found, creating with defaults", CONFIG_FILE)
         save_config(DEFAULT_CONFIG)
     
     return DEFAULT_CONFIG
@@ -53,12 +91,12 @@ def load_config():
 def save_config(config):
     """Save configuration to file"""
     try:
-        with open(CONFIG_FILE, 'w') as f:
+        with span("config.save"), open(CONFIG_FILE, 'w') as f:
             json.dump(config, f, indent=2)
-        print(f"Configuration saved to {CONFIG_FILE}")
+        log.debug("Configuration saved to %s", CONFIG_FILE)
         return True
     except Exception as e:
-        print(f"Error saving config: {e}")
+        log.error("Error saving config: %s", e)
         return False
 
 import socket
@@ -82,7 +120,7 @@ def update_config_from_heos(config):
                 config["device"]["version"] = player["version"]
                 return config
     except Exception as e:
-        print(f"[DISCOVERY ERROR] {e}")
+        log.warning("Device discovery failed: %s", e)
         return config
 
 
@@ -95,7 +133,7 @@ def check_device_connection(ip, port, timeout=3):
         s.close()
         return result == 0
     except Exception as e:
-        print(f"Error checking connection: {e}")
+        log.warning("Error checking connection: %s", e)
         return False
 
 def setup_configuration():
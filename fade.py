@@ -0,0 +1,189 @@
+# fade.py
+"""
+Volume Fade Engine
+Smooth volume ramps (wake-up fades, ducking) on top of HeosDevice, with
+steps scheduled on the monotonic clock and timing jitter reporting
+"""
+import math
+import time
+import threading
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class FadeError(RuntimeError):
+    """Raised when a fade can't start because the current volume couldn't be read"""
+
+
+class VolumeFader:
+    def __init__(self, device, step_interval=0.25):
+        """step_interval: seconds between volume steps (the device can't take many more per second)"""
+        self.device = device
+        self.step_interval = step_interval
+
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = None
+        self._active = None
+        self._ducked_from = None
+        self.last_report = None
+
+    def fade(self, target, duration, start=None, step_interval=None, wait=False):
+        """Ramp the volume to `target` over `duration` seconds, replacing any running fade"""
+        target = max(0, min(100, int(target)))
+        if start is None:
+            start = self._current_volume()
+        start = max(0, min(100, int(start)))
+        step_interval = step_interval or self.step_interval
+
+        with self._lock:
+            # Cancelling the old fade and installing the new one is a single step, so two
+            # concurrent calls can't both leave a fade running
+            self._cancel.set()
+            previous = self._thread
+            self._cancel = cancelled = threading.Event()
+            self._active = {"from": start, "to": target, "duration": float(duration),
+                            "started_at": time.time(), "level": start}
+            thread = threading.Thread(target=self._run,
+                                      args=(start, target, float(duration), step_interval, cancelled, previous),
+                                      name="volume-fade", daemon=True)
+            self._thread = thread
+            thread.start()
+            # Copied under the lock: a short fade may finish and clear _active right away
+            active = dict(self._active)
+
+        if wait:
+            thread.join()
+            return self.last_report
+        return active
+
+    def _current_volume(self):
+        level = self.device.get_volume_level()
+        if level is None:
+            raise FadeError("Could not read the current volume from the device")
+        return level
+
+    def duck(self, level, duration=0.5):
+        """Quickly lower the volume, remembering where to restore it to"""
+        current = self._current_volume()
+        if self._ducked_from is None:
+            self._ducked_from = current
+        return self.fade(level, duration, start=current)
+
+    def restore(self, duration=1.0):
+        """Undo a duck"""
+        if self._ducked_from is None:
+            return None
+        target, self._ducked_from = self._ducked_from, None
+        return self.fade(target, duration)
+
+    def cancel(self, wait=False):
+        """Stop the running fade where it is (e.g. the user moved the slider)
+
+        The fade sends no further steps; wait=True also waits out a volume
+        request it already has in flight.
+        """
+        with self._lock:
+            self._cancel.set()
+            thread = self._thread
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+        return True
+
+    def status(self):
+        """Running fade (if any) and the jitter report of the last finished one"""
+        with self._lock:
+            active = dict(self._active) if self._active else None
+        return {"active": active, "last_report": self.last_report}
+
+    def _run(self, start, target, duration, step_interval, cancelled, previous=None):
+        if previous is not None:
+            # The replaced fade may still have a step in flight; let it land first
+            previous.join()
+        steps = max(1, math.ceil(duration / step_interval)) if duration > 0 else 1
+        t0 = time.monotonic()
+        lateness = []
+        send_times = []
+        skipped = 0
+        sent_level = start
+        step = 1
+
+        while step <= steps and not cancelled.is_set():
+            deadline = t0 + min(step * step_interval, duration)
+            delay = deadline - time.monotonic()
+            if delay > 0 and cancelled.wait(delay):
+                break
+
+            now = time.monotonic()
+            # If the device lagged, jump to the latest step that is already due
+            # instead of replaying every missed one
+            due_step = min(steps, max(step, int((now - t0) / step_interval)))
+            if due_step > step:
+                skipped += due_step - step
+                step = due_step
+                deadline = t0 + min(step * step_interval, duration)
+            lateness.append(now - deadline)
+
+            fraction = min(1.0, step / steps)
+            level = round(start + (target - start) * fraction)
+            if level != sent_level:
+                sent = time.monotonic()
+                self.device.set_volume(level)
+                send_times.append(time.monotonic() - sent)
+                sent_level = level
+                with self._lock:
+                    if self._cancel is cancelled and self._active is not None:
+                        self._active["level"] = level
+            step += 1
+
+        report = {
+            "from": start,
+            "to": target,
+            "reached": sent_level,
+            "cancelled": cancelled.is_set(),
+            "duration_s": round(time.monotonic() - t0, 3),
+            "steps": steps,
+            "sent": len(send_times),
+            "skipped": skipped,
+            "jitter_ms": {
+                "mean": round(sum(lateness) / len(lateness) * 1000, 2) if lateness else None,
+                "p50": round(_percentile(lateness, 0.5) * 1000, 2) if lateness else None,
+                "p95": round(_percentile(lateness, 0.95) * 1000, 2) if lateness else None,
+                "max": round(max(lateness) * 1000, 2) if lateness else None,
+            },
+            "send_ms_p95": round(_percentile(send_times, 0.95) * 1000, 2) if send_times else None,
+        }
+        with self._lock:
+            if self._cancel is cancelled:
+                self._active = None
+            self.last_report = report
+
+
+# Example usage when run directly: fade against the fake renderer, with and without load
+if __name__ == "__main__":
+    from heos_api import HeosDevice
+    from fake_renderer import FakeRenderer
+
+    def burn(stop):
+        while not stop.is_set():
+            sum(i * i for i in range(10000))
+
+    for label, latency, jitter, load in [("idle", 0.005, 0.005, 0), ("slow device", 0.05, 0.3, 0), ("cpu load", 0.005, 0.005, 4)]:
+        renderer = FakeRenderer(latency=latency, jitter=jitter).start()
+        fader = VolumeFader(HeosDevice(renderer.ip, renderer.port), step_interval=0.1)
+        stop = threading.Event()
+        burners = [threading.Thread(target=burn, args=(stop,), daemon=True) for _ in range(load)]
+        for thread in burners:
+            thread.start()
+
+        report = fader.fade(35, 3, start=5, wait=True)
+        stop.set()
+        renderer.stop()
+        print(f"{label:>12}: sent {report['sent']}/{report['steps']} steps, skipped {report['skipped']}, "
+              f"jitter p50 {report['jitter_ms']['p50']} ms, p95 {report['jitter_ms']['p95']} ms, "
+              f"max {report['jitter_ms']['max']} ms, reached {report['reached']}")
@@ -0,0 +1,211 @@
+# fake_media_server.py
+"""
+Fake Media Server
+A small in-process UPnP MediaServer (device description plus ContentDirectory
+Browse/Search/GetSystemUpdateID) with one large container, for exercising
+media_server.MediaLibrary without a NAS
+"""
+import re
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from fake_renderer import _arg, _unescape
+
+DIDL_OPEN = ('<DIDL-Lite xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" '
+             'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/">')
+
+
+class FakeMediaServer(ThreadingHTTPServer):
+    """Root container "0" holding "tracks" (`tracks` items) and an empty "playlists" container"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, tracks=1000, latency=0.0, name="Fake Media Server"):
+        super().__init__(("127.0.0.1", port), _FakeMediaServerHandler)
+        self.name = name
+        self.latency = latency
+        self.tracks = tracks
+        self.system_update_id = 1
+        self.container_update_ids = {"0": 1, "tracks": 1, "playlists": 1}
+        self.lock = threading.Lock()
+        self.log = []
+
+    @property
+    def location(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/description.xml"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def bump(self, container_id="tracks"):
+        """Simulate a library change (a rescan adding files)"""
+        with self.lock:
+            self.system_update_id += 1
+            self.container_update_ids[container_id] = self.container_update_ids.get(container_id, 0) + 1
+
+    def actions(self, name=None):
+        return [entry for entry in self.log if name is None or entry[1] == name]
+
+    # Content
+
+    def _track(self, index):
+        number = index + 1
+        return {"id": f"track-{number}", "parent_id": "tracks", "title": f"Track {number:05d}",
+                "artist": f"Artist {number % 97}", "album": f"Album {number // 12}",
+                "uri": f"http://127.0.0.1:{self.server_address[1]}/media/{number}.mp3?format=mp3&id={number}",
+                "duration": f"0:0{number % 6}:{number % 60:02d}.000"}
+
+    def _children(self, object_id):
+        if object_id == "0":
+            return [("container", {"id": "tracks", "parent_id": "0", "title": "All Tracks", "child_count": self.tracks}),
+                    ("container", {"id": "playlists", "parent_id": "0", "title": "Playlists", "child_count": 0})]
+        if object_id == "tracks":
+            return _TrackList(self)
+        return []
+
+    def _lookup(self, object_id):
+        if object_id == "0":
+            return ("container", {"id": "0", "parent_id": "-1", "title": "Root", "child_count": 2})
+        if object_id in ("tracks", "playlists"):
+            return self._children("0")[0 if object_id == "tracks" else 1]
+        match = re.fullmatch(r"track-(\d+)", object_id)
+        if match and 1 <= int(match.group(1)) <= self.tracks:
+            return ("item", self._track(int(match.group(1)) - 1))
+        return None
+
+    def _didl(self, entries):
+        parts = [DIDL_OPEN]
+        for kind, entry in entries:
+            if kind == "container":
+                parts.append(f'<container id="{entry["id"]}" parentID="{entry["parent_id"]}" restricted="1" '
+                             f'childCount="{entry["child_count"]}"><dc:title>{escape(entry["title"])}</dc:title>'
+                             '<upnp:class>object.container.storageFolder</upnp:class></container>')
+            else:
+                parts.append(f'<item id="{entry["id"]}" parentID="{entry["parent_id"]}" restricted="1">'
+                             f'<dc:title>{escape(entry["title"])}</dc:title><dc:creator>{escape(entry["artist"])}</dc:creator>'
+                             f'<upnp:artist>{escape(entry["artist"])}</upnp:artist><upnp:album>{escape(entry["album"])}</upnp:album>'
+                             '<upnp:class>object.item.audioItem.musicTrack</upnp:class>'
+                             f'<res protocolInfo="http-get:*:audio/mpeg:*" duration="{entry["duration"]}">'
+                             f'{escape(entry["uri"])}</res></item>')
+        parts.append("</DIDL-Lite>")
+        return "".join(parts)
+
+    def _result(self, entries, total, update_id):
+        return (f"<Result>{escape(self._didl(entries))}</Result><NumberReturned>{len(entries)}</NumberReturned>"
+                f"<TotalMatches>{total}</TotalMatches><UpdateID>{update_id}</UpdateID>")
+
+    def handle_action(self, action, body):
+        with self.lock:
+            self.log.append((time.monotonic(), action, {"object_id": _arg(body, "ObjectID"),
+                                                        "start": _arg(body, "StartingIndex")}))
+            if action == "GetSystemUpdateID":
+                return f"<Id>{self.system_update_id}</Id>"
+            if action == "Browse":
+                object_id = _unescape(_arg(body, "ObjectID"))
+                start = int(_arg(body, "StartingIndex") or 0)
+                count = int(_arg(body, "RequestedCount") or 0)
+                if _arg(body, "BrowseFlag") == "BrowseMetadata":
+                    entry = self._lookup(object_id)
+                    return None if entry is None else self._result([entry], 1, self.system_update_id)
+                children = self._children(object_id)
+                end = len(children) if count == 0 else min(len(children), start + count)
+                return self._result([children[i] for i in range(start, end)], len(children),
+                                    self.container_update_ids.get(object_id, self.system_update_id))
+            if action == "Search":
+                criteria = _unescape(_arg(body, "SearchCriteria"))
+                match = re.search(r'contains\s+"([^"]*)"', criteria)
+                needle = (match.group(1) if match else "").lower()
+                matches = [("item", self._track(i)) for i in range(self.tracks)
+                           if needle in self._track(i)["title"].lower()]
+                start = int(_arg(body, "StartingIndex") or 0)
+                count = int(_arg(body, "RequestedCount") or 0) or len(matches)
+                return self._result(matches[start:start + count], len(matches), self.system_update_id)
+        return None
+
+
+class _TrackList:
+    """The big container, generated on demand"""
+
+    def __init__(self, server):
+        self.server = server
+
+    def __len__(self):
+        return self.server.tracks
+
+    def __getitem__(self, index):
+        return ("item", self.server._track(index))
+
+
+class _FakeMediaServerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _send(self, status, data):
+        self.send_response(status)
+        self.send_header("Content-Type", 'text/xml; charset="utf-8"')
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/description.xml":
+            self._send(404, b"")
+            return
+        data = ('<?xml version="1.0"?><root xmlns="urn:schemas-upnp-org:device-1-0">'
+                '<specVersion><major>1</major><minor>0</minor></specVersion><device>'
+                '<deviceType>urn:schemas-upnp-org:device:MediaServer:1</deviceType>'
+                f'<friendlyName>{escape(self.server.name)}</friendlyName>'
+                f'<UDN>uuid:fake-media-server-{self.server.server_address[1]}</UDN><serviceList><service>'
+                '<serviceType>urn:schemas-upnp-org:service:ContentDirectory:1</serviceType>'
+                '<serviceId>urn:upnp-org:serviceId:ContentDirectory</serviceId>'
+                '<controlURL>/ContentDirectory/control</controlURL></service></serviceList>'
+                '</device></root>').encode()
+        self._send(200, data)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        action = self.headers.get("SOAPACTION", "").strip('"').split("#")[-1]
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        inner = server.handle_action(action, body)
+        if inner is None:
+            status = 500
+            payload = ('<s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring>'
+                       '<detail><UPnPError xmlns="urn:schemas-upnp-org:control-1-0"><errorCode>701</errorCode>'
+                       '<errorDescription>No such object</errorDescription></UPnPError></detail></s:Fault>')
+        else:
+            status = 200
+            payload = (f'<u:{action}Response xmlns:u="urn:schemas-upnp-org:service:ContentDirectory:1">'
+                       f'{inner}</u:{action}Response>')
+
+        self._send(status, ('<?xml version="1.0" encoding="utf-8"?><s:Envelope '
+                            'xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+                            's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+                            f'<s:Body>{payload}</s:Body></s:Envelope>').encode())
+
+    def log_message(self, *args):
+        pass
+
+
+# Run standalone so the dashboard can browse it: python fake_media_server.py [PORT] [TRACKS]
+if __name__ == "__main__":
+    import sys
+
+    server = FakeMediaServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8200,
+                             tracks=int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
+    print(f"Fake media server: {server.location} ({server.tracks} tracks)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,271 @@
+# fake_renderer.py
+"""
+Fake Renderer
+A small in-process UPnP MediaRenderer (AVTransport, RenderingControl and the
+Denon ACT power service) for exercising HeosDevice without a receiver
+"""
+import re
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+
+def _arg(body, name):
+    match = re.search(rf"<{name}>(.*?)</{name}>", body, re.S)
+    return match.group(1).strip() if match else None
+
+
+def _unescape(text):
+    return (text or "").replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"').replace("&amp;", "&")
+
+
+def _seconds(hms):
+    seconds = 0.0
+    for part in (hms or "0").split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def _hms(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class FakeRenderer(ThreadingHTTPServer):
+    """State machine of a renderer plus a log of every action it received"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, start_delay=0.05, durations=None):
+        """
+        latency/jitter: seconds added to every response (uniform 0..jitter on top)
+        start_delay: time spent in TRANSITIONING after Play
+        durations: uri -> seconds of audio; unknown URIs play forever (like radio)
+        """
+        super().__init__(("127.0.0.1", port), _FakeRendererHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.start_delay = start_delay
+        self.durations = durations or {}
+        self.lock = threading.RLock()
+        self.log = []
+
+        self.uri = ""
+        self.metadata = ""
+        self.next_uri = ""
+        self.next_metadata = ""
+        self.state = "STOPPED"
+        self.volume = 30
+        self.mute = False
+        self.power = "On"
+        self.started_at = None
+        self.seek_to = 0
+        self._timer = None
+
+    @property
+    def ip(self):
+        return "127.0.0.1"
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._timer:
+            self._timer.cancel()
+        self.shutdown()
+        self.server_close()
+
+    def record(self, action, **args):
+        self.log.append((time.monotonic(), action, args))
+
+    def actions(self, name=None):
+        return [entry for entry in self.log if name is None or entry[1] == name]
+
+    def gaps(self):
+        """Seconds of silence between one URI ending and the next one playing"""
+        gaps, ended = [], None
+        for at, action, args in self.log:
+            if action == "ended":
+                ended = at
+            elif action == "state" and args["state"] == "PLAYING" and ended is not None:
+                gaps.append(at - ended)
+                ended = None
+        return gaps
+
+    # Transport simulation
+
+    def _schedule(self, delay, callback):
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, callback)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _set_state(self, state):
+        with self.lock:
+            self.state = state
+            self.record("state", state=state, uri=self.uri)
+
+    def _begin_playing(self):
+        with self.lock:
+            offset, self.seek_to = self.seek_to, 0
+            self.started_at = time.monotonic() - offset
+            self._set_state("PLAYING")
+            duration = self.durations.get(self.uri)
+            if duration is not None:
+                self._schedule(max(0, duration - offset), self._track_ended)
+
+    def _track_ended(self):
+        with self.lock:
+            self.record("ended", uri=self.uri)
+            if self.next_uri:
+                # The staged URI was buffered while this one played: continue without a gap
+                self._advance()
+            else:
+                self._set_state("STOPPED")
+
+    def _advance(self):
+        if self._timer:
+            self._timer.cancel()
+        self.uri, self.metadata = self.next_uri, self.next_metadata
+        self.next_uri = self.next_metadata = ""
+        self._begin_playing()
+
+    def position(self):
+        if self.state in ("PLAYING", "PAUSED_PLAYBACK") and self.started_at:
+            return time.monotonic() - self.started_at
+        return 0
+
+    # SOAP actions
+
+    def handle_action(self, action, body):
+        with self.lock:
+            if action == "SetAVTransportURI":
+                if self.state == "PLAYING":
+                    self.record("ended", uri=self.uri)
+                self.uri = _unescape(_arg(body, "CurrentURI"))
+                self.metadata = _unescape(_arg(body, "CurrentURIMetaData"))
+                self.next_uri = self.next_metadata = ""
+                self.seek_to = 0
+                self.record(action, uri=self.uri)
+                # Like most receivers, a new URI stops playback until Play is sent
+                if self._timer:
+                    self._timer.cancel()
+                self._set_state("STOPPED")
+                return ""
+            if action == "SetNextAVTransportURI":
+                self.next_uri = _unescape(_arg(body, "NextURI"))
+                self.next_metadata = _unescape(_arg(body, "NextURIMetaData"))
+                self.record(action, uri=self.next_uri)
+                return ""
+            if action == "Next":
+                if not self.next_uri:
+                    return None
+                self.record(action)
+                self.record("ended", uri=self.uri)
+                self._advance()
+                return ""
+            if action == "Seek":
+                if not self.uri:
+                    return None
+                offset = _seconds(_arg(body, "Target"))
+                self.record(action, position=offset)
+                if self.state == "PLAYING":
+                    self.started_at = time.monotonic() - offset
+                    duration = self.durations.get(self.uri)
+                    if duration is not None:
+                        self._schedule(max(0, duration - offset), self._track_ended)
+                else:
+                    self.seek_to = offset
+                return ""
+            if action == "Play":
+                self.record(action)
+                self._set_state("TRANSITIONING")
+                self._schedule(self.start_delay, self._begin_playing)
+                return ""
+            if action in ("Stop", "Pause"):
+                self.record(action)
+                if self._timer:
+                    self._timer.cancel()
+                self._set_state("STOPPED" if action == "Stop" else "PAUSED_PLAYBACK")
+                return ""
+            if action == "GetTransportInfo":
+                return (f"<CurrentTransportState>{self.state}</CurrentTransportState>"
+                        f"<CurrentTransportStatus>OK</CurrentTransportStatus><CurrentSpeed>1</CurrentSpeed>")
+            if action == "GetPositionInfo":
+                duration = self.durations.get(self.uri)
+                return (f"<Track>1</Track><TrackDuration>{_hms(duration or 0)}</TrackDuration>"
+                        f"<TrackMetaData>{escape(self.metadata)}</TrackMetaData>"
+                        f"<TrackURI>{escape(self.uri)}</TrackURI><RelTime>{_hms(self.position())}</RelTime>")
+            if action == "GetMediaInfo":
+                return (f"<NrTracks>1</NrTracks><MediaDuration>0:00:00</MediaDuration>"
+                        f"<CurrentURI>{escape(self.uri)}</CurrentURI>"
+                        f"<CurrentURIMetaData>{escape(self.metadata)}</CurrentURIMetaData>"
+                        f"<NextURI>{escape(self.next_uri)}</NextURI>")
+            if action == "GetVolume":
+                return f"<CurrentVolume>{self.volume}</CurrentVolume>"
+            if action == "SetVolume":
+                self.volume = int(_arg(body, "DesiredVolume"))
+                self.record(action, volume=self.volume)
+                return ""
+            if action == "GetMute":
+                return f"<CurrentMute>{int(self.mute)}</CurrentMute>"
+            if action == "PutPowerState":
+                self.power = _arg(body, "Power")
+                self.record(action, power=self.power)
+                return ""
+        return None
+
+
+class _FakeRendererHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        action = self.headers.get("SOAPACTION", "").strip('"').split("#")[-1]
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        inner = server.handle_action(action, body)
+        if inner is None:
+            status = 500
+            payload = ('<s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring>'
+                       '<detail><UPnPError xmlns="urn:schemas-upnp-org:control-1-0"><errorCode>401</errorCode>'
+                       '<errorDescription>Invalid Action</errorDescription></UPnPError></detail></s:Fault>')
+        else:
+            status = 200
+            payload = f'<u:{action}Response xmlns:u="urn:schemas-upnp-org:service:AVTransport:1">{inner}</u:{action}Response>'
+
+        data = ('<?xml version="1.0" encoding="utf-8"?><s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+                f's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>{payload}</s:Body></s:Envelope>').encode()
+        self.send_response(status)
+        self.send_header("Content-Type", 'text/xml; charset="utf-8"')
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+# Run standalone so the dashboard can be pointed at it: python fake_renderer.py [PORT]
+if __name__ == "__main__":
+    import sys
+
+    renderer = FakeRenderer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 60006)
+    print(f"Fake renderer listening on {renderer.ip}:{renderer.port}")
+    try:
+        renderer.serve_forever()
+    except KeyboardInterrupt:
+        pass
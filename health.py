@@ -0,0 +1,128 @@
+# health.py
+"""
+Device Health Tracking
+Circuit breaker and adaptive timeouts so an unreachable device fails fast
+instead of costing a full network timeout on every request
+"""
+import time
+import threading
+
+CLOSED = "closed"        # Device healthy, requests go through
+OPEN = "open"            # Device down, requests fail immediately
+HALF_OPEN = "half_open"  # Background probe in flight, requests still fail fast
+
+
+class DeviceHealth:
+    def __init__(self, probe, failure_threshold=1, probe_interval=2.0, max_probe_interval=30.0,
+                 min_timeout=1.0, max_timeout=5.0, initial_timeout=1.0):
+        """
+        probe: callable(timeout) -> bool, used to detect recovery while the breaker is open
+        failure_threshold: consecutive network failures before the breaker opens
+        initial_timeout: timeout until a round trip has been measured, so the first
+            request to a dead device fails fast instead of waiting max_timeout
+        """
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.initial_timeout = initial_timeout
+
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self.reset()
+
+    def reset(self):
+        """Forget all history, e.g. after the device address changed"""
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self.last_error = None
+            # Smoothed round-trip time and its variance (Jacobson/Karels, as in TCP)
+            self.srtt = None
+            self.rttvar = None
+
+    @property
+    def timeout(self):
+        """Adaptive timeout derived from observed round-trip times"""
+        if self.srtt is None:
+            return self.initial_timeout
+        return min(self.max_timeout, max(self.min_timeout, self.srtt + 4 * self.rttvar))
+
+    @property
+    def available(self):
+        return self.state == CLOSED
+
+    def allow_request(self):
+        """Return True if a request should be sent to the device"""
+        return self.state == CLOSED
+
+    def record_success(self, rtt):
+        """Record a completed round trip and close the breaker"""
+        with self._lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+            self.failures = 0
+            self.state = CLOSED
+            self.opened_at = None
+
+    def record_failure(self, error):
+        """Record a network failure, opening the breaker once the threshold is hit"""
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == CLOSED and self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.time()
+                self._start_probe()
+
+    def _start_probe(self):
+        if self._probe_thread is None or not self._probe_thread.is_alive():
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="device-health-probe", daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        """Probe the device with exponential backoff until it answers again"""
+        interval = self.probe_interval
+        while self.state != CLOSED:
+            time.sleep(interval)
+            with self._lock:
+                # A request may have got through and closed the breaker meanwhile
+                if self.state == CLOSED:
+                    break
+                self.state = HALF_OPEN
+
+            start = time.monotonic()
+            try:
+                ok = self.probe(self.max_timeout)
+            except Exception as e:
+                ok = False
+                with self._lock:
+                    self.last_error = str(e)
+
+            if ok:
+                self.record_success(time.monotonic() - start)
+                break
+
+            with self._lock:
+                if self.state == HALF_OPEN:
+                    self.state = OPEN
+            interval = min(interval * 2, self.max_probe_interval)
+
+    def status(self):
+        """JSON-serializable summary for the UI"""
+        return {
+            "state": self.state,
+            "available": self.available,
+            "failures": self.failures,
+            "opened_at": self.opened_at,
+            "last_error": self.last_error,
+            "timeout": round(self.timeout, 3),
+            "srtt_ms": round(self.srtt * 1000, 1) if self.srtt is not None else None,
+        }
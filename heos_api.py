@@ -3,17 +3,99 @@
 HEOS/Marantz Communication Module
 Handles all device interactions using SOAP/UPnP
 """
+import time
+import logging
 import requests
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from concurrent.futures import ThreadPoolExecutor
+
+from health import DeviceHealth
+from soap_trace import TraceRecorder
+from tracing import span, propagate
+
+log = logging.getLogger(__name__)
+
+# Actions that can legitimately take seconds (the receiver resolves the stream first)
+SLOW_ACTIONS = {"SetAVTransportURI"}
+
+class DeviceUnavailable(requests.RequestException):
+    """Raised instead of sending a request while the circuit breaker is open"""
+
+def find_fields(raw_xml, tag_names):
+    """Pull the text of each tag out of a SOAP response, ignoring namespaces"""
+    with span("parse"):
+        root = ET.fromstring(raw_xml)
+    fields = dict.fromkeys(tag_names)
+    for elem in root.iter():
+        local_name = elem.tag.rsplit("}", 1)[-1]
+        if local_name in fields and fields[local_name] is None:
+            fields[local_name] = elem.text
+    return fields
+
+def action_failed(reply):
+    """Whether a send_upnp_action reply is a connection error or a UPnP fault"""
+    return not isinstance(reply, str) or reply.startswith("<e>") or "UPnPError" in reply
+
+def upnp_error_code(reply):
+    """errorCode of a UPnP fault reply (401 Invalid Action, 602 Not Implemented, ...)
+
+    None for a successful reply and for connection errors, where the device
+    never answered and the same call may well work next time.
+    """
+    if not isinstance(reply, str) or "UPnPError" not in reply:
+        return None
+    try:
+        code = find_fields(reply, ["errorCode"])["errorCode"]
+        return int(code) if code else None
+    except (ET.ParseError, ValueError):
+        return None
+
+def parse_didl(metadata):
+    """Extract title/artist/album/art from a DIDL-Lite metadata string"""
+    info = {"title": None, "artist": None, "album": None, "album_art": None}
+    if not metadata or metadata == "NOT_IMPLEMENTED":
+        return info
+    try:
+        root = ET.fromstring(metadata)
+    except ET.ParseError:
+        return info
+    tags = {"title": "title", "creator": "artist", "artist": "artist", "album": "album", "albumArtURI": "album_art"}
+    for elem in root.iter():
+        key = tags.get(elem.tag.rsplit("}", 1)[-1])
+        if key and info[key] is None and elem.text:
+            info[key] = elem.text.strip()
+    return info
 
 class HeosDevice:
     def __init__(self, ip, port):
-        self.ip = ip
-        self.port = port
-        self.control_url = f"http://{ip}:{port}/upnp/control/renderer_dvc/AVTransport"
         self.headers = {
             "Content-Type": 'text/xml; charset="utf-8"',
         }
+        self.health = DeviceHealth(self._probe)
+        # Runs the reads of get_snapshot() in parallel; its threads start on first use
+        self._executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix="heos-snapshot")
+        # Optional TraceRecorder that every SOAP exchange is written to
+        self.recorder = None
+        # One keep-alive session so consecutive commands reuse the same connection
+        self.session = requests.Session()
+        self.set_address(ip, port)
+
+    def set_address(self, ip, port):
+        """Point this device at a new IP/port, keeping existing references valid"""
+        self.ip = ip
+        self.port = port
+        self.control_url = f"http://{ip}:{port}/upnp/control/renderer_dvc/AVTransport"
+        self.rendering_control_url = f"http://{ip}:{port}/upnp/control/renderer_dvc/RenderingControl"
+        self.health.reset()
+        return True
+
+    def record_to(self, path):
+        """Record every SOAP request/response pair to a trace file (None stops recording)"""
+        if self.recorder is not None:
+            self.recorder.close()
+        self.recorder = TraceRecorder(path, device=f"{self.ip}:{self.port}") if path else None
+        return self.recorder
     
     def build_soap_envelope(self, action, service, body_xml):
         """Build SOAP envelope for UPnP requests"""
@@ -32,25 +114,115 @@ class HeosDevice:
         if control_url is None:
             control_url = self.control_url
             
-        headers = self.headers.copy()
-        headers["SOAPACTION"] = f'"{service}#{action}"'
-        envelope = self.build_soap_envelope(action, service, body_xml)
-        
         try:
-            response = requests.post(control_url, data=envelope, headers=headers, timeout=5)
+            response = self._post(action, service, body_xml, control_url)
             return response.text
+        except DeviceUnavailable as e:
+            return f"<e>Device unavailable: {e}</e>"
         except requests.RequestException as e:
-            print(f"Error sending UPnP action: {e}")
+            log.warning("Error sending UPnP action %s: %s", action, e)
             return f"<e>Connection failed: {e}</e>"
+
+    def _post(self, action, service, body_xml, control_url, timeout=None):
+        """POST a SOAP action through the circuit breaker, feeding round-trip times back to it"""
+        with span(f"soap {action}", action=action):
+            return self._post_traced(action, service, body_xml, control_url, timeout)
+
+    def _post_traced(self, action, service, body_xml, control_url, timeout):
+        if not self.health.allow_request():
+            raise DeviceUnavailable(f"{self.ip}:{self.port} is offline ({self.health.last_error})")
+
+        with span("build"):
+            headers = self.headers.copy()
+            headers["SOAPACTION"] = f'"{service}#{action}"'
+            envelope = self.build_soap_envelope(action, service, body_xml).encode("utf-8")
+
+        if timeout is None:
+            # A dead device shows up as a connect timeout, so only that part adapts;
+            # slow actions, and any action before a round trip has been measured, keep
+            # the full read timeout
+            connect_timeout = self.health.timeout
+            if action in SLOW_ACTIONS or self.health.srtt is None:
+                read_timeout = self.health.max_timeout
+            else:
+                read_timeout = connect_timeout
+            timeout = (connect_timeout, read_timeout)
+
+        start = time.monotonic()
+        try:
+            # Connect (when the keep-alive connection can't be reused), send and
+            # wait for the response headers, then read the body separately
+            with span("request") as attrs:
+                pool = self._connection_pool(control_url) if attrs is not None else None
+                opened = pool.num_connections if pool else 0
+                response = self.session.post(control_url, data=envelope, headers=headers, timeout=timeout, stream=True)
+                if attrs is not None:
+                    attrs["status"] = response.status_code
+                    attrs["new_connection"] = bool(pool and pool.num_connections > opened)
+            with span("read"):
+                response.content
+        except requests.RequestException as e:
+            self.health.record_failure(e)
+            if self.recorder is not None:
+                self.recorder.record(action, service, control_url, body_xml, elapsed=time.monotonic() - start, error=e)
+            raise
+        elapsed = time.monotonic() - start
+        self.health.record_success(elapsed)
+        if self.recorder is not None:
+            self.recorder.record(action, service, control_url, body_xml, status=response.status_code,
+                                 response=response.content, elapsed=elapsed)
+        return response
+
+    def _connection_pool(self, url):
+        try:
+            return self.session.get_adapter(url).poolmanager.connection_from_url(url)
+        except Exception:
+            return None
+
+    def _probe(self, timeout):
+        """Health probe: a plain GetTransportInfo that bypasses the circuit breaker"""
+        service = "urn:schemas-upnp-org:service:AVTransport:1"
+        headers = self.headers.copy()
+        headers["SOAPACTION"] = f'"{service}#GetTransportInfo"'
+        envelope = self.build_soap_envelope("GetTransportInfo", service, "<InstanceID>0</InstanceID>")
+        try:
+            requests.post(self.control_url, data=envelope, headers=headers, timeout=timeout)
+            return True
+        except requests.RequestException:
+            return False
+
+    def get_health(self):
+        """Get the circuit breaker state and adaptive timeout"""
+        return self.health.status()
     
-    def set_uri(self, uri):
-        """Set the URI (stream URL) for playback"""
+    def set_uri(self, uri, metadata=""):
+        """Set the URI (stream URL) for playback, with optional DIDL-Lite metadata"""
+        # Both travel as text inside the SOAP body, so '&' in query strings and the
+        # DIDL markup must be escaped
         xml_body = f"""
         <InstanceID>0</InstanceID>
-        <CurrentURI>{uri}</CurrentURI>
-        <CurrentURIMetaData></CurrentURIMetaData>
+        <CurrentURI>{escape(uri)}</CurrentURI>
+        <CurrentURIMetaData>{escape(metadata or "")}</CurrentURIMetaData>
         """
         return self.send_upnp_action("SetAVTransportURI", xml_body)
+
+    def set_next_uri(self, uri, metadata=""):
+        """Stage the URI to play when the current one ends, so the renderer can buffer it ahead"""
+        xml_body = f"""
+        <InstanceID>0</InstanceID>
+        <NextURI>{escape(uri)}</NextURI>
+        <NextURIMetaData>{escape(metadata or "")}</NextURIMetaData>
+        """
+        return self.send_upnp_action("SetNextAVTransportURI", xml_body)
+
+    def next(self):
+        """Skip to the staged next URI"""
+        return self.send_upnp_action("Next", "<InstanceID>0</InstanceID>")
+
+    def seek(self, rel_time):
+        """Jump to a position (H:MM:SS) in the current track"""
+        return self.send_upnp_action("Seek",
+            f"<InstanceID>0</InstanceID><Unit>REL_TIME</Unit><Target>{escape(rel_time)}</Target>")
     
     def play(self):
         """Start playback"""
@@ -72,11 +244,20 @@ class HeosDevice:
                                     service=power_service, 
                                     control_url=power_control_url)
     
+    def power_on(self):
+        """Power on the device"""
+        power_service = "urn:schemas-denon-com:service:ACT:1"
+        power_control_url = f"http://{self.ip}:{self.port}/ACT/control"
+        return self.send_upnp_action("PutPowerState", "<Power>On</Power>",
+                                    service=power_service,
+                                    control_url=power_control_url)
+    
     def get_status(self):
         """Get the current transport state"""
         raw_xml = self.send_upnp_action("GetTransportInfo", "<InstanceID>0</InstanceID>")
         try:
-            root = ET.fromstring(raw_xml)
+            with span("parse"):
+                root = ET.fromstring(raw_xml)
 
             def find_text(tag_name):
                 for elem in root.iter():
@@ -97,116 +278,138 @@ class HeosDevice:
             }
     
     def get_volume(self):
-        """Get the current volume level"""
-        control_url_vol = f"http://{self.ip}:{self.port}/upnp/control/renderer_dvc/RenderingControl"
-        headers = self.headers.copy()
-        headers["SOAPACTION"] = "\"urn:schemas-upnp-org:service:RenderingControl:1#GetVolume\""
-        envelope = self.build_soap_envelope("GetVolume",
-            "urn:schemas-upnp-org:service:RenderingControl:1",
-            "<InstanceID>0</InstanceID><Channel>Master</Channel>"
-        )
-        
+        """Get the current volume level ("0" when it can't be read)"""
+        level = self.get_volume_level()
+        return "0" if level is None else str(level)
+
+    def get_volume_level(self):
+        """Current volume as an int, or None when the device didn't answer
+
+        Use this where a failed read must not be mistaken for volume 0.
+        """
         try:
-            response = requests.post(control_url_vol, data=envelope, headers=headers, timeout=5)
-            root = ET.fromstring(response.text)
+            response = self._post("GetVolume",
+                "urn:schemas-upnp-org:service:RenderingControl:1",
+                "<InstanceID>0</InstanceID><Channel>Master</Channel>",
+                self.rendering_control_url
+            )
+            with span("parse"):
+                root = ET.fromstring(response.text)
             for elem in root.iter():
                 if elem.tag.endswith("CurrentVolume"):
-                    return elem.text
+                    return int(elem.text)
+        except DeviceUnavailable:
+            pass
         except Exception as e:
-            print(f"Error getting volume: {e}")
-        
-        return "0"
+            log.warning("Error getting volume: %s", e)
+
+        return None
     
     def set_volume(self, level):
         """Set the volume level"""
-        control_url_vol = f"http://{self.ip}:{self.port}/upnp/control/renderer_dvc/RenderingControl"
-        headers = self.headers.copy()
-        headers["SOAPACTION"] = "\"urn:schemas-upnp-org:service:RenderingControl:1#SetVolume\""
-        envelope = self.build_soap_envelope("SetVolume",
-            "urn:schemas-upnp-org:service:RenderingControl:1",
-            f"<InstanceID>0</InstanceID><Channel>Master</Channel><DesiredVolume>{level}</DesiredVolume>"
-        )
-        
         try:
-            requests.post(control_url_vol, data=envelope, headers=headers, timeout=5)
+            self._post("SetVolume",
+                "urn:schemas-upnp-org:service:RenderingControl:1",
+                f"<InstanceID>0</InstanceID><Channel>Master</Channel><DesiredVolume>{level}</DesiredVolume>",
+                self.rendering_control_url
+            )
             return True
+        except DeviceUnavailable:
+            return False
         except Exception as e:
-            print(f"Error setting volume: {e}")
+            log.warning("Error setting volume: %s", e)
             return False
     
+    def get_position_info(self):
+        """Get the current track, its metadata and playback position"""
+        raw_xml = self.send_upnp_action("GetPositionInfo", "<InstanceID>0</InstanceID>")
+        try:
+            return find_fields(raw_xml, ["Track", "TrackDuration", "TrackMetaData", "TrackURI", "RelTime"])
+        except Exception as e:
+            return {"Error": f"Failed to parse SOAP response: {e}"}
+
+    def get_media_info(self):
+        """Get the current media (transport URI) and its metadata"""
+        raw_xml = self.send_upnp_action("GetMediaInfo", "<InstanceID>0</InstanceID>")
+        try:
+            return find_fields(raw_xml, ["NrTracks", "MediaDuration", "CurrentURI", "CurrentURIMetaData", "NextURI"])
+        except Exception as e:
+            return {"Error": f"Failed to parse SOAP response: {e}"}
+
+    def get_mute(self):
+        """Get the mute state ("1" muted, "0" not muted)"""
+        raw_xml = self.send_upnp_action("GetMute",
+            "<InstanceID>0</InstanceID><Channel>Master</Channel>",
+            service="urn:schemas-upnp-org:service:RenderingControl:1",
+            control_url=self.rendering_control_url
+        )
+        try:
+            return find_fields(raw_xml, ["CurrentMute"])["CurrentMute"] or "0"
+        except Exception:
+            return "0"
+
+    def get_snapshot(self):
+        """Fetch transport, position, media, volume and mute state in one concurrent batch"""
+        snapshot = {
+            "online": False,
+            "transport_state": None,
+            "volume": None,
+            "mute": None,
+            "track_uri": None,
+            "current_uri": None,
+            "position": None,
+            "duration": None,
+            "title": None,
+            "artist": None,
+            "album": None,
+            "album_art": None,
+            "updated_at": time.time(),
+        }
+        if not self.health.available:
+            return snapshot
+
+        calls = {
+            "status": self.get_status,
+            "position": self.get_position_info,
+            "media": self.get_media_info,
+            "volume": self.get_volume,
+            "mute": self.get_mute,
+        }
+        futures = {name: self._executor.submit(propagate(call)) for name, call in calls.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+        status, position, media = results["status"], results["position"], results["media"]
+        track = parse_didl(position.get("TrackMetaData"))
+        if not track["title"]:
+            track = parse_didl(media.get("CurrentURIMetaData"))
+
+        snapshot.update(track)
+        snapshot.update({
+            "online": "Error" not in status and self.health.available,
+            "transport_state": status.get("Transport State"),
+            "volume": results["volume"],
+            "mute": results["mute"] == "1",
+            "track_uri": position.get("TrackURI"),
+            "current_uri": media.get("CurrentURI"),
+            "position": position.get("RelTime"),
+            "duration": position.get("TrackDuration"),
+        })
+        return snapshot
+    
     def check_connection(self):
         """Check if device is reachable and responding"""
+        if not self.health.available:
+            return False
         try:
             status = self.get_status()
-            return "Error" not in status
+            # Connection errors come back as an <e> document, so also ask the breaker
+            return "Error" not in status and self.health.available
         except Exception:
             return False
 
-# Example usage when run directly
+# Command-line tool (single command, --batch or --repl; see heos_cli.py)
 if __name__ == "__main__":
     import sys
-    
-    if len(sys.argv) < 3:
-        print("Usage: python heos_api.py IP PORT [COMMAND] [ARG]")
-        print("Commands: status, volume, set_volume, play, pause, stop, power_off, set_uri")
-        sys.exit(1)
-    
-    ip = sys.argv[1]
-    port = int(sys.argv[2])
-    
-    device = HeosDevice(ip, port)
-    
-    # Test connection
-    if not device.check_connection():
-        print(f"Could not connect to device at {ip}:{port}")
-        sys.exit(1)
-    
-    # Process command if provided
-    if len(sys.argv) >= 4:
-        command = sys.argv[3]
-        
-        if command == "status":
-            print("Device Status:")
-            for key, value in device.get_status().items():
-                print(f"  {key}: {value}")
-        
-        elif command == "volume":
-            print(f"Current Volume: {device.get_volume()}")
-        
-        elif command == "set_volume" and len(sys.argv) >= 5:
-            level = sys.argv[4]
-            if device.set_volume(level):
-                print(f"Volume set to {level}")
-            else:
-                print("Failed to set volume")
-        
-        elif command == "play":
-            device.play()
-            print("Started playback")
-        
-        elif command == "pause":
-            device.pause()
-            print("Paused playback")
-        
-        elif command == "stop":
-            device.stop()
-            print("Stopped playback")
-        
-        elif command == "power_off":
-            device.power_off()
-            print("Powered off device")
-        
-        elif command == "set_uri" and len(sys.argv) >= 5:
-            uri = sys.argv[4]
-            device.set_uri(uri)
-            print(f"Set URI to: {uri}")
-        
-        else:
-            print(f"Unknown command: {command}")
-    else:
-        # Just print status if no command
-        print(f"Connected to device at {ip}:{port}")
-        print("Current Status:")
-        for key, value in device.get_status().items():
-            print(f"  {key}: {value}")
-        print(f"Volume: {device.get_volume()}")
\ No newline at end of file
+    from heos_cli import main
+
+    sys.exit(main(sys.argv[1:]))
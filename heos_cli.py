@@ -0,0 +1,230 @@
+# heos_cli.py
+"""
+HEOS Command-Line Tool
+Runs single commands, batch scripts or an interactive REPL over one
+persistent device session
+"""
+import sys
+import json
+import time
+import shlex
+import argparse
+
+from heos_api import HeosDevice, action_failed
+
+USAGE = """Usage: python heos_api.py IP PORT [COMMAND] [ARG]
+       python heos_api.py IP PORT --batch FILE|- [--timing] [--json] [--stop-on-error]
+       python heos_api.py IP PORT --repl [--timing] [--json]
+       add --record TRACE to any of these to record the SOAP traffic"""
+
+
+def _cmd_status(device, args):
+    status = device.get_status()
+    # A connection error or fault parses too, just without a transport state
+    return "Error" not in status and status.get("Transport State") not in (None, "N/A"), status
+
+def _cmd_volume(device, args):
+    level = device.get_volume_level()
+    return level is not None, level
+
+def _cmd_set_volume(device, args):
+    return device.set_volume(args[0]), args[0]
+
+def _cmd_play(device, args):
+    return not action_failed(device.play()), None
+
+def _cmd_pause(device, args):
+    return not action_failed(device.pause()), None
+
+def _cmd_stop(device, args):
+    return not action_failed(device.stop()), None
+
+def _cmd_power_off(device, args):
+    return not action_failed(device.power_off()), None
+
+def _cmd_set_uri(device, args):
+    return not action_failed(device.set_uri(args[0])), args[0]
+
+def _cmd_health(device, args):
+    return True, device.get_health()
+
+def _cmd_sleep(device, args):
+    time.sleep(float(args[0]))
+    return True, float(args[0])
+
+
+# name: (handler, number of arguments, text printed on success)
+COMMANDS = {
+    "status": (_cmd_status, 0, "Device Status:"),
+    "volume": (_cmd_volume, 0, "Current Volume: {result}"),
+    "set_volume": (_cmd_set_volume, 1, "Volume set to {result}"),
+    "play": (_cmd_play, 0, "Started playback"),
+    "pause": (_cmd_pause, 0, "Paused playback"),
+    "stop": (_cmd_stop, 0, "Stopped playback"),
+    "power_off": (_cmd_power_off, 0, "Powered off device"),
+    "set_uri": (_cmd_set_uri, 1, "Set URI to: {result}"),
+    "health": (_cmd_health, 0, "Device Health:"),
+    "sleep": (_cmd_sleep, 1, "Slept {result}s"),
+}
+
+
+def run_command(device, command, args):
+    """Run one command and return a result record"""
+    start = time.perf_counter()
+    record = {"command": command, "args": args}
+
+    entry = COMMANDS.get(command)
+    if entry is None:
+        record.update(ok=False, error=f"Unknown command: {command}")
+    elif len(args) < entry[1]:
+        record.update(ok=False, error=f"{command} needs {entry[1]} argument(s)")
+    else:
+        try:
+            ok, result = entry[0](device, args)
+            record.update(ok=bool(ok), result=result)
+            if not ok:
+                record["error"] = f"{command} failed"
+        except Exception as e:
+            record.update(ok=False, error=str(e))
+
+    record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return record
+
+
+def print_record(record, as_json=False, timing=False):
+    """Print a result record as text or as one JSON line"""
+    if as_json:
+        if not timing:
+            record = {k: v for k, v in record.items() if k != "elapsed_ms"}
+        print(json.dumps(record), flush=True)
+        return
+
+    if not record["ok"]:
+        text = record["error"]
+    else:
+        text = COMMANDS[record["command"]][2].format(result=record.get("result"))
+        if isinstance(record.get("result"), dict):
+            text += "".join(f"\n  {key}: {value}" for key, value in record["result"].items())
+    if timing:
+        text += f"  [{record['elapsed_ms']} ms]"
+    print(text, flush=True)
+
+
+def parse_line(line):
+    """Split a script line into (command, args); None for blanks and comments"""
+    parts = shlex.split(line, comments=True)
+    if not parts:
+        return None
+    return parts[0], parts[1:]
+
+
+def run_batch(device, stream, as_json=False, timing=False, stop_on_error=False):
+    """Run every command in `stream`, returning the number of failures"""
+    failures = 0
+    total_start = time.perf_counter()
+    for number, line in enumerate(stream, 1):
+        try:
+            parsed = parse_line(line)
+        except ValueError as e:
+            # An unbalanced quote fails that line like any other bad command
+            record = {"command": line.strip(), "args": [], "ok": False,
+                      "error": f"Parse error on line {number}: {e}", "elapsed_ms": 0.0}
+        else:
+            if parsed is None:
+                continue
+            record = run_command(device, *parsed)
+        print_record(record, as_json, timing)
+        if not record["ok"]:
+            failures += 1
+            if stop_on_error:
+                break
+    if timing and not as_json:
+        print(f"Total: {(time.perf_counter() - total_start) * 1000:.1f} ms", flush=True)
+    return failures
+
+
+def run_repl(device, as_json=False, timing=False):
+    """Interactive prompt over the same device session"""
+    try:
+        import readline  # noqa: F401 -- line editing and history when available
+    except ImportError:
+        pass
+
+    print(f"Connected to {device.ip}:{device.port}. Type 'help' for commands, 'quit' to exit.")
+    while True:
+        try:
+            line = input("heos> ")
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return 0
+
+        try:
+            parsed = parse_line(line)
+        except ValueError as e:
+            print(f"Parse error: {e}")
+            continue
+        if parsed is None:
+            continue
+        if parsed[0] in ("quit", "exit"):
+            return 0
+        if parsed[0] == "help":
+            print("Commands: " + ", ".join(COMMANDS))
+            continue
+        print_record(run_command(device, *parsed), as_json, timing)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="heos_api.py", usage=USAGE)
+    parser.add_argument("ip")
+    parser.add_argument("port", type=int)
+    parser.add_argument("command", nargs="?")
+    parser.add_argument("arg", nargs="?")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--batch", metavar="FILE", help="run commands from FILE ('-' for stdin)")
+    mode.add_argument("--repl", action="store_true", help="interactive prompt")
+    parser.add_argument("--timing", action="store_true", help="print per-command timing")
+    parser.add_argument("--json", action="store_true", help="print one JSON record per command")
+    parser.add_argument("--stop-on-error", action="store_true", help="stop a batch at the first failure")
+    parser.add_argument("--record", metavar="TRACE", help="record the SOAP traffic to TRACE (see soap_trace.py)")
+
+    if len(argv) < 2:
+        print(USAGE)
+        print("Commands: " + ", ".join(COMMANDS))
+        return 1
+    args = parser.parse_args(argv)
+
+    device = HeosDevice(args.ip, args.port)
+    if args.record:
+        device.record_to(args.record)
+
+    # Batch and REPL skip the upfront connection check: the first real command
+    # tells us just as quickly, and the circuit breaker fails the rest fast
+    if args.batch:
+        if args.batch == "-":
+            failures = run_batch(device, sys.stdin, args.json, args.timing, args.stop_on_error)
+        else:
+            with open(args.batch) as f:
+                failures = run_batch(device, f, args.json, args.timing, args.stop_on_error)
+        return 1 if failures else 0
+
+    if args.repl:
+        return run_repl(device, args.json, args.timing)
+
+    # Test connection
+    if not device.check_connection():
+        print(f"Could not connect to device at {args.ip}:{args.port}")
+        return 1
+
+    if args.command:
+        command_args = [args.arg] if args.arg is not None else []
+        record = run_command(device, args.command, command_args)
+        print_record(record, args.json, args.timing)
+        return 0 if record["ok"] else 1
+
+    # Just print status if no command
+    print(f"Connected to device at {args.ip}:{args.port}")
+    print("Current Status:")
+    for key, value in device.get_status().items():
+        print(f"  {key}: {value}")
+    print(f"Volume: {device.get_volume()}")
+    return 0
@@ -0,0 +1,357 @@
+# icy.py
+"""
+ICY Metadata Service
+Reads "now playing" titles from internet radio streams (Icy-MetaData), with
+one shared reader per station that skips the audio and stops when idle
+"""
+import re
+import ssl
+import time
+import socket
+import logging
+import itertools
+import threading
+import socketserver
+from urllib.parse import urlsplit, urljoin
+
+log = logging.getLogger(__name__)
+
+PLAYLIST_EXTENSIONS = (".m3u", ".m3u8", ".pls")
+PLAYLIST_TYPES = ("audio/x-mpegurl", "audio/mpegurl", "audio/x-scpls", "application/pls+xml")
+
+_STREAM_TITLE = re.compile(rb"StreamTitle='(.*?)';", re.S)
+
+
+class IcyError(Exception):
+    """Raised when a stream can't be opened or carries no ICY metadata"""
+
+
+def open_stream(uri, timeout=10, max_redirects=5):
+    """Open `uri` asking for ICY metadata; returns (socket, reader, headers)
+
+    Uses a raw socket because SHOUTcast servers answer with an "ICY 200 OK"
+    status line that http.client refuses to parse.
+    """
+    for _ in range(max_redirects + 1):
+        parts = urlsplit(uri)
+        secure = parts.scheme == "https"
+        port = parts.port or (443 if secure else 80)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+        sock = socket.create_connection((parts.hostname, port), timeout=timeout)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+        # HTTP/1.0 so the server never switches to chunked encoding
+        request = (f"GET {path} HTTP/1.0\r\nHost: {parts.hostname}\r\n"
+                   f"Icy-MetaData: 1\r\nUser-Agent: HEOS-Dashboard\r\nConnection: close\r\n\r\n")
+        sock.sendall(request.encode())
+        reader = sock.makefile("rb")
+
+        status = reader.readline(1024).decode("latin-1").split()
+        if len(status) < 2:
+            sock.close()
+            raise IcyError(f"No response from {uri}")
+        headers = {}
+        while True:
+            line = reader.readline(8192).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        code = int(status[1])
+        if code in (301, 302, 303, 307, 308) and "location" in headers:
+            reader.close()
+            sock.close()
+            uri = urljoin(uri, headers["location"])
+            continue
+        if code != 200:
+            reader.close()
+            sock.close()
+            raise IcyError(f"{uri} answered {code}")
+
+        content_type = headers.get("content-type", "").split(";")[0].lower()
+        if uri.lower().split("?")[0].endswith(PLAYLIST_EXTENSIONS) or content_type in PLAYLIST_TYPES:
+            playlist = reader.read(65536).decode("utf-8", "replace")
+            reader.close()
+            sock.close()
+            uri = first_playlist_entry(playlist, uri)
+            continue
+
+        return sock, reader, headers
+
+    raise IcyError(f"Too many redirects for {uri}")
+
+
+def first_playlist_entry(playlist, base_uri):
+    """First stream URL in an M3U or PLS playlist"""
+    for line in playlist.splitlines():
+        line = line.strip()
+        if line.lower().startswith("file") and "=" in line:
+            line = line.split("=", 1)[1].strip()
+        if line.startswith(("http://", "https://")):
+            return urljoin(base_uri, line)
+    raise IcyError(f"No stream URL in playlist {base_uri}")
+
+
+def parse_metadata(block):
+    """Extract StreamTitle from a metadata block"""
+    match = _STREAM_TITLE.search(block)
+    if not match:
+        return None
+    raw = match.group(1)
+    try:
+        return raw.decode("utf-8").strip()
+    except UnicodeDecodeError:
+        return raw.decode("latin-1").strip()
+
+
+class IcyReader(threading.Thread):
+    """Background reader for one station"""
+
+    def __init__(self, service, uri):
+        super().__init__(name=f"icy-reader-{uri}", daemon=True)
+        self.service = service
+        self.uri = uri
+        self.stop_event = threading.Event()
+        # Reused for every audio chunk: audio is read and dropped, never accumulated
+        self._scratch = bytearray(16384)
+
+    def run(self):
+        backoff = 1
+        while not self.stop_event.is_set() and not self.service._release_if_idle(self):
+            try:
+                self._read_stream()
+                backoff = 1
+            except Exception as e:
+                self.service._update(self.uri, error=str(e))
+                if self.stop_event.wait(backoff):
+                    break
+                backoff = min(backoff * 2, 60)
+        self.service._reader_exited(self)
+
+    def _skip(self, reader, count):
+        view = memoryview(self._scratch)
+        while count > 0:
+            read = reader.readinto(view[:min(count, len(view))])
+            if not read:
+                raise IcyError("Stream ended")
+            count -= read
+
+    def _read_stream(self):
+        sock, reader, headers = open_stream(self.uri)
+        try:
+            metaint = int(headers.get("icy-metaint", 0))
+            self.service._update(self.uri, station=headers.get("icy-name"), error=None)
+            if metaint <= 0:
+                raise IcyError("Stream has no ICY metadata")
+
+            while not self.stop_event.is_set() and not self.service._release_if_idle(self):
+                self._skip(reader, metaint)
+                length_byte = reader.read(1)
+                if not length_byte:
+                    raise IcyError("Stream ended")
+                length = length_byte[0] * 16
+                if length:
+                    block = reader.read(length)
+                    title = parse_metadata(block)
+                    if title is not None:
+                        self.service._update(self.uri, title=title)
+        finally:
+            reader.close()
+            sock.close()
+
+
+class IcyMetadataService:
+    def __init__(self, idle_timeout=60, max_readers=8):
+        """
+        idle_timeout: seconds a reader keeps running without subscribers or lookups
+        max_readers: streams read at once; the longest-idle unsubscribed reader makes room for a new one
+        """
+        self.idle_timeout = idle_timeout
+        self.max_readers = max_readers
+        self._lock = threading.Lock()
+        self._readers = {}
+        self._cache = {}
+        self._subscribers = {}
+        self._last_lookup = {}
+        self._tokens = itertools.count(1)
+
+    def get_metadata(self, uri):
+        """Cached metadata for `uri`, starting a shared reader if none is running"""
+        with self._lock:
+            if not self._ensure_reader(uri):
+                return {"uri": uri, "title": None, "station": None,
+                        "error": "Too many streams are being read", "updated_at": None}
+            self._last_lookup[uri] = time.monotonic()
+            return dict(self._cache.get(uri) or {"uri": uri, "title": None, "station": None,
+                                                 "error": None, "updated_at": None})
+
+    def subscribe(self, uri, callback):
+        """Call callback(metadata) on every title change; returns a token for unsubscribe"""
+        with self._lock:
+            if not self._ensure_reader(uri):
+                raise IcyError(f"Too many streams are being read to follow {uri}")
+            token = next(self._tokens)
+            self._subscribers.setdefault(uri, {})[token] = callback
+            return token
+
+    def unsubscribe(self, token):
+        with self._lock:
+            for uri, callbacks in list(self._subscribers.items()):
+                if callbacks.pop(token, None) is not None:
+                    if not callbacks:
+                        del self._subscribers[uri]
+                    return True
+        return False
+
+    def active_readers(self):
+        with self._lock:
+            return sorted(self._readers)
+
+    def _ensure_reader(self, uri):
+        """Start a reader for `uri` unless one runs; False when the reader limit is reached"""
+        if uri in self._readers:
+            return True
+        if len(self._readers) >= self.max_readers:
+            idle = [other for other in self._readers if not self._subscribers.get(other)]
+            if not idle:
+                return False
+            self._retire(min(idle, key=lambda other: self._last_lookup.get(other, 0)))
+        reader = IcyReader(self, uri)
+        self._readers[uri] = reader
+        reader.start()
+        return True
+
+    def _retire(self, uri):
+        """Deregister the reader for `uri` and forget what it read (caller holds the lock)"""
+        reader = self._readers.pop(uri, None)
+        if reader is not None:
+            reader.stop_event.set()
+        self._cache.pop(uri, None)
+        self._last_lookup.pop(uri, None)
+
+    def _release_if_idle(self, reader):
+        """True once `reader` should exit; an idle reader is deregistered in the same step
+
+        Deciding and deregistering under one lock means a lookup arriving while
+        the reader winds down either keeps it running or finds it gone and starts
+        a new one, never a reader that is about to exit.
+        """
+        with self._lock:
+            if self._readers.get(reader.uri) is not reader:
+                return True
+            if self._subscribers.get(reader.uri):
+                return False
+            if time.monotonic() - self._last_lookup.get(reader.uri, 0) <= self.idle_timeout:
+                return False
+            self._retire(reader.uri)
+            return True
+
+    def _reader_exited(self, reader):
+        with self._lock:
+            if self._readers.get(reader.uri) is reader:
+                self._retire(reader.uri)
+
+    def _update(self, uri, **fields):
+        with self._lock:
+            if uri not in self._readers:
+                return  # a retired reader winding down; its entry is gone with it
+            entry = self._cache.setdefault(uri, {"uri": uri, "title": None, "station": None,
+                                                 "error": None, "updated_at": None})
+            changed = "title" in fields and fields["title"] != entry["title"]
+            entry.update(fields)
+            entry["updated_at"] = time.time()
+            callbacks = list(self._subscribers.get(uri, {}).values()) if changed else []
+            snapshot = dict(entry)
+
+        for callback in callbacks:
+            try:
+                callback(snapshot)
+            except Exception:
+                log.exception("Error in ICY subscriber")
+
+
+class _IcyStandInHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request_headers = {}
+        self.rfile.readline()
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            request_headers[name.strip().lower()] = value.strip()
+
+        server = self.server
+        wants_metadata = request_headers.get("icy-metadata") == "1"
+        headers = ["ICY 200 OK", "icy-name: Stand-in Radio", "content-type: audio/mpeg"]
+        if wants_metadata:
+            headers.append(f"icy-metaint: {server.metaint}")
+        self.wfile.write(("\r\n".join(headers) + "\r\n\r\n").encode())
+
+        audio = bytes(server.metaint)
+        delay = server.metaint / server.bytes_per_second
+        try:
+            while not server.stopping:
+                self.wfile.write(audio)
+                if wants_metadata:
+                    title = server.titles[int(time.monotonic() / server.title_seconds) % len(server.titles)]
+                    text = f"StreamTitle='{title}';".encode()
+                    blocks = -(-len(text) // 16)
+                    self.wfile.write(bytes([blocks]) + text.ljust(blocks * 16, b"\0"))
+                self.wfile.flush()
+                time.sleep(delay)
+        except OSError:
+            pass
+
+
+class IcyStandInServer(socketserver.ThreadingTCPServer):
+    """Local SHOUTcast-style server that rotates through `titles`, for testing without the internet"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, titles, port=0, metaint=8192, bytes_per_second=16000, title_seconds=2):
+        super().__init__(("127.0.0.1", port), _IcyStandInHandler)
+        self.titles = titles
+        self.metaint = metaint
+        self.bytes_per_second = bytes_per_second
+        self.title_seconds = title_seconds
+        self.stopping = False
+
+    @property
+    def uri(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/stream"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopping = True
+        self.shutdown()
+        self.server_close()
+
+
+# Example usage when run directly: python icy.py [STREAM_URI]
+if __name__ == "__main__":
+    import sys
+
+    stand_in = None
+    if len(sys.argv) > 1:
+        uri = sys.argv[1]
+    else:
+        stand_in = IcyStandInServer(["Artist A - First Song", "Artist B - Second Song"], title_seconds=1).start()
+        uri = stand_in.uri
+        print(f"Using local stand-in stream at {uri}")
+
+    service = IcyMetadataService(idle_timeout=2)
+    token = service.subscribe(uri, lambda meta: print(f"  now playing: {meta['title']}"))
+    time.sleep(4)
+    print(f"Cached: {service.get_metadata(uri)}")
+    service.unsubscribe(token)
+    time.sleep(3 + 1)
+    print(f"Readers after idle timeout: {service.active_readers()}")
+    if stand_in:
+        stand_in.stop()
@@ -0,0 +1,92 @@
+# loadtest.py
+"""
+Load Test
+Starts serve.py with increasing worker counts and measures requests per second
+Usage: python loadtest.py [--workers 1,2,4] [--clients 16] [--duration 5] [--path /manage_stations]
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import http.client
+import multiprocessing
+
+
+def client_loop(port, path, duration, counter):
+    """Issue requests over one keep-alive connection until the time is up"""
+    deadline = time.monotonic() + duration
+    done = 0
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    while time.monotonic() < deadline:
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                done += 1
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.close()
+    with counter.get_lock():
+        counter.value += done
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def measure(workers, clients, duration, path, port):
+    """Run one load round against a fresh server and return requests per second"""
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--socket", f"loadtest-{port}.sock"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(port):
+            raise RuntimeError("Server did not start")
+        # Warm up every worker before measuring
+        client_loop(port, path, 0.5, multiprocessing.Value("i", 0))
+
+        counter = multiprocessing.Value("i", 0)
+        procs = [multiprocessing.Process(target=client_loop, args=(port, path, duration, counter))
+                 for _ in range(clients)]
+        start = time.monotonic()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        return counter.value / (time.monotonic() - start)
+    finally:
+        server.terminate()
+        server.wait(10)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure dashboard throughput per worker count")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--path", default="/manage_stations")
+    parser.add_argument("--port", type=int, default=5099)
+    args = parser.parse_args()
+
+    # Workers are processes, so throughput can only grow while there are idle cores for them
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"{cpus} CPUs available: req/s can scale up to {cpus}x (the load clients share them too)")
+    print(f"{'workers':>8} {'req/s':>10} {'scaling':>8}")
+    baseline = None
+    for count in [int(w) for w in args.workers.split(",")]:
+        rps = measure(count, args.clients, args.duration, args.path, args.port)
+        baseline = baseline or rps
+        note = "  (more workers than CPUs)" if count > cpus else ""
+        print(f"{count:>8} {rps:>10.1f} {rps / baseline:>7.2f}x{note}")
@@ -0,0 +1,279 @@
+# logs.py
+"""
+Logging Setup
+Text or structured (JSON) logging through a queue so request threads never wait
+on stdout/journald, with request ids, per-module levels and rate-limited errors
+"""
+import sys
+import copy
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import logging.handlers
+
+DEFAULT_LOGGING = {
+    "level": "INFO",
+    "format": "text",        # "text" or "json" (one object per line, for log shippers)
+    "file": None,            # log to stderr when unset
+    # Per-module overrides, e.g. {"heos_api": "DEBUG"}; werkzeug's own request
+    # lines are replaced by the "access" logger, which carries request ids
+    "levels": {"werkzeug": "WARNING"},
+    "queue_size": 10000,     # records beyond this are dropped rather than blocking
+    "rate_limit": {"burst": 5, "interval": 60},
+}
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the id of the request being handled (if any)"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per logger and message template for WARNING and above
+
+    A flapping device logs the same error from every request; after `burst`
+    copies only one per `interval` seconds gets through, carrying a count of
+    the ones that were dropped.
+    """
+
+    def __init__(self, burst=5, interval=60):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.burst / self.interval)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for name, value in vars(record).items():
+            if name not in _RECORD_FIELDS and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        text = super().format(record)
+        if getattr(record, "suppressed", None):
+            text += f" ({record.suppressed} similar messages suppressed)"
+        return text
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the message and traceback here (the arguments may change once
+        # the caller returns) but leave JSON formatting to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The stop marker must not be dropped like a record: with the queue full,
+        # wait for the writer to make room instead of raising queue.Full
+        self.queue.put(self._sentinel)
+
+
+def setup_logging(settings=None, stream=None):
+    """Route all logging through a background queue listener; safe to call again to reconfigure"""
+    global _listener, _queue_handler
+    options = dict(DEFAULT_LOGGING)
+    options.update(settings or {})
+    options["levels"] = {**DEFAULT_LOGGING["levels"], **options["levels"]}
+
+    if options["file"]:
+        output = logging.handlers.WatchedFileHandler(options["file"])
+    else:
+        output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if options["format"] == "json" else TextFormatter())
+
+    handler = _DroppingQueueHandler(queue.Queue(maxsize=options["queue_size"]))
+    handler.output_format = options["format"]
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(RateLimitFilter(**options["rate_limit"]))
+    listener = _QueueListener(handler.queue, output)
+
+    with _lock:
+        root = logging.getLogger()
+        if _queue_handler is not None:
+            # Reconfiguring keeps counting from where the old handler stopped
+            handler.dropped = _queue_handler.dropped
+            root.removeHandler(_queue_handler)
+            _listener.stop()
+        root.addHandler(handler)
+        root.setLevel(options["level"].upper())
+        for name, level in options["levels"].items():
+            logging.getLogger(name).setLevel(level.upper())
+        # werkzeug installs its own stderr handler unless it finds one configured
+        logging.getLogger("werkzeug").propagate = True
+        listener.start()
+        _listener, _queue_handler = listener, handler
+    return handler
+
+
+def stats():
+    """Output format, queue depth and records dropped because the queue was full"""
+    with _lock:
+        handler = _queue_handler
+        if handler is None:
+            return {"format": None, "queued": 0, "queue_size": 0, "dropped": 0}
+        return {"format": handler.output_format, "queued": handler.queue.qsize(), "queue_size": handler.queue.maxsize,
+                "dropped": handler.dropped}
+
+
+def shutdown_logging():
+    """Flush queued records (runs at exit)"""
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            logging.getLogger().removeHandler(_queue_handler)
+            _listener.stop()
+            _listener = _queue_handler = None
+
+
+atexit.register(shutdown_logging)
+
+
+def init_app(app):
+    """Give every Flask request an id (X-Request-ID if the client sent one) and log its timing"""
+    from flask import request, g
+
+    access_log = logging.getLogger("access")
+
+    @app.before_request
+    def assign_request_id():
+        g.request_started = time.perf_counter()
+        g.request_id_token = request_id_var.set(request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16])
+
+    @app.after_request
+    def log_request(response):
+        request_id = request_id_var.get()
+        if request_id:
+            response.headers["X-Request-ID"] = request_id
+        if "request_started" in g:
+            access_log.info("%s %s %s", request.method, request.path, response.status_code,
+                            extra={"method": request.method, "path": request.path, "status": response.status_code,
+                                   "duration_ms": round((time.perf_counter() - g.request_started) * 1000, 2)})
+        return response
+
+    @app.teardown_request
+    def clear_request_id(exc):
+        token = g.pop("request_id_token", None)
+        if token is not None:
+            request_id_var.reset(token)
+
+
+# Example usage when run directly: request-thread cost of logging to a slow sink
+if __name__ == "__main__":
+    class SlowStream:
+        """Stands in for a stdout pipe to a backed-up journald"""
+        def __init__(self, delay):
+            self.delay = delay
+            self.lines = 0
+
+        def write(self, text):
+            time.sleep(self.delay)
+            self.lines += text.count("\n")
+
+        def flush(self):
+            pass
+
+    count = 200
+    sink = SlowStream(0.002)
+    direct = logging.StreamHandler(sink)
+    direct_logger = logging.getLogger("demo.direct")
+    direct_logger.addHandler(direct)
+    direct_logger.propagate = False
+    started = time.perf_counter()
+    for i in range(count):
+        direct_logger.warning("Saved %d stations", i)
+    blocking = (time.perf_counter() - started) / count
+
+    sink = SlowStream(0.002)
+    handler = setup_logging({"format": "json"}, stream=sink)
+    log = logging.getLogger("demo.queued")
+    request_id_var.set("demo-request")
+    started = time.perf_counter()
+    for i in range(count):
+        log.info("Saved %d stations", i, extra={"stations": i})
+    queued = (time.perf_counter() - started) / count
+
+    flapping = logging.getLogger("demo.flapping")
+    for attempt in range(100):
+        flapping.warning("Error sending UPnP action: %s", "connection refused")
+    shutdown_logging()
+
+    print(f"Per call on the request thread with a 2 ms sink: print-style {blocking * 1e6:.0f} us, "
+          f"queued {queued * 1e6:.0f} us")
+    print(f"Written {sink.lines} lines for {count} records + 100 flapping errors (rate limit), "
+          f"dropped {handler.dropped}")
@@ -0,0 +1,457 @@
+# media_server.py
+"""
+Media Server Browsing
+Finds UPnP MediaServers on the LAN (SSDP) and browses their ContentDirectory
+lazily in pages, with an LRU page cache invalidated by update ids and
+background prefetch of the next page
+"""
+import time
+import socket
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape
+
+import requests
+
+from heos_api import find_fields
+from tracing import span, propagate
+
+log = logging.getLogger(__name__)
+
+SSDP_ADDRESS = ("239.255.255.250", 1900)
+MEDIA_SERVER_TYPE = "urn:schemas-upnp-org:device:MediaServer:1"
+CONTENT_DIRECTORY = "urn:schemas-upnp-org:service:ContentDirectory:1"
+
+NS = {
+    "didl": "urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "upnp": "urn:schemas-upnp-org:metadata-1-0/upnp/",
+    "device": "urn:schemas-upnp-org:device-1-0",
+}
+
+
+class MediaServerError(Exception):
+    """Raised when a media server can't be reached or answers with a fault"""
+
+
+def ssdp_search(search_target=MEDIA_SERVER_TYPE, timeout=2.0):
+    """LOCATION URLs of devices answering an SSDP M-SEARCH"""
+    message = ("M-SEARCH * HTTP/1.1\r\n"
+               f"HOST: {SSDP_ADDRESS[0]}:{SSDP_ADDRESS[1]}\r\n"
+               'MAN: "ssdp:discover"\r\n'
+               f"MX: {max(1, int(timeout))}\r\n"
+               f"ST: {search_target}\r\n\r\n").encode()
+    locations = []
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        sock.sendto(message, SSDP_ADDRESS)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, _ = sock.recvfrom(8192)
+            except socket.timeout:
+                break
+            for line in data.decode("latin-1").split("\r\n"):
+                name, _, value = line.partition(":")
+                if name.strip().lower() == "location" and value.strip() not in locations:
+                    locations.append(value.strip())
+    except OSError as e:
+        log.warning("SSDP search failed: %s", e)
+    finally:
+        sock.close()
+    return locations
+
+
+def parse_didl_objects(didl):
+    """Containers and items of a DIDL-Lite Browse/Search result"""
+    containers, items = [], []
+    if not didl:
+        return containers, items
+    root = ET.fromstring(didl)
+
+    def text(elem, path):
+        found = elem.find(path, NS)
+        return found.text.strip() if found is not None and found.text else None
+
+    for elem in root:
+        tag = elem.tag.rsplit("}", 1)[-1]
+        common = {
+            "id": elem.get("id"),
+            "parent_id": elem.get("parentID"),
+            "title": text(elem, "dc:title"),
+            "class": text(elem, "upnp:class"),
+        }
+        if tag == "container":
+            child_count = elem.get("childCount")
+            common["child_count"] = int(child_count) if child_count and child_count.isdigit() else None
+            containers.append(common)
+        elif tag == "item":
+            res = elem.find("didl:res", NS)
+            common.update({
+                "artist": text(elem, "upnp:artist") or text(elem, "dc:creator"),
+                "album": text(elem, "upnp:album"),
+                "album_art": text(elem, "upnp:albumArtURI"),
+                "uri": res.text.strip() if res is not None and res.text else None,
+                "protocol_info": res.get("protocolInfo") if res is not None else None,
+                "duration": res.get("duration") if res is not None else None,
+            })
+            items.append(common)
+    return containers, items
+
+
+def build_didl(item):
+    """DIDL-Lite metadata for one item, for SetAVTransportURI's CurrentURIMetaData"""
+    fields = [f"<dc:title>{escape(item.get('title') or '')}</dc:title>",
+              f"<upnp:class>{escape(item.get('class') or 'object.item.audioItem.musicTrack')}</upnp:class>"]
+    if item.get("artist"):
+        fields.append(f"<upnp:artist>{escape(item['artist'])}</upnp:artist>")
+        fields.append(f"<dc:creator>{escape(item['artist'])}</dc:creator>")
+    if item.get("album"):
+        fields.append(f"<upnp:album>{escape(item['album'])}</upnp:album>")
+    if item.get("album_art"):
+        fields.append(f"<upnp:albumArtURI>{escape(item['album_art'])}</upnp:albumArtURI>")
+    attributes = f' protocolInfo="{escape(item.get("protocol_info") or "http-get:*:*:*", {chr(34): "&quot;"})}"'
+    if item.get("duration"):
+        attributes += f' duration="{escape(item["duration"])}"'
+    fields.append(f"<res{attributes}>{escape(item.get('uri') or '')}</res>")
+    return ('<DIDL-Lite xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/">'
+            f'<item id="{escape(item.get("id") or "", {chr(34): "&quot;"})}" '
+            f'parentID="{escape(item.get("parent_id") or "", {chr(34): "&quot;"})}" restricted="1">'
+            + "".join(fields) + "</item></DIDL-Lite>")
+
+
+class MediaServer:
+    """SOAP client for one server's ContentDirectory service"""
+
+    def __init__(self, control_url, name=None, udn=None, location=None, timeout=5):
+        self.control_url = control_url
+        self.name = name or control_url
+        self.udn = udn
+        self.location = location
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    @property
+    def id(self):
+        return self.udn or self.control_url
+
+    @classmethod
+    def from_location(cls, location, timeout=5):
+        """Read a device description and find its ContentDirectory control URL"""
+        response = requests.get(location, timeout=timeout)
+        response.raise_for_status()
+        root = ET.fromstring(response.content)
+        base = root.findtext("device:URLBase", default=None, namespaces=NS) or location
+        device = root.find("device:device", NS)
+        if device is None:
+            raise MediaServerError(f"No device in description at {location}")
+        for service in device.iter(f"{{{NS['device']}}}service"):
+            if "ContentDirectory" in (service.findtext("device:serviceType", "", NS) or ""):
+                control_url = urljoin(base, service.findtext("device:controlURL", "", NS))
+                return cls(control_url, name=device.findtext("device:friendlyName", None, NS),
+                           udn=device.findtext("device:UDN", None, NS), location=location, timeout=timeout)
+        raise MediaServerError(f"{location} has no ContentDirectory service")
+
+    def describe(self):
+        return {"id": self.id, "name": self.name, "location": self.location}
+
+    def _call(self, action, body, fields):
+        envelope = ('<?xml version="1.0" encoding="utf-8"?>'
+                    '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+                    's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>'
+                    f'<u:{action} xmlns:u="{CONTENT_DIRECTORY}">{body}</u:{action}>'
+                    '</s:Body></s:Envelope>')
+        headers = {"Content-Type": 'text/xml; charset="utf-8"', "SOAPACTION": f'"{CONTENT_DIRECTORY}#{action}"'}
+        with span(f"content_directory {action}"):
+            try:
+                response = self.session.post(self.control_url, data=envelope.encode("utf-8"),
+                                             headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                raise MediaServerError(f"{self.name}: {e}") from e
+        if response.status_code != 200:
+            fault = find_fields(response.content, ["errorCode", "errorDescription"]) if response.content else {}
+            raise MediaServerError(f"{self.name}: {action} failed ({fault.get('errorCode') or response.status_code} "
+                                   f"{fault.get('errorDescription') or ''})".strip())
+        return find_fields(response.content, fields)
+
+    def _page(self, fields, object_id, start, count):
+        with span("parse_didl"):
+            containers, items = parse_didl_objects(fields["Result"])
+        return {
+            "object_id": object_id,
+            "start": start,
+            "count": count,
+            "returned": int(fields["NumberReturned"] or 0),
+            "total": int(fields["TotalMatches"] or 0),
+            "update_id": fields["UpdateID"],
+            "containers": containers,
+            "items": items,
+        }
+
+    def browse(self, object_id="0", start=0, count=100, metadata=False, sort=""):
+        """One page of a container's children (or the object itself with metadata=True)"""
+        flag = "BrowseMetadata" if metadata else "BrowseDirectChildren"
+        body = (f"<ObjectID>{escape(object_id)}</ObjectID><BrowseFlag>{flag}</BrowseFlag><Filter>*</Filter>"
+                f"<StartingIndex>{int(start)}</StartingIndex><RequestedCount>{int(count)}</RequestedCount>"
+                f"<SortCriteria>{escape(sort)}</SortCriteria>")
+        fields = self._call("Browse", body, ["Result", "NumberReturned", "TotalMatches", "UpdateID"])
+        return self._page(fields, object_id, start, count)
+
+    def search(self, container_id, criteria, start=0, count=100, sort=""):
+        body = (f"<ContainerID>{escape(container_id)}</ContainerID><SearchCriteria>{escape(criteria)}</SearchCriteria>"
+                f"<Filter>*</Filter><StartingIndex>{int(start)}</StartingIndex>"
+                f"<RequestedCount>{int(count)}</RequestedCount><SortCriteria>{escape(sort)}</SortCriteria>")
+        fields = self._call("Search", body, ["Result", "NumberReturned", "TotalMatches", "UpdateID"])
+        return self._page(fields, container_id, start, count)
+
+    def system_update_id(self):
+        return self._call("GetSystemUpdateID", "", ["Id"])["Id"]
+
+
+class MediaLibrary:
+    """All known media servers plus a shared LRU of browse pages
+
+    A cached page is dropped when the server's SystemUpdateID changes (checked
+    at most every `check_interval` seconds) or when a fresh page of the same
+    container comes back with a different container UpdateID.
+    """
+
+    def __init__(self, locations=(), page_size=100, cache_pages=512, check_interval=10.0,
+                 discover_timeout=2.0, prefetch=True):
+        self.locations = list(locations)
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self.check_interval = check_interval
+        self.discover_timeout = discover_timeout
+        self.prefetch = prefetch
+
+        self._lock = threading.Lock()
+        self._servers = {}
+        self._pages = OrderedDict()       # key -> page
+        self._inflight = {}               # key -> Future, so a click waits for a running prefetch
+        self._system_ids = {}             # server id -> (SystemUpdateID, checked at)
+        self._container_ids = {}          # (server id, object id) -> container UpdateID
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="media-browse")
+        self.stats = {"hits": 0, "misses": 0, "prefetched": 0, "waited": 0, "invalidated": 0}
+
+    # Servers
+
+    def start(self):
+        """Discover servers in the background so startup isn't delayed"""
+        threading.Thread(target=self.discover, name="media-discovery", daemon=True).start()
+
+    def discover(self, timeout=None):
+        """Find servers via SSDP plus the configured description URLs"""
+        locations = list(self.locations)
+        for location in ssdp_search(timeout=self.discover_timeout if timeout is None else timeout):
+            if location not in locations:
+                locations.append(location)
+        found = {}
+        for location in locations:
+            try:
+                server = MediaServer.from_location(location)
+                found[server.id] = server
+            except Exception as e:
+                log.info("Skipping %s: %s", location, e)
+        with self._lock:
+            self._servers.update(found)
+        log.info("Found %d media servers", len(found))
+        return self.servers()
+
+    def add_server(self, server):
+        with self._lock:
+            self._servers[server.id] = server
+        return server.describe()
+
+    def servers(self):
+        with self._lock:
+            return [server.describe() for server in self._servers.values()]
+
+    def _server(self, server_id):
+        with self._lock:
+            server = self._servers.get(server_id)
+        if server is None:
+            raise MediaServerError(f"Unknown media server {server_id}")
+        return server
+
+    # Cache
+
+    def _drop(self, predicate):
+        dropped = [key for key in self._pages if predicate(key)]
+        for key in dropped:
+            del self._pages[key]
+        self.stats["invalidated"] += len(dropped)
+
+    def _check_system_update(self, server):
+        with self._lock:
+            known, checked_at = self._system_ids.get(server.id, (None, 0))
+        if time.monotonic() - checked_at < self.check_interval:
+            return
+        try:
+            current = server.system_update_id()
+        except MediaServerError:
+            # Keep serving cached pages while the server is briefly unreachable
+            return
+        with self._lock:
+            self._system_ids[server.id] = (current, time.monotonic())
+            if known is not None and current != known:
+                self._drop(lambda key: key[0] == server.id)
+
+    def _submit(self, key, fetch):
+        """Start fetching a missing page unless a fetch of it is already running
+
+        Returns (future, started); the page is cached before the future resolves.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+
+            def run():
+                try:
+                    page = fetch()
+                    self._store(key, page)
+                    return page
+                finally:
+                    with self._lock:
+                        self._inflight.pop(key, None)
+
+            future = self._executor.submit(propagate(run))
+            self._inflight[key] = future
+            return future, True
+
+    def _fetch(self, key, fetch):
+        future, started = self._submit(key, fetch)
+        if not started:
+            # Usually the prefetch of this very page; wait for it instead of asking again
+            with self._lock:
+                self.stats["waited"] += 1
+        return future.result()
+
+    def _store(self, key, page):
+        server_id, _, object_id = key[:3]
+        with self._lock:
+            container_key = (server_id, object_id)
+            previous = self._container_ids.get(container_key)
+            if page["update_id"] is not None:
+                if previous is not None and previous != page["update_id"]:
+                    self._drop(lambda other: other[:3] == key[:3])
+                self._container_ids[container_key] = page["update_id"]
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.cache_pages:
+                self._pages.popitem(last=False)
+
+    def _cached(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+            return page
+
+    def _prefetch(self, key, fetch):
+        with self._lock:
+            if key in self._pages or key in self._inflight:
+                return
+        future, started = self._submit(key, fetch)
+        if started:
+            with self._lock:
+                self.stats["prefetched"] += 1
+            future.add_done_callback(lambda f: f.exception() and log.debug("Prefetch of %s failed: %s", key, f.exception()))
+
+    # Browsing
+
+    def browse(self, server_id, object_id="0", start=0, count=None):
+        """One page of a container, from cache when still valid; prefetches the next page"""
+        server = self._server(server_id)
+        count = min(int(count or self.page_size), 1000)
+        start = max(0, int(start))
+        self._check_system_update(server)
+
+        key = (server.id, "browse", object_id, start, count)
+        page = self._cached(key)
+        if page is None:
+            page = self._fetch(key, lambda: server.browse(object_id, start, count))
+
+        following = start + count
+        if self.prefetch and following < page["total"]:
+            self._prefetch((server.id, "browse", object_id, following, count),
+                           lambda: server.browse(object_id, following, count))
+        return dict(page, server_id=server.id, server_name=server.name)
+
+    def search(self, server_id, criteria, container_id="0", start=0, count=None):
+        server = self._server(server_id)
+        count = min(int(count or self.page_size), 1000)
+        self._check_system_update(server)
+        key = (server.id, "search", container_id, int(start), count, criteria)
+        page = self._cached(key)
+        if page is None:
+            page = self._fetch(key, lambda: server.search(container_id, criteria, start, count))
+        return dict(page, server_id=server.id, server_name=server.name)
+
+    def get_item(self, server_id, object_id):
+        """Metadata of one item (for playing it)"""
+        server = self._server(server_id)
+        key = (server.id, "metadata", object_id, 0, 1)
+        page = self._cached(key)
+        if page is None:
+            page = self._fetch(key, lambda: server.browse(object_id, 0, 1, metadata=True))
+        if not page["items"]:
+            raise MediaServerError(f"{object_id} is not a playable item")
+        return page["items"][0]
+
+    def cache_info(self):
+        with self._lock:
+            return dict(self.stats, pages=len(self._pages), capacity=self.cache_pages)
+
+
+# Example usage when run directly: page through a big container with and without prefetch
+if __name__ == "__main__":
+    import sys
+    from fake_media_server import FakeMediaServer
+
+    if len(sys.argv) > 1:
+        library = MediaLibrary(locations=sys.argv[1:])
+        for server in library.discover():
+            print(f"{server['name']} ({server['location']})")
+            print(library.browse(server["id"], "0", 0, 20))
+        sys.exit(0)
+
+    fake = FakeMediaServer(tracks=20000, latency=0.03).start()
+    print(f"Fake media server with 20000 tracks at {fake.location} (30 ms per request)")
+    for label, prefetch in (("no prefetch", False), ("prefetch", True)):
+        library = MediaLibrary(locations=[fake.location], prefetch=prefetch, discover_timeout=0.1)
+        server_id = library.discover(timeout=0.1)[0]["id"]
+        timings = []
+        for page in range(20):
+            started = time.perf_counter()
+            library.browse(server_id, "tracks", page * 100, 100)
+            timings.append(time.perf_counter() - started)
+            time.sleep(0.1)        # the user reading the page
+        repeat = time.perf_counter()
+        library.browse(server_id, "tracks", 0, 100)
+        repeat = time.perf_counter() - repeat
+        timings.sort()
+        print(f"{label:>12}: page p50 {timings[10] * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms, "
+              f"revisit {repeat * 1000:.2f} ms, {library.cache_info()}")
+
+    fake.bump("tracks")
+    library.check_interval = 0
+    started = time.perf_counter()
+    page = library.browse(server_id, "tracks", 0, 100)
+    print(f"After a library change: {(time.perf_counter() - started) * 1000:.1f} ms (refetched), "
+          f"update id {page['update_id']}, {library.cache_info()}")
+    fake.stop()
@@ -0,0 +1,103 @@
+# now_playing.py
+"""
+Now Playing State
+Keeps a snapshot of what the device is playing, polling fast while music is
+playing or changing and backing off exponentially while idle
+"""
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# States in which position/track change quickly enough to poll at full speed
+ACTIVE_STATES = {"PLAYING", "TRANSITIONING"}
+
+
+class NowPlayingPoller:
+    def __init__(self, device, fast_interval=1.0, idle_interval=2.0, max_interval=30.0,
+                 transition_polls=5, viewer_timeout=120):
+        """
+        fast_interval: seconds between polls while playing or right after a change
+        idle_interval/max_interval: backoff range while stopped, paused or offline
+        transition_polls: fast polls after any state/track change or user action
+        viewer_timeout: back off fully when nobody asked for the state for this long
+        """
+        self.device = device
+        self.fast_interval = fast_interval
+        self.idle_interval = idle_interval
+        self.max_interval = max_interval
+        self.transition_polls = transition_polls
+        self.viewer_timeout = viewer_timeout
+
+        self.snapshot = None
+        self.interval = fast_interval
+        self.polls = 0
+        self._boost = transition_polls
+        self._last_viewed = time.monotonic()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+    def get_state(self):
+        """Latest snapshot plus the current poll interval (a hint for UI refresh)"""
+        self._last_viewed = time.monotonic()
+        if self.snapshot is None:
+            # First viewer before the first poll finished: fetch synchronously
+            self.snapshot = self.device.get_snapshot()
+        return dict(self.snapshot, poll_interval=self.interval)
+
+    def poke(self):
+        """Poll right away and stay fast for a while (call after user actions)"""
+        self._boost = self.transition_polls
+        self.interval = self.fast_interval
+        self._wake.set()
+        return True
+
+    def next_interval(self, previous, current):
+        """Pick the delay before the next poll from the last two snapshots"""
+        changed = previous is None or any(
+            previous.get(key) != current.get(key)
+            for key in ("transport_state", "track_uri", "current_uri", "title", "online"))
+        if changed:
+            self._boost = self.transition_polls
+
+        if self._boost > 0:
+            self._boost -= 1
+            return self.fast_interval
+        if current.get("transport_state") in ACTIVE_STATES and current.get("online"):
+            if time.monotonic() - self._last_viewed < self.viewer_timeout:
+                return self.fast_interval
+            return self.max_interval
+        # Idle, stopped or offline: exponential backoff
+        return min(max(self.interval * 2, self.idle_interval), self.max_interval)
+
+    def poll_once(self):
+        """Fetch one snapshot and update the poll interval"""
+        previous = self.snapshot
+        current = self.device.get_snapshot()
+        self.snapshot = current
+        self.polls += 1
+        self.interval = self.next_interval(previous, current)
+        return current
+
+    def start(self):
+        """Start the polling thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="now-playing-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def _run(self):
+        while self._running:
+            try:
+                self.poll_once()
+            except Exception as e:
+                log.warning("Error polling device state: %s", e)
+                self.interval = self.max_interval
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,302 @@
+# play_queue.py
+"""
+Play Queue
+A server-side queue of tracks/stations that stages the following item on the
+renderer with SetNextAVTransportURI, so it can buffer ahead and switch without
+a gap; falls back to SetAVTransportURI + Play on renderers without it
+"""
+import os
+import json
+import uuid
+import logging
+import threading
+
+from heos_api import action_failed, upnp_error_code
+
+log = logging.getLogger(__name__)
+
+# Faults meaning the renderer has no SetNextAVTransportURI at all (Invalid Action,
+# Optional Action Not Implemented); anything else is about the item or the moment
+UNSUPPORTED_FAULTS = (401, 602)
+
+
+class PlayQueue:
+    def __init__(self, device, queue_file="queue.json", poll_interval=0.5, gapless=True):
+        """
+        device: HeosDevice the queue plays on
+        poll_interval: seconds between transport checks while the queue is playing
+        gapless: pre-stage the next item (turned off automatically when the renderer refuses it)
+        """
+        self.device = device
+        self.queue_file = queue_file
+        self.poll_interval = poll_interval
+        self.gapless = gapless
+
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+        self.items = []
+        self.position = None        # index of the item playing, None when the queue is idle
+        self.staged = None          # id of the item handed to SetNextAVTransportURI
+        self._refused = None        # id of an item the renderer faulted on; not staged again
+        self._seen_playing = False
+        # Bumped whenever the position moves, so a poll that raced play()/skip() drops its result
+        self._generation = 0
+
+        self.load()
+
+    # Persistence
+
+    def load(self):
+        try:
+            if self.queue_file and os.path.exists(self.queue_file):
+                with open(self.queue_file, 'r') as f:
+                    data = json.load(f)
+                self.items = data.get("items", [])
+                log.info("Loaded %d queued items from %s", len(self.items), self.queue_file)
+        except Exception as e:
+            log.error("Error loading play queue: %s", e)
+        return len(self.items)
+
+    def save(self):
+        if not self.queue_file:
+            return True
+        try:
+            with self._lock:
+                data = {"items": list(self.items)}
+            tmp_file = self.queue_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.queue_file)
+            return True
+        except Exception as e:
+            log.error("Error saving play queue: %s", e)
+            return False
+
+    # Public API
+
+    def list(self):
+        """Queue contents and playback position"""
+        with self._lock:
+            return {"items": list(self.items), "position": self.position,
+                    "staged": self.staged, "gapless": self.gapless}
+
+    def enqueue(self, uri, name=None, metadata=""):
+        """Append an item; if it directly follows the playing one, stage it right away"""
+        item = {"id": uuid.uuid4().hex[:12], "uri": uri, "name": name or uri, "metadata": metadata or ""}
+        with self._lock:
+            self.items.append(item)
+            restage = self.position is not None and self.position == len(self.items) - 2
+        self.save()
+        if restage:
+            self._stage_next()
+        return item
+
+    def remove(self, item_id):
+        with self._lock:
+            index = next((i for i, item in enumerate(self.items) if item["id"] == item_id), None)
+            if index is None or index == self.position:
+                return False
+            del self.items[index]
+            if self.position is not None and index < self.position:
+                self.position -= 1
+            restage = self.position is not None and index == self.position + 1
+            unstage = self.staged == item_id
+            if unstage:
+                self.staged = None
+        self.save()
+        if restage:
+            self._stage_next()
+        with self._lock:
+            # Nothing replaced the removed item on the renderer (it was the last one)
+            unstage = unstage and self.staged is None
+        if unstage:
+            self._unstage()
+        return True
+
+    def clear(self):
+        """Empty the queue; whatever is playing keeps playing"""
+        with self._lock:
+            staged = self.staged
+            self.items = []
+            self.position = None
+            self.staged = None
+            self._generation += 1
+        self.save()
+        if staged is not None:
+            self._unstage()
+        return True
+
+    def play(self, index=0):
+        """Start the queue at `index` (SetAVTransportURI + Play), then stage the following item"""
+        return self._play(int(index))
+
+    def _play(self, index, generation=None):
+        """play(), or nothing when `generation` is given and the queue has moved since"""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return None
+            if not 0 <= index < len(self.items):
+                raise IndexError(f"No queue item {index}")
+            item = self.items[index]
+            self.position = index
+            self.staged = None
+            self._seen_playing = False
+            self._generation += 1
+        self.device.set_uri(item["uri"], item["metadata"])
+        self.device.play()
+        self._stage_next()
+        self.start()
+        self._wake.set()
+        return item
+
+    def skip(self):
+        """Move to the next item, through the staged URI when there is one"""
+        with self._lock:
+            if self.position is None or self.position + 1 >= len(self.items):
+                return None
+            staged = self.staged == self.items[self.position + 1]["id"]
+            following, generation = self.position + 1, self._generation
+        if staged and not action_failed(self.device.next()):
+            self._advanced(generation)
+            return self.list()
+        return self._play(following, generation)
+
+    # Transport tracking
+
+    def _stage_next(self):
+        """Hand the item after the current one to the renderer"""
+        if not self.gapless:
+            return
+        with self._lock:
+            if self.position is None or self.position + 1 >= len(self.items):
+                return
+            item = self.items[self.position + 1]
+            if item["id"] in (self.staged, self._refused):
+                return
+        reply = self.device.set_next_uri(item["uri"], item["metadata"])
+        if action_failed(reply):
+            code = upnp_error_code(reply)
+            if code in UNSUPPORTED_FAULTS:
+                log.warning("Renderer doesn't support SetNextAVTransportURI (%s); play queue falls back "
+                            "to set-then-play", code)
+                self.gapless = False
+            elif code is not None:
+                # This item can't be staged; it is played with set-then-play when its turn comes
+                log.warning("Renderer refused to stage %s (UPnP error %s)", item["uri"], code)
+                with self._lock:
+                    self._refused = item["id"]
+            # A connection error leaves it unstaged; the next poll tries again
+            return
+        with self._lock:
+            self.staged = item["id"]
+
+    def _unstage(self):
+        """Clear the renderer's NextURI so a removed item doesn't play after the current one"""
+        if action_failed(self.device.set_next_uri("")):
+            log.warning("Could not clear the staged next URI on the renderer")
+
+    def _advanced(self, generation):
+        """The renderer moved on to the staged item (unless the queue moved since `generation`)"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self.position += 1
+            self.staged = None
+            self._seen_playing = True
+            self._generation += 1
+        self._stage_next()
+
+    def poll_once(self):
+        """Compare the renderer's transport with the queue and advance it"""
+        with self._lock:
+            if self.position is None:
+                return
+            generation = self._generation
+            current = self.items[self.position]
+            following = self.items[self.position + 1] if self.position + 1 < len(self.items) else None
+            staged = self.staged
+
+        state = self.device.get_status().get("Transport State")
+        track_uri = self.device.get_position_info().get("TrackURI")
+
+        # The renderer was asked without the lock: a play() or skip() in the meantime
+        # makes this reading stale, so it is only acted on if the queue hasn't moved
+        if following is not None and staged == following["id"] and track_uri == following["uri"]:
+            self._advanced(generation)
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            if state == "PLAYING" and track_uri and track_uri != current["uri"]:
+                # Something else was played over the queue (a preset, a schedule)
+                log.info("Play queue stopped: renderer is playing %s", track_uri)
+                self.position = self.staged = None
+                self._generation += 1
+                return
+            if state == "PLAYING":
+                self._seen_playing = True
+                # Staging hit a connection error earlier; try again while this item plays
+                unstaged = following is not None and staged is None
+            else:
+                if state != "STOPPED" or not self._seen_playing:
+                    return
+                # The item ended and the renderer didn't continue on its own
+                if following is None:
+                    self.position = self.staged = None
+                    self._generation += 1
+                    return
+                next_index = self.position + 1
+        if state == "PLAYING":
+            if unstaged:
+                self._stage_next()
+            return
+        self._play(next_index, generation)
+
+    def start(self):
+        """Start the transport tracking thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="play-queue", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def _run(self):
+        while self._running:
+            try:
+                self.poll_once()
+            except Exception as e:
+                log.warning("Error tracking play queue: %s", e)
+            # Idle queues sleep until play() wakes them
+            self._wake.wait(self.poll_interval if self.position is not None else None)
+            self._wake.clear()
+
+
+# Example usage when run directly: gap between queued tracks, gapless vs set-then-play
+if __name__ == "__main__":
+    import time
+    from heos_api import HeosDevice
+    from fake_renderer import FakeRenderer
+
+    tracks = 6
+    for label, gapless in (("set-then-play", False), ("SetNextAVTransportURI", True)):
+        # 400 ms of buffering before audio starts, 20 ms per SOAP round trip
+        renderer = FakeRenderer(latency=0.02, start_delay=0.4,
+                                durations={f"http://nas/track{i}.flac": 1.0 for i in range(tracks)}).start()
+        queue = PlayQueue(HeosDevice(renderer.ip, renderer.port), queue_file=None, poll_interval=0.25, gapless=gapless)
+        for i in range(tracks):
+            queue.enqueue(f"http://nas/track{i}.flac", f"Track {i}")
+        queue.play(0)
+        while queue.position is not None:
+            time.sleep(0.1)
+        queue.stop()
+        gaps = sorted(renderer.gaps())
+        played = [args["uri"] for _, action, args in renderer.log if action == "ended"]
+        print(f"{label:>22}: {len(played)} tracks, gap between items "
+              f"mean {sum(gaps) / len(gaps) * 1000:.0f} ms, max {gaps[-1] * 1000:.0f} ms")
+        renderer.stop()
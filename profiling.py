@@ -0,0 +1,297 @@
+# profiling.py
+"""
+Request Profiling
+Opt-in profiling of single requests (cProfile or a sampling profiler), saved
+as pstats or collapsed stacks in a bounded on-disk ring
+"""
+import os
+import io
+import sys
+import time
+import json
+import hmac
+import uuid
+import hashlib
+import pstats
+import marshal
+import cProfile
+import logging
+import threading
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+# Set by /debug/login so a browser can open the /debug/ pages without sending the token each time
+SESSION_COOKIE = "debug_session"
+
+DEFAULT_PROFILING = {
+    "enabled": False,
+    "token": "",             # requests with X-Profile: <token> are profiled
+    "paths": [],             # paths profiled on every request, e.g. ["/import_stations"]
+    "mode": "cprofile",      # or "sample"; X-Profile-Mode overrides per request
+    "interval_ms": 2,        # sampling interval
+    "dir": "profiles",
+    "keep": 20,              # captures kept on disk, oldest removed first
+}
+
+EXTENSIONS = {"cprofile": ".pstats", "sample": ".folded"}
+
+# Only one cProfile can be active per interpreter on newer Pythons
+_cprofile_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Samples one thread's stack every `interval` seconds into collapsed-stack counts
+
+    The output is the "folded" format read by flamegraph.pl, speedscope and
+    inferno: one line per distinct stack, frames joined with ';', then a count.
+    """
+
+    def __init__(self, thread_id=None, interval=0.002):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Captures in a directory: <id>.pstats|.folded plus a <id>.json description"""
+
+    def __init__(self, directory="profiles", keep=20):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def save(self, meta, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, meta["file"])
+        with open(path, "wb") as f:
+            f.write(data)
+        with open(os.path.join(self.directory, meta["id"] + ".json"), "w") as f:
+            json.dump(meta, f)
+        self._trim()
+
+    def _trim(self):
+        with self._lock:
+            captures = self.list()
+            for meta in captures[self.keep:]:
+                for name in (meta["file"], meta["id"] + ".json"):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+    def list(self):
+        """Captures, newest first"""
+        captures = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return captures
+        for name in names:
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        captures.append(json.load(f))
+                except (OSError, ValueError):
+                    pass
+        return sorted(captures, key=lambda meta: meta["started_at"], reverse=True)
+
+    def get(self, capture_id):
+        for meta in self.list():
+            if meta["id"] == capture_id:
+                return meta
+        return None
+
+    def path(self, meta):
+        return os.path.join(self.directory, meta["file"])
+
+    def summary(self, meta, limit=40):
+        """Human-readable top functions (cProfile) or hottest stacks (sampling)"""
+        if meta["mode"] == "cprofile":
+            out = io.StringIO()
+            stats = pstats.Stats(self.path(meta), stream=out)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+            return out.getvalue()
+        with open(self.path(meta)) as f:
+            lines = f.read().splitlines()[:limit]
+        total = sum(int(line.rsplit(" ", 1)[1]) for line in lines) or 1
+        return "\n".join(f"{int(line.rsplit(' ', 1)[1]) * 100 / total:5.1f}%  {line.rsplit(' ', 1)[0]}" for line in lines)
+
+
+class RequestProfiler:
+    """Flask integration: decides which requests to profile and stores the result"""
+
+    def __init__(self, settings=None):
+        self.options = dict(DEFAULT_PROFILING)
+        self.options.update(settings or {})
+        self.store = ProfileStore(self.options["dir"], self.options["keep"])
+        if self.options["enabled"] and not self.options["token"]:
+            log.warning("Profiling enabled without a token: only profiling.paths are captured "
+                        "and /debug/profiles stays closed")
+
+    def authorized(self, request):
+        """Whether the request may read /debug/profiles; always needs the token
+
+        Captures hold stack frames and arguments, so there is no tokenless access
+        even when profiling is enabled (profiling.paths still capture without one).
+        """
+        return self.options["enabled"] and self.token_matches(request)
+
+    def token_matches(self, request):
+        """Whether the request carries profiling.token; also guards the other /debug/ pages
+
+        The token comes in a header, or as the cookie /debug/login hands out. It is
+        not taken from the query string, which ends up in access logs and history.
+        """
+        if not self.options["token"]:
+            return False
+        if self.check_token(request.headers.get("X-Profile")) or self.check_token(request.headers.get("X-Profile-Token")):
+            return True
+        cookie = request.cookies.get(SESSION_COOKIE)
+        return bool(cookie) and hmac.compare_digest(cookie.encode(), self._session_value().encode())
+
+    def check_token(self, offered):
+        """Compare `offered` with profiling.token in constant time"""
+        token = self.options["token"]
+        return bool(token and offered) and hmac.compare_digest(offered.encode(), token.encode())
+
+    def _session_value(self):
+        # Derived from the token, so the cookie never holds the token itself and
+        # changing the token signs every browser out
+        return hmac.new(self.options["token"].encode(), b"debug-session", hashlib.sha256).hexdigest()
+
+    def sign_in(self, response, secure=False):
+        """Set the /debug/ session cookie on `response` (once /debug/login has checked the token)"""
+        response.set_cookie(SESSION_COOKIE, self._session_value(), max_age=12 * 3600, path="/debug/",
+                            secure=secure, httponly=True, samesite="Strict")
+        return response
+
+    def wants(self, request):
+        if not self.options["enabled"] or request.path.startswith(("/debug/", "/assets/", "/static/")):
+            return False
+        if request.path in self.options["paths"]:
+            return True
+        return self.check_token(request.headers.get("X-Profile"))
+
+    def start(self, mode):
+        if mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                return "cprofile", profiler
+            except ValueError:
+                # Another profiler (e.g. a debugger) owns the interpreter hook
+                _cprofile_lock.release()
+        return "sample", SamplingProfiler(interval=self.options["interval_ms"] / 1000).start()
+
+    def stop(self, mode, profiler):
+        if mode == "cprofile":
+            profiler.disable()
+            _cprofile_lock.release()
+            profiler.create_stats()
+            return profiler
+        profiler.stop()
+        return profiler
+
+    def save(self, mode, profiler, meta):
+        try:
+            if mode == "cprofile":
+                data = _marshal_stats(profiler)
+            else:
+                meta["samples"] = profiler.samples
+                data = profiler.folded().encode()
+            self.store.save(meta, data)
+        except Exception:
+            log.exception("Error saving profile %s", meta["id"])
+
+    def init_app(self, app):
+        from flask import request, g
+
+        @app.before_request
+        def begin_profile():
+            if not self.wants(request):
+                return
+            mode = request.headers.get("X-Profile-Mode") or self.options["mode"]
+            g.profile = self.start(mode if mode in EXTENSIONS else "cprofile")
+            g.profile_started = (time.time(), time.perf_counter())
+
+        @app.after_request
+        def end_profile(response):
+            profile = g.pop("profile", None)
+            if profile is None:
+                return response
+            mode, profiler = profile
+            self.stop(mode, profiler)
+            started_at, started = g.pop("profile_started")
+            capture_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(started_at)) + "-" + uuid.uuid4().hex[:6]
+            meta = {"id": capture_id, "file": capture_id + EXTENSIONS[mode], "mode": mode,
+                    "method": request.method, "path": request.path, "status": response.status_code,
+                    "started_at": started_at, "duration_ms": round((time.perf_counter() - started) * 1000, 2)}
+            response.headers["X-Profile-Id"] = capture_id
+            # Write the capture once the response has gone out
+            response.call_on_close(lambda: self.save(mode, profiler, meta))
+            return response
+
+        @app.teardown_request
+        def abandon_profile(exc):
+            # The view raised before after_request ran; don't leave the profiler running
+            profile = g.pop("profile", None)
+            if profile is not None:
+                self.stop(*profile)
+
+
+def _marshal_stats(profiler):
+    """The bytes pstats.Stats and snakeviz read, as written by Profile.dump_stats"""
+    return marshal.dumps(profiler.stats)
+
+
+# Example usage when run directly: profile a function both ways
+if __name__ == "__main__":
+    def work():
+        total = 0
+        for i in range(300000):
+            total += sum(divmod(i, 7))
+        time.sleep(0.05)
+        return total
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    work()
+    profiler.disable()
+    profiler.create_stats()
+    pstats.Stats(profiler).strip_dirs().sort_stats("cumulative").print_stats(5)
+
+    sampler = SamplingProfiler(interval=0.001).start()
+    work()
+    sampler.stop()
+    print(f"{sampler.samples} samples; hottest stacks:")
+    print(sampler.folded()[:600])
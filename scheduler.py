@@ -0,0 +1,379 @@
+# scheduler.py
+"""
+Playback Scheduler
+Runs scheduled scenes (alarms, night-time shutdowns) from a single timer
+thread backed by a priority heap, persisted to a JSON file
+"""
+import os
+import json
+import heapq
+import logging
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+
+from heos_api import action_failed
+
+log = logging.getLogger(__name__)
+
+DAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def parse_days(days):
+    """Normalize day names/numbers to a sorted list of weekday numbers (Mon=0); empty means daily"""
+    if not days:
+        return []
+    if isinstance(days, str):
+        days = [d for d in days.replace(" ", "").split(",") if d]
+    result = set()
+    for day in days:
+        if isinstance(day, int) or str(day).isdigit():
+            number = int(day)
+        else:
+            number = DAY_NAMES.index(str(day).lower()[:3])
+        if not 0 <= number <= 6:
+            raise ValueError(f"Invalid day: {day}")
+        result.add(number)
+    return sorted(result)
+
+
+def next_occurrence(scene, after):
+    """Timestamp of the first firing of `scene` strictly after timestamp `after`"""
+    hour, minute = (int(part) for part in scene["time"].split(":"))
+    days = scene["days"]
+    start = datetime.fromtimestamp(after)
+    for offset in range(8):
+        candidate = (start + timedelta(days=offset)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate.timestamp() > after and (not days or candidate.weekday() in days):
+            return candidate.timestamp()
+    raise ValueError(f"Scene {scene['id']} never fires")
+
+
+def previous_occurrence(scene, before):
+    """Timestamp of the last firing of `scene` at or before timestamp `before`"""
+    hour, minute = (int(part) for part in scene["time"].split(":"))
+    days = scene["days"]
+    start = datetime.fromtimestamp(before)
+    for offset in range(8):
+        candidate = (start - timedelta(days=offset)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate.timestamp() <= before and (not days or candidate.weekday() in days):
+            return candidate.timestamp()
+    return None
+
+
+class PlaybackScheduler:
+    def __init__(self, device, schedules_file, missed_grace=600, fader=None, prestage=15, save_delay=1.0):
+        """
+        device: HeosDevice the scenes act on
+        fader: optional VolumeFader used for scenes with a fade-in
+        missed_grace: seconds within which a firing missed while the app was down is still run
+        prestage: seconds before a station change to stage its URI with SetNextAVTransportURI (0 disables)
+        save_delay: seconds the timer thread gathers scene changes before writing schedules_file
+        """
+        self.device = device
+        self.schedules_file = schedules_file
+        self.missed_grace = missed_grace
+        self.fader = fader
+        self.prestage = prestage
+        self.save_delay = save_delay
+
+        self._scenes = {}
+        # Heap of (fire_at, sequence, scene_id, generation); stale entries are skipped lazily
+        self._heap = []
+        self._sequence = 0
+        self._generations = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._dirty = False
+        self._save_due = None       # monotonic time the pending changes get written
+        # (scene id, uri, accepted) of the station handed to the renderer ahead of time
+        self._staged = None
+
+        self.load()
+
+    # Persistence
+
+    def load(self):
+        """Load scenes from file and queue their next firings"""
+        scenes = []
+        try:
+            if os.path.exists(self.schedules_file):
+                with open(self.schedules_file, 'r') as f:
+                    scenes = json.load(f).get("scenes", [])
+                log.info("Loaded %d schedules from %s", len(scenes), self.schedules_file)
+        except Exception as e:
+            log.error("Error loading schedules: %s", e)
+
+        now = time.time()
+        with self._cond:
+            self._scenes = {}
+            self._heap = []
+            for scene in scenes:
+                self._scenes[scene["id"]] = scene
+                self._queue(scene, now, catch_up=True)
+            heapq.heapify(self._heap)
+            self._cond.notify()
+        return len(self._scenes)
+
+    def save(self):
+        """Save scenes to file"""
+        try:
+            with self._cond:
+                data = {"scenes": [dict(scene) for scene in self._scenes.values()]}
+                self._dirty = False
+                self._save_due = None
+            tmp_file = self.schedules_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.schedules_file)
+            return True
+        except Exception as e:
+            log.error("Error saving schedules: %s", e)
+            return False
+
+    # Heap bookkeeping (caller holds self._cond)
+
+    def _queue(self, scene, now, catch_up=False):
+        """Push the next firing of `scene`; with catch_up, a recently missed firing fires now"""
+        generation = self._generations.get(scene["id"], 0) + 1
+        self._generations[scene["id"]] = generation
+        if not scene.get("enabled", True):
+            return
+
+        fire_at = next_occurrence(scene, now)
+        if catch_up:
+            missed = previous_occurrence(scene, now)
+            last_fired = scene.get("last_fired") or 0
+            if missed is not None and missed > last_fired and now - missed <= self.missed_grace:
+                fire_at = now
+
+        self._sequence += 1
+        heapq.heappush(self._heap, (fire_at, self._sequence, scene["id"], generation))
+
+    def _changed(self):
+        """Schedule a write of the scenes; the timer thread does it save_delay later, in one go"""
+        self._dirty = True
+        if self._save_due is None:
+            self._save_due = time.monotonic() + self.save_delay
+        self._cond.notify()
+
+    def _upcoming_change(self):
+        """(fire_at, scene) of the next firing if it switches station on a powered renderer"""
+        if not self._heap or not self.prestage:
+            return None
+        fire_at, _, scene_id, generation = self._heap[0]
+        scene = self._scenes.get(scene_id)
+        if (scene is None or self._generations.get(scene_id) != generation
+                or not scene.get("uri") or scene.get("power")):
+            return None
+        return fire_at, scene
+
+    def _compact(self):
+        """Drop stale heap entries once they outnumber live ones"""
+        if len(self._heap) > 2 * len(self._scenes) + 64:
+            self._heap = [entry for entry in self._heap
+                          if self._generations.get(entry[2]) == entry[3]]
+            heapq.heapify(self._heap)
+
+    # Public API
+
+    def list_scenes(self):
+        """Get all scenes with their next firing time, soonest first"""
+        with self._cond:
+            upcoming = {}
+            for fire_at, _, scene_id, generation in self._heap:
+                if self._generations.get(scene_id) == generation:
+                    upcoming[scene_id] = fire_at
+            scenes = [dict(scene, next_fire=upcoming.get(scene["id"])) for scene in self._scenes.values()]
+        return sorted(scenes, key=lambda s: (s["next_fire"] is None, s["next_fire"] or 0))
+
+    def add_scene(self, name, time_of_day, days=None, uri=None, volume=None, power=None, enabled=True, fade=None):
+        """Add a scene; returns the stored scene"""
+        hour, minute = (int(part) for part in time_of_day.split(":"))
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise ValueError(f"Invalid time: {time_of_day}")
+        if power not in (None, "", "on", "off"):
+            raise ValueError(f"Invalid power state: {power}")
+
+        scene = {
+            "id": uuid.uuid4().hex[:12],
+            "name": name or time_of_day,
+            "time": f"{hour:02d}:{minute:02d}",
+            "days": parse_days(days),
+            "uri": uri or None,
+            "volume": int(volume) if volume not in (None, "") else None,
+            "power": power or None,
+            "fade": float(fade) if fade not in (None, "") else None,
+            "enabled": bool(enabled),
+            "last_fired": None,
+        }
+        with self._cond:
+            self._scenes[scene["id"]] = scene
+            self._queue(scene, time.time())
+            self._changed()
+        self._save_unless_running()
+        return scene
+
+    def remove_scene(self, scene_id):
+        """Remove a scene by id"""
+        with self._cond:
+            if self._scenes.pop(scene_id, None) is None:
+                return False
+            # Invalidates the queued entry without an O(n) heap removal
+            self._generations.pop(scene_id, None)
+            self._compact()
+            self._changed()
+        self._save_unless_running()
+        return True
+
+    def _save_unless_running(self):
+        # Without the timer thread nothing writes deferred changes, so write them now
+        if not self._running:
+            self.save()
+
+    def run_scene(self, scene):
+        """Apply a scene to the device"""
+        if scene.get("power") == "off":
+            self.device.power_off()
+            return
+        if scene.get("power") == "on":
+            self.device.power_on()
+
+        fade_in = scene.get("fade") and scene.get("volume") is not None and self.fader is not None
+        if fade_in:
+            # Start silent and ramp up once the stream is playing
+            self.device.set_volume(0)
+        elif scene.get("volume") is not None:
+            self.device.set_volume(scene["volume"])
+        if scene.get("uri"):
+            staged, self._staged = self._staged, None
+            # A pre-staged station switches with Next; otherwise (or if Next is refused) set and play
+            if staged != (scene["id"], scene["uri"], True) or action_failed(self.device.next()):
+                self.device.set_uri(scene["uri"])
+                self.device.play()
+        if fade_in:
+            self.fader.fade(scene["volume"], scene["fade"], start=0)
+
+    def prestage_scene(self, scene):
+        """Stage a scene's station on the renderer so the switch at firing time has no gap"""
+        accepted = False
+        # Next only continues from something playing; otherwise the firing sets and plays
+        if self.device.get_status().get("Transport State") == "PLAYING":
+            accepted = not action_failed(self.device.set_next_uri(scene["uri"]))
+        self._staged = (scene["id"], scene["uri"], accepted)
+        return accepted
+
+    # Timer thread
+
+    def start(self):
+        """Start the timer thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="playback-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(5)
+        if self._dirty:
+            self.save()
+
+    def _run(self):
+        while self._running:
+            due, stage = [], None
+            with self._cond:
+                now = time.time()
+                save_now = self._save_due is not None and time.monotonic() >= self._save_due
+                while self._heap and self._heap[0][0] <= now:
+                    fire_at, _, scene_id, generation = heapq.heappop(self._heap)
+                    scene = self._scenes.get(scene_id)
+                    if scene is None or self._generations.get(scene_id) != generation:
+                        continue
+                    self._queue(scene, now)
+                    self._dirty = True
+                    # Firings missed by more than the grace period (e.g. host suspended) are skipped
+                    if now - fire_at > self.missed_grace:
+                        log.warning("Skipping missed scene %s (%s)", scene["name"], scene["id"])
+                        continue
+                    scene["last_fired"] = now
+                    due.append(dict(scene))
+
+                if not due:
+                    delay = self._heap[0][0] - now if self._heap else 60
+                    upcoming = self._upcoming_change()
+                    if upcoming and (self._staged or ())[:2] == (upcoming[1]["id"], upcoming[1]["uri"]):
+                        upcoming = None  # already staged
+                    if upcoming and upcoming[0] - now <= self.prestage:
+                        stage = dict(upcoming[1])
+                    elif not save_now:
+                        if upcoming:
+                            delay = upcoming[0] - self.prestage - now
+                        if self._save_due is not None:
+                            delay = min(delay, self._save_due - time.monotonic())
+                        # Wake at least once a minute so wall-clock jumps (DST, NTP) are noticed
+                        self._cond.wait(min(max(delay, 0), 60))
+                        continue
+
+            if stage is not None:
+                try:
+                    self.prestage_scene(stage)
+                except Exception:
+                    log.exception("Error staging scene %s", stage["id"])
+                    self._staged = (stage["id"], stage["uri"], False)
+                continue
+
+            for scene in due:
+                try:
+                    log.info("Running scheduled scene %s (%s)", scene["name"], scene["id"])
+                    self.run_scene(scene)
+                except Exception:
+                    log.exception("Error running scene %s", scene["id"])
+
+            if self._dirty:
+                self.save()
+
+
+# Example usage when run directly: scheduling cost for a large number of scenes
+if __name__ == "__main__":
+    import random
+    import tempfile
+    from heos_api import HeosDevice
+    from fake_renderer import FakeRenderer
+
+    count = 10000
+    renderer = FakeRenderer().start()
+    with tempfile.TemporaryDirectory() as tmp:
+        schedules_file = os.path.join(tmp, "schedules.json")
+        scheduler = PlaybackScheduler(HeosDevice(renderer.ip, renderer.port), schedules_file)
+        scheduler.start()
+        saves = []
+        save = scheduler.save
+        scheduler.save = lambda: saves.append(time.perf_counter()) or save()
+
+        start = time.perf_counter()
+        for i in range(count):
+            scheduler.add_scene(f"scene {i}", f"{random.randrange(24)}:{random.randrange(60)}",
+                                days=random.sample(range(7), random.randint(1, 7)), volume=20)
+        elapsed = time.perf_counter() - start
+        print(f"Scheduled {count} scenes in {elapsed * 1000:.1f} ms ({elapsed / count * 1e6:.1f} us each), "
+              f"{len(saves)} saves so far")
+
+        ids = [scene["id"] for scene in scheduler.list_scenes()[:count // 2]]
+        start = time.perf_counter()
+        for scene_id in ids:
+            scheduler.remove_scene(scene_id)
+        elapsed = time.perf_counter() - start
+        print(f"Removed {len(ids)} scenes in {elapsed * 1000:.1f} ms ({elapsed / len(ids) * 1e6:.1f} us each)")
+
+        time.sleep(scheduler.save_delay + 0.5)
+        with open(schedules_file) as f:
+            stored = len(json.load(f)["scenes"])
+        print(f"{len(saves)} saves in total, {stored} scenes on disk")
+        print(f"Next: {scheduler.list_scenes()[0]['name']} at {time.ctime(scheduler.list_scenes()[0]['next_fire'])}")
+        scheduler.stop()
+    renderer.stop()
@@ -0,0 +1,250 @@
+# search.py
+"""
+Station Search Index
+Typeahead search over station names: whole-name prefix matches, then word
+prefix matches, then single-typo fuzzy matches, kept up to date incrementally
+"""
+import time
+import bisect
+import threading
+import unicodedata
+
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+
+# Cap on how many distinct words one prefix may expand to per query, so very
+# short prefixes stay fast on big catalogs
+MAX_PREFIX_TOKENS = 256
+
+
+def normalize(text):
+    """Lowercase, strip accents and turn punctuation into spaces"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+
+def edits1(word):
+    """All strings one delete, transpose, replace or insert away from `word`"""
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    deletes = [a + b[1:] for a, b in splits if b]
+    transposes = [a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1]
+    replaces = [a + c + b[1:] for a, b in splits if b for c in _ALPHABET]
+    inserts = [a + c + b for a, b in splits for c in _ALPHABET]
+    return set(deletes + transposes + replaces + inserts)
+
+
+def station_key(station):
+    """Index key of a preset station"""
+    return (station["name"], station["uri"])
+
+
+class StationSearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}        # key -> (name, uri, normalized name)
+        self._postings = {}       # word -> set of keys
+        self._words = []          # sorted distinct words (prefix lookups by bisection)
+        self._names = []          # sorted (normalized name, key) for whole-name prefixes
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def from_stations(cls, stations):
+        """Build an index over StationManager-style dicts, keyed by (name, uri)
+
+        Names alone aren't unique once a list is imported or replaced wholesale,
+        and same-named stations must stay separate results.
+        """
+        index = cls()
+        index.rebuild((station_key(s), s["name"], s["uri"]) for s in stations)
+        return index
+
+    def attach(self, station_manager):
+        """Follow add/update/remove/import changes on a StationManager"""
+        station_manager.add_listener(self.on_station_change)
+        return self
+
+    def on_station_change(self, event, data):
+        if event == "reset":
+            self.rebuild((station_key(s), s["name"], s["uri"]) for s in data)
+        elif event == "remove":
+            self.remove(station_key(data))
+        elif event == "update":
+            with self._lock:
+                self._remove(station_key(data["old"]))
+                self._add(station_key(data["new"]), data["new"]["name"], data["new"]["uri"])
+        else:
+            self.add(station_key(data), data["name"], data["uri"])
+
+    # Maintenance
+
+    def rebuild(self, items):
+        """Replace the whole index from (key, name, uri) tuples"""
+        entries, postings = {}, {}
+        for key, name, uri in items:
+            normalized = normalize(name)
+            entries[key] = (name, uri, normalized)
+            for word in set(normalized.split()):
+                postings.setdefault(word, set()).add(key)
+        words = sorted(postings)
+        names = sorted((entry[2], key) for key, entry in entries.items())
+        with self._lock:
+            self._entries, self._postings, self._words, self._names = entries, postings, words, names
+
+    def add(self, key, name, uri):
+        """Add or update one station"""
+        with self._lock:
+            self._add(key, name, uri)
+
+    def remove(self, key):
+        """Remove one station"""
+        with self._lock:
+            return self._remove(key)
+
+    def _add(self, key, name, uri):
+        if key in self._entries:
+            self._remove(key)
+        normalized = normalize(name)
+        self._entries[key] = (name, uri, normalized)
+        for word in set(normalized.split()):
+            keys = self._postings.get(word)
+            if keys is None:
+                self._postings[word] = keys = set()
+                bisect.insort(self._words, word)
+            keys.add(key)
+        bisect.insort(self._names, (normalized, key))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        normalized = entry[2]
+        for word in set(normalized.split()):
+            keys = self._postings.get(word)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._postings[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+        position = bisect.bisect_left(self._names, (normalized, key))
+        if position < len(self._names) and self._names[position] == (normalized, key):
+            del self._names[position]
+        return True
+
+    # Queries
+
+    def _prefix_words(self, prefix):
+        start = bisect.bisect_left(self._words, prefix)
+        end = min(start + MAX_PREFIX_TOKENS, len(self._words))
+        for i in range(start, end):
+            if not self._words[i].startswith(prefix):
+                break
+            yield self._words[i]
+
+    def _resolve_word(self, word):
+        """Keys for a complete query word: exact, else one typo away, else as a prefix"""
+        keys = self._postings.get(word)
+        if keys:
+            return keys
+        if len(word) >= 4:
+            fuzzy = set()
+            for candidate in edits1(word):
+                fuzzy |= self._postings.get(candidate, set())
+            if fuzzy:
+                return fuzzy
+        prefixed = set()
+        for candidate in self._prefix_words(word):
+            prefixed |= self._postings[candidate]
+        return prefixed
+
+    def search(self, query, limit=10):
+        """Top `limit` matches as dicts with key, name, uri and score (lower is better)"""
+        normalized = normalize(query)
+        if not normalized or limit <= 0:
+            return []
+        with self._lock:
+            return self._search(normalized, limit)
+
+    def _search(self, normalized, limit):
+        words = normalized.split()
+        last, complete = words[-1], words[:-1]
+        results, seen = [], set()
+
+        def take(key, score):
+            if key not in seen:
+                seen.add(key)
+                name, uri, _ = self._entries[key]
+                results.append({"key": key, "name": name, "uri": uri, "score": score})
+            return len(results) >= limit
+
+        # 1. Whole name starts with the query
+        position = bisect.bisect_left(self._names, (normalized,))
+        while position < len(self._names) and self._names[position][0].startswith(normalized):
+            if take(self._names[position][1], 0):
+                return results
+            position += 1
+
+        # 2. Every complete word matches and some word starts with the last one
+        required = sorted((self._resolve_word(word) for word in complete), key=len)
+        if any(not keys for keys in required):
+            return results
+
+        def matching(keys):
+            if required and len(required[0]) < len(keys):
+                return (key for key in required[0] if key in keys and all(key in s for s in required[1:]))
+            return (key for key in keys if all(key in s for s in required))
+
+        for word in self._prefix_words(last):
+            for key in matching(self._postings[word]):
+                if take(key, 1):
+                    return results
+
+        # 3. The last word is one typo away from an indexed word
+        if len(last) >= 3:
+            for candidate in sorted(edits1(last)):
+                keys = self._postings.get(candidate)
+                if keys:
+                    for key in matching(keys):
+                        if take(key, 2):
+                            return results
+        return results
+
+
+# Example usage when run directly: build and query latency at catalog scale
+if __name__ == "__main__":
+    import sys
+    import random
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(7)
+    words = ["radio", "fm", "classic", "jazz", "smooth", "city", "public", "hits", "rock", "wave",
+             "sound", "live", "news", "talk", "country", "dance", "oldies", "soul", "blues", "metro"]
+    places = ["berlin", "boston", "paris", "tokyo", "denver", "austin", "lisbon", "oslo", "seattle", "dublin"]
+    stations = [{"name": f"{rng.choice(words).title()} {rng.choice(places).title()} {rng.choice(words).upper()} {i}",
+                 "uri": f"http://stream.example.net/{i}"} for i in range(count)]
+
+    start = time.perf_counter()
+    index = StationSearchIndex.from_stations(stations)
+    print(f"Built index over {count} stations in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    queries = ["r", "ra", "rad", "radio", "jazz bos", "smooth par", "clasic", "radoi tokyo", "metro 12",
+               "oslo", "wave d", "public radio", "zzz", "blues lisbon fm", "99"]
+    timings = []
+    for _ in range(50):
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, 10)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{len(timings)} queries: p50 {timings[len(timings) // 2] * 1e6:.0f} us, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f} us, max {timings[-1] * 1e6:.0f} us")
+
+    started = time.perf_counter()
+    for i in range(1000):
+        index.add(f"new {i}", f"Fresh Station {i}", "http://x")
+    for i in range(1000):
+        index.remove(f"new {i}")
+    print(f"Incremental add+remove: {(time.perf_counter() - started) / 1000 * 1e6:.0f} us per station")
+    print(index.search("radoi tokyo", 3))
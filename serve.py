@@ -0,0 +1,128 @@
+# serve.py
+"""
+Production Server
+Runs the dashboard with several worker processes that share one device,
+station list and config through the state daemon (state_server.py)
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import socket
+import argparse
+import multiprocessing
+
+from werkzeug.serving import make_server
+
+from config import load_config
+from state_server import StateServer, DEFAULT_SOCKET
+from logs import setup_logging
+
+log = logging.getLogger(__name__)
+
+# Forked processes inherit the listening socket, so workers can share one port
+_mp = multiprocessing.get_context("fork")
+
+
+def run_state_daemon(socket_path):
+    """Entry point of the state daemon process"""
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    # The parent's log listener thread does not survive the fork
+    setup_logging(load_config().get("logging"))
+    server = StateServer(socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def run_worker(fd, host, port, socket_path):
+    """Entry point of a web worker process"""
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    os.environ["HEOS_STATE_SOCKET"] = socket_path
+
+    # Imported here so each worker connects to the daemon on its own
+    from app import app
+    make_server(host, port, app, threaded=True, fd=fd).serve_forever()
+
+
+def wait_for_socket(socket_path, timeout=30):
+    """Block until the state daemon accepts connections"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(socket_path)
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def serve(host, port, workers, socket_path):
+    """Start the state daemon and `workers` web workers, restarting any that die"""
+    socket_path = os.path.abspath(socket_path)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(128)
+    listener.set_inheritable(True)
+
+    daemon = _mp.Process(target=run_state_daemon, args=(socket_path,), name="heos-state")
+    daemon.start()
+    if not wait_for_socket(socket_path):
+        daemon.terminate()
+        raise RuntimeError(f"State daemon did not start on {socket_path}")
+
+    def spawn(index):
+        process = _mp.Process(target=run_worker, args=(listener.fileno(), host, port, socket_path),
+                              name=f"heos-worker-{index}")
+        process.start()
+        return process
+
+    pool = [spawn(i) for i in range(workers)]
+    print(f"Serving on http://{host}:{port} with {workers} workers (state: {socket_path})")
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while not stopping:
+            if not daemon.is_alive():
+                log.error("State daemon exited, shutting down")
+                break
+            for i, process in enumerate(pool):
+                if not process.is_alive():
+                    log.warning("Worker %s exited (%s), restarting", process.name, process.exitcode)
+                    pool[i] = spawn(i)
+            time.sleep(0.5)
+    finally:
+        for process in pool + [daemon]:
+            if process.is_alive():
+                process.terminate()
+        for process in pool + [daemon]:
+            process.join(5)
+        listener.close()
+
+
+if __name__ == "__main__":
+    config = load_config()
+    app_config = config["app"]
+    setup_logging(config.get("logging"))
+
+    parser = argparse.ArgumentParser(description="Run the HEOS Dashboard with multiple workers")
+    parser.add_argument("--host", default=app_config["host"])
+    parser.add_argument("--port", type=int, default=app_config["port"])
+    parser.add_argument("--workers", type=int, default=app_config.get("workers", 4))
+    parser.add_argument("--socket", default=app_config.get("state_socket", DEFAULT_SOCKET))
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, args.socket)
@@ -0,0 +1,341 @@
+# soap_trace.py
+"""
+SOAP Record/Replay
+Records the SOAP traffic of a real receiver (request, response, status and
+round-trip time) to a compact trace file, and serves a trace back at recorded
+or accelerated speed so parsers and routes can be benchmarked without a device
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+
+
+def _open(path, mode):
+    """Traces ending in .gz are gzip-compressed"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def process_path(path):
+    """`path` with the process id before its extensions: trace.jsonl.gz -> trace.1234.jsonl.gz
+
+    Several processes appending to one gzip file interleave their streams into
+    garbage, so services that can run in more than one process each record to
+    their own file.
+    """
+    directory, name = os.path.split(path)
+    stem, dot, extensions = name.partition(".")
+    return os.path.join(directory, f"{stem}.{os.getpid()}{dot}{extensions}")
+
+
+def compact_args(body_xml):
+    """Request arguments without the indentation of the f-string templates"""
+    return re.sub(r">\s+<", "><", (body_xml or "").strip())
+
+
+class TraceRecorder:
+    """Appends one JSON line per SOAP call; response bodies are stored once and referenced by hash
+
+    A receiver answers the same GetTransportInfo/GetVolume polls thousands of
+    times, so deduplicated bodies keep long recordings small. A restart appends
+    a new session (header, then its own bodies) instead of truncating the file;
+    for .gz traces that is another gzip member, which readers handle.
+    """
+
+    def __init__(self, path, device=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._bodies = set()
+        self._t0 = time.monotonic()
+        self.calls = 0
+        self._file = _open(path, "a")
+        self._write({"trace": TRACE_VERSION, "device": device, "started_at": round(time.time(), 3)})
+        self._file.flush()
+        # Ends the gzip member cleanly on a normal exit; a killed process leaves every
+        # flushed call readable anyway (see load_trace)
+        atexit.register(self.close)
+        log.info("Recording SOAP traffic to %s", path)
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def record(self, action, service, control_url, body_xml, status=None, response=None, elapsed=0.0, error=None):
+        """Add one call; `response` is the raw body (bytes or text), `error` the exception if it failed"""
+        entry = {
+            "t": round(time.monotonic() - self._t0 - elapsed, 4),
+            "action": action,
+            "service": service,
+            "path": urlparse(control_url).path,
+            "args": compact_args(body_xml),
+            "ms": round(elapsed * 1000, 2),
+        }
+        with self._lock:
+            if error is not None:
+                entry["error"] = type(error).__name__
+            else:
+                text = response.decode("utf-8", "replace") if isinstance(response, bytes) else (response or "")
+                digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+                if digest not in self._bodies:
+                    self._bodies.add(digest)
+                    self._write({"body": digest, "text": text})
+                entry.update(status=status, body=digest)
+            self._write(entry)
+            self._file.flush()
+            self.calls += 1
+
+    def close(self):
+        atexit.unregister(self.close)
+        with self._lock:
+            self._file.close()
+
+
+def load_trace(path):
+    """(header, calls) with each call's response text resolved
+
+    The header is the first session's, with "sessions" counting the appended
+    ones. A trace cut off mid-write (the recording process was killed) loads up
+    to its last complete line.
+    """
+    header, bodies, calls = {}, {}, []
+    sessions = 0
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    log.warning("Skipping incomplete line in %s", path)
+                    continue
+                if "trace" in entry:
+                    sessions += 1
+                    header = header or entry
+                elif "text" in entry:
+                    bodies[entry["body"]] = entry["text"]
+                else:
+                    if "body" in entry:
+                        entry["text"] = bodies[entry["body"]]
+                    calls.append(entry)
+        except EOFError:
+            log.warning("%s ends in the middle of a gzip stream; loaded the calls before it", path)
+    header["sessions"] = sessions
+    return header, calls
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Answers SOAP requests from a trace, with the recorded status, body and (scaled) latency
+
+    Calls are matched on (path, action, arguments) and replayed in recorded
+    order, so a polled GetTransportInfo walks through the states it went
+    through when recorded; calls with unrecorded arguments (another volume
+    level) get the responses recorded for the same action.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, trace_path, port=0, speed=1.0):
+        """speed: 1 replays recorded latency, 10 ten times faster, 0 answers immediately"""
+        super().__init__(("127.0.0.1", port), _ReplayHandler)
+        self.speed = speed
+        self.header, calls = load_trace(trace_path)
+        self.lock = threading.Lock()
+        self.exact = defaultdict(list)
+        self.by_action = defaultdict(list)
+        for call in calls:
+            self.exact[(call["path"], call["action"], call["args"])].append(call)
+            self.by_action[(call["path"], call["action"])].append(call)
+        self._cursors = defaultdict(int)
+        self.served = 0
+        self.unmatched = 0
+
+    @property
+    def ip(self):
+        return "127.0.0.1"
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def lookup(self, path, action, args):
+        key = (path, action, args)
+        candidates = self.exact.get(key)
+        if not candidates:
+            key = (path, action)
+            candidates = self.by_action.get(key)
+        if not candidates:
+            with self.lock:
+                self.unmatched += 1
+            return None
+        with self.lock:
+            index = self._cursors[key]
+            self._cursors[key] = index + 1
+            self.served += 1
+        return candidates[index % len(candidates)]
+
+    def delay(self, call):
+        return call["ms"] / 1000 / self.speed if self.speed else 0.0
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        action = self.headers.get("SOAPACTION", "").strip('"').split("#")[-1]
+        match = re.search(rf"<u:{re.escape(action)}[^>]*>(.*)</u:{re.escape(action)}>", body, re.S)
+        call = server.lookup(urlparse(self.path).path, action, compact_args(match.group(1) if match else ""))
+
+        if call is None:
+            data = ('<?xml version="1.0" encoding="utf-8"?><s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">'
+                    '<s:Body><s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring>'
+                    '<detail><UPnPError xmlns="urn:schemas-upnp-org:control-1-0"><errorCode>401</errorCode>'
+                    '<errorDescription>Not in trace</errorDescription></UPnPError></detail></s:Fault>'
+                    '</s:Body></s:Envelope>').encode()
+            self._send(500, data)
+            return
+
+        time.sleep(server.delay(call))
+        if "error" in call:
+            # The receiver didn't answer: drop the connection like a dead socket would
+            self.close_connection = True
+            self.connection.close()
+            return
+        self._send(call["status"], call["text"].encode("utf-8"))
+
+    def _send(self, status, data):
+        self.send_response(status)
+        self.send_header("Content-Type", 'text/xml; charset="utf-8"')
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def summarize(path):
+    """Calls, distinct bodies, latency percentiles and faults per action"""
+    header, calls = load_trace(path)
+    actions = defaultdict(list)
+    for call in calls:
+        actions[call["action"]].append(call)
+    rows = []
+    for action, group in sorted(actions.items(), key=lambda item: -len(item[1])):
+        times = sorted(call["ms"] for call in group)
+        rows.append({
+            "action": action,
+            "calls": len(group),
+            "bodies": len({call.get("body") for call in group}),
+            "faults": sum(1 for call in group if call.get("status", 200) != 200 or "error" in call),
+            "p50_ms": times[len(times) // 2],
+            "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+        })
+    return header, rows
+
+
+def bench_parsers(calls, rounds=200):
+    """Microseconds per call of the response parsers, over the recorded bodies"""
+    from heos_api import find_fields, parse_didl
+
+    fields = {
+        "GetTransportInfo": ["CurrentTransportState", "CurrentTransportStatus", "CurrentSpeed"],
+        "GetPositionInfo": ["Track", "TrackDuration", "TrackMetaData", "TrackURI", "RelTime"],
+        "GetMediaInfo": ["NrTracks", "MediaDuration", "CurrentURI", "CurrentURIMetaData", "NextURI"],
+        "GetVolume": ["CurrentVolume"],
+        "GetMute": ["CurrentMute"],
+    }
+    results = {}
+    for action, names in fields.items():
+        bodies = [call["text"] for call in calls if call["action"] == action and call.get("status") == 200]
+        if not bodies:
+            continue
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in bodies:
+                parsed = find_fields(text, names)
+                for name in ("TrackMetaData", "CurrentURIMetaData"):
+                    if parsed.get(name):
+                        parse_didl(parsed[name])
+        results[action] = round((time.perf_counter() - start) / (rounds * len(bodies)) * 1e6, 1)
+    return results
+
+
+def bench_routes(server, paths=("/", "/api/now_playing"), requests_per_path=50):
+    """Latency of dashboard routes with the device played back by `server`"""
+    import app as dashboard
+
+    dashboard.device.set_address(server.ip, server.port)
+    client = dashboard.app.test_client()
+    results = {}
+    for path in paths:
+        timings = []
+        for _ in range(requests_per_path):
+            start = time.perf_counter()
+            client.get(path).close()
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[path] = {"p50_ms": round(timings[len(timings) // 2] * 1000, 2),
+                         "p95_ms": round(timings[int(len(timings) * 0.95)] * 1000, 2)}
+    return results
+
+
+# Replay from the command line:
+#   python soap_trace.py info TRACE
+#   python soap_trace.py serve TRACE [PORT] [SPEED]   (point config.json's device at it)
+#   python soap_trace.py bench TRACE [SPEED]
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("info", "serve", "bench"):
+        print("Usage: python soap_trace.py info|serve|bench TRACE [PORT] [SPEED]")
+        sys.exit(1)
+    command, trace_path = sys.argv[1], sys.argv[2]
+
+    if command == "info":
+        header, rows = summarize(trace_path)
+        print(f"Recorded from {header.get('device')} at {time.ctime(header.get('started_at', 0))}"
+              f" ({header['sessions']} session{'s' if header['sessions'] != 1 else ''})")
+        for row in rows:
+            print(f"{row['action']:>22}: {row['calls']} calls, {row['bodies']} distinct responses, "
+                  f"{row['faults']} faults, p50 {row['p50_ms']} ms, p95 {row['p95_ms']} ms")
+    elif command == "serve":
+        server = ReplayServer(trace_path, port=int(sys.argv[3]) if len(sys.argv) > 3 else 60006,
+                              speed=float(sys.argv[4]) if len(sys.argv) > 4 else 1.0)
+        print(f"Replaying {trace_path} on {server.ip}:{server.port} at {server.speed}x")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        speed = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+        _, calls = load_trace(trace_path)
+        for action, micros in bench_parsers(calls).items():
+            print(f"parse {action:>18}: {micros} us")
+        server = ReplayServer(trace_path, speed=speed).start()
+        for path, result in bench_routes(server).items():
+            print(f"route {path:>18}: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms")
+        print(f"{server.served} replayed responses, {server.unmatched} requests not in the trace")
+        server.stop()
@@ -0,0 +1,326 @@
+# state_server.py
+"""
+Shared State Daemon
+Owns the device connection, station catalog and configuration for all web
+workers and serves them over a local Unix socket (one JSON request per line)
+"""
+import os
+import json
+import socket
+import socketserver
+import threading
+import time
+
+from config import save_config, setup_configuration
+from heos_api import HeosDevice
+from soap_trace import process_path
+from stations import StationManager
+from scheduler import PlaybackScheduler
+from now_playing import NowPlayingPoller
+from icy import IcyMetadataService
+from fade import VolumeFader
+from catalog import CatalogStore
+from search import StationSearchIndex
+from media_server import MediaLibrary
+from play_queue import PlayQueue
+from switch_timing import SwitchTimer
+from announce import Announcer
+from station_sync import StationChangeLog, StationSync
+from logs import request_id_var
+from tracing import span, TraceStore
+
+# Default socket path, relative to the working directory like the other data files
+DEFAULT_SOCKET = "heos-state.sock"
+
+
+class StateError(RuntimeError):
+    """Raised in a worker when the state daemon reports a failure"""
+
+
+def replace_in_place(target, source):
+    """Make dict `target` equal to `source` key by key, so threads reading it never see it empty"""
+    for key, value in source.items():
+        target[key] = value
+    for key in [key for key in target if key not in source]:
+        del target[key]
+    return target
+
+
+class ConfigStore:
+    """Configuration holder with a revision counter so workers can cheaply check for changes"""
+
+    def __init__(self, config, device):
+        self.config = config
+        self.device = device
+        self.revision = 1
+
+    def snapshot(self, since=None):
+        """Return the config if it changed after revision `since`, otherwise None"""
+        if since == self.revision:
+            return None
+        # A copy: the reply is serialized after the service lock is released
+        return {"revision": self.revision, "config": dict(self.config)}
+
+    def save(self, new_config):
+        """Replace and persist the configuration, re-pointing the device if needed"""
+        old_device = dict(self.config.get("device", {}))
+        replace_in_place(self.config, new_config)
+        self.revision += 1
+
+        new_device = self.config.get("device", {})
+        if (new_device.get("ip"), new_device.get("port")) != (old_device.get("ip"), old_device.get("port")):
+            self.device.set_address(new_device["ip"], int(new_device["port"]))
+
+        return save_config(self.config)
+
+
+def create_services(config):
+    """Build the shared objects that the web workers operate on"""
+    device = HeosDevice(config["device"]["ip"], config["device"]["port"])
+    if config["app"].get("soap_record_file"):
+        # Web workers without the daemon each build their own services, so one file per process
+        device.record_to(process_path(config["app"]["soap_record_file"]))
+    fader = VolumeFader(device)
+    stations = StationManager(config["app"]["stations_file"])
+    station_changes = StationChangeLog(stations, config["app"].get("station_changes_file", "station_changes.json"))
+    tracing = config.get("tracing", {})
+    return {
+        "device": device,
+        "stations": stations,
+        "search": StationSearchIndex.from_stations(stations.stations).attach(stations),
+        "traces": TraceStore(tracing.get("file", "traces.jsonl"), tracing.get("max_bytes", 5 * 1024 * 1024),
+                             tracing.get("backups", 2), tracing.get("keep", 500)),
+        "config": ConfigStore(config, device),
+        "fader": fader,
+        "scheduler": PlaybackScheduler(device, config["app"].get("schedules_file", "schedules.json"), fader=fader),
+        "now_playing": NowPlayingPoller(device),
+        "icy": IcyMetadataService(),
+        "catalog": CatalogStore(config["app"].get("catalog_file", "catalog.idx")),
+        "media": MediaLibrary(config["app"].get("media_servers", [])),
+        "queue": PlayQueue(device, config["app"].get("queue_file", "queue.json")),
+        "announcer": Announcer(device, fader=fader, volume=config["ui"].get("announce_volume", 40)),
+        "switch_timing": SwitchTimer(device, config["app"].get("switch_times_file", "switch_times.json")),
+        "station_changes": station_changes,
+        "station_sync": StationSync(stations, config["app"].get("sync_peers", []),
+                                    config["app"].get("sync_state_file", "sync_state.json"),
+                                    config["app"].get("sync_interval", 60), change_log=station_changes),
+    }
+
+
+def start_services(services):
+    """Start the background threads of the services that have them"""
+    for service in services.values():
+        if hasattr(service, "start"):
+            service.start()
+
+
+class _StateRequestHandler(socketserver.StreamRequestHandler):
+    """Handle one worker connection, answering requests until it disconnects"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            token = None
+            try:
+                request = json.loads(line)
+                # Log records written while serving this request carry the worker's request id
+                token = request_id_var.set(request.get("request_id"))
+                reply = {"ok": True, "result": self.server.dispatch(request)}
+            except Exception as e:
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            finally:
+                if token is not None:
+                    request_id_var.reset(token)
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+class StateServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server exposing the public methods of each registered service"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, config=None):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _StateRequestHandler)
+        self.socket_path = socket_path
+        self.services = {}
+        self._locks = {}
+
+        config = config if config is not None else setup_configuration()
+        services = create_services(config)
+        for name, service in services.items():
+            # Services that lock internally or only talk to the device can run concurrently
+            self.register(name, service, serialize=(name in ("stations", "config", "catalog")))
+        # Pulled station changes are applied from the sync thread, under the workers' station lock
+        services["station_sync"].lock = self._locks["stations"]
+        start_services(services)
+
+    def register(self, name, service, serialize=False):
+        """Expose a service object to the workers under `name`"""
+        self.services[name] = service
+        self._locks[name] = threading.RLock() if serialize else None
+
+    def dispatch(self, request):
+        """Run one request against a service and return a JSON-serializable result"""
+        name = request["service"]
+        service = self.services.get(name)
+        if service is None:
+            raise KeyError(f"Unknown service: {name}")
+
+        attr = request.get("method") or request.get("attr")
+        if not attr or attr.startswith("_"):
+            raise AttributeError(f"Attribute not available: {attr}")
+
+        lock = self._locks[name]
+        if lock is not None:
+            lock.acquire()
+        try:
+            value = getattr(service, attr)
+            if "method" in request:
+                return value(*request.get("args", []), **request.get("kwargs", {}))
+            return value
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def server_close(self):
+        super().server_close()
+        self.services["device"].record_to(None)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class StateClient:
+    """Worker-side connection to the state daemon (one socket per thread)"""
+
+    def __init__(self, socket_path, config_max_age=1.0):
+        """config_max_age: seconds a worker trusts its config before asking the daemon again"""
+        self.socket_path = socket_path
+        self.config_revision = None
+        self.config_max_age = config_max_age
+        self.config_checked = 0.0
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+        self._local.conn = None
+
+    def request(self, payload):
+        """Send one request and return its result, reconnecting once if the daemon restarted"""
+        request_id = request_id_var.get()
+        if request_id:
+            payload = dict(payload, request_id=request_id)
+        with span(f"state {payload['service']}.{payload.get('method') or payload.get('attr')}"):
+            return self._request(payload)
+
+    def _request(self, payload):
+        data = json.dumps(payload).encode() + b"\n"
+        for attempt in (1, 2):
+            try:
+                sock, reader = self._connection()
+                sock.sendall(data)
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("State daemon closed the connection")
+                break
+            except OSError:
+                self._reset()
+                if attempt == 2:
+                    raise
+
+        reply = json.loads(line)
+        if not reply["ok"]:
+            raise StateError(reply["error"])
+        return reply["result"]
+
+    def call(self, service, method, *args, **kwargs):
+        return self.request({"service": service, "method": method, "args": args, "kwargs": kwargs})
+
+    def get(self, service, attr):
+        return self.request({"service": service, "attr": attr})
+
+    def fetch_config(self):
+        """Fetch the current configuration dict"""
+        snapshot = self.call("config", "snapshot")
+        self.config_revision = snapshot["revision"]
+        return snapshot["config"]
+
+    def sync_config(self, config):
+        """Refresh `config` in place if another worker changed it, asking at most every config_max_age"""
+        now = time.monotonic()
+        if self.config_revision is not None and now - self.config_checked < self.config_max_age:
+            return config
+        self.config_checked = now
+        snapshot = self.call("config", "snapshot", self.config_revision)
+        if snapshot is not None:
+            replace_in_place(config, snapshot["config"])
+            self.config_revision = snapshot["revision"]
+        return config
+
+    def save_config(self, config):
+        """Drop-in replacement for config.save_config that goes through the daemon"""
+        result = self.call("config", "save", config)
+        self.config_revision = None
+        return result
+
+
+class RemoteService:
+    """Proxy forwarding method calls to a service held by the state daemon"""
+
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def remote_call(*args, **kwargs):
+            return self._client.call(self._name, method, *args, **kwargs)
+
+        remote_call.__name__ = method
+        return remote_call
+
+
+class RemoteStationManager(RemoteService):
+    """StationManager proxy that also exposes the `stations` property"""
+
+    @property
+    def stations(self):
+        return self._client.get(self._name, "stations")
+
+
+# Run the daemon on its own so externally managed workers (e.g. gunicorn) can attach
+if __name__ == "__main__":
+    import sys
+
+    from config import load_config
+    from logs import setup_logging
+
+    setup_logging(load_config().get("logging"))
+    socket_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOCKET
+    server = StateServer(socket_path)
+
+    print(f"State daemon listening on {socket_path}")
+    print(f"Start workers with HEOS_STATE_SOCKET={os.path.abspath(socket_path)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
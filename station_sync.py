@@ -0,0 +1,433 @@
+# station_sync.py
+"""
+Station Sync
+Numbers every change to the station list with a revision so another dashboard
+can pull just the changes since the revision it last saw (/stations/changes)
+and apply them in one batch, instead of exporting and re-importing whole files
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
+
+import requests
+
+from stations import DEFAULT_STATIONS
+from tracing import span
+
+log = logging.getLogger(__name__)
+
+
+class StationChangeLog:
+    def __init__(self, station_manager, log_file="station_changes.json", save_delay=1.0):
+        """
+        station_manager: StationManager whose changes are numbered (followed through add_listener)
+        log_file: where the revisions are kept across restarts
+        save_delay: seconds to gather changes before writing log_file
+        """
+        self.log_file = log_file
+        self.save_delay = save_delay
+
+        # Identifies this history; a peer seeing a new source starts over from revision 0
+        self.source = None
+        self.revision = 0
+        self._lock = threading.Lock()
+        self._latest = {}   # station name -> its newest change (deletions included)
+        self._revs = []     # revisions in order, with the station each one touched,
+        self._names = []    # so changes(since) can bisect instead of scanning
+        self._dirty = False
+        # Edit times of the peer changes being applied in this thread (see adopting())
+        self._adopted = threading.local()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+        self.load()
+        if not self._latest:
+            # Every fresh install has the built-in defaults. They are seeded as revision 0,
+            # edited at time 0: never offered to peers, and older than any real edit, so they
+            # can't bring back a station a peer deleted long ago. Once save() writes them to
+            # stations.json the reset below finds them unchanged
+            self._seed(DEFAULT_STATIONS)
+        # Edits made to stations.json while we weren't running become new revisions
+        if station_manager.saved:
+            self.on_station_change("reset", station_manager.stations)
+        station_manager.add_listener(self.on_station_change)
+
+    # Persistence
+
+    def load(self):
+        try:
+            if self.log_file and os.path.exists(self.log_file):
+                with open(self.log_file, 'r') as f:
+                    data = json.load(f)
+                self.source, self.revision = data["source"], data["revision"]
+                for change in data["changes"]:
+                    self._latest[change["name"]] = change
+                self._reindex()
+        except Exception as e:
+            log.error("Error loading station changes: %s", e)
+            self._latest, self._revs, self._names, self.revision = {}, [], [], 0
+        if self.source is None:
+            self.source = uuid.uuid4().hex[:12]
+        return self.revision
+
+    def save(self):
+        if not self.log_file:
+            return True
+        try:
+            with self._lock:
+                data = {"source": self.source, "revision": self.revision,
+                        "changes": sorted(self._latest.values(), key=lambda change: change["rev"])}
+                self._dirty = False
+            tmp_file = self.log_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.log_file)
+            return True
+        except Exception as e:
+            log.error("Error saving station changes: %s", e)
+            return False
+
+    def _seed(self, stations):
+        for station in stations:
+            self._latest[station["name"]] = {"rev": 0, "name": station["name"], "station": dict(station),
+                                             "at": 0, "origin": ""}
+        self._reindex()
+
+    def _reindex(self):
+        ordered = sorted(self._latest.values(), key=lambda change: change["rev"])
+        self._revs = [change["rev"] for change in ordered]
+        self._names = [change["name"] for change in ordered]
+
+    # Recording
+
+    def on_station_change(self, event, data):
+        """StationManager listener: one revision per station that actually changed"""
+        if event == "add":
+            self._record(data["name"], data)
+        elif event == "remove":
+            self._record(data["name"], None)
+        elif event == "update":
+            if data["old"]["name"] != data["new"]["name"]:
+                self._record(data["old"]["name"], None)
+            self._record(data["new"]["name"], data["new"])
+        else:
+            # A reset replaces the list wholesale; only the differences become revisions
+            current = {station["name"]: station for station in data}
+            with self._lock:
+                gone = [name for name, change in self._latest.items()
+                        if change["station"] is not None and name not in current]
+            for name in gone:
+                self._record(name, None)
+            for name, station in current.items():
+                self._record(name, station)
+
+    @contextmanager
+    def adopting(self, changes):
+        """Record `changes` with their original edit time while they are applied in this thread
+
+        Last-writer-wins compares when a station was edited, wherever that was;
+        stamping a pulled change with the time it arrived here would let a
+        stale copy beat a newer edit that reached us through another peer.
+        """
+        self._adopted.times = {change["name"]: (change["at"], change.get("origin", ""))
+                               for change in changes if "at" in change}
+        try:
+            yield
+        finally:
+            self._adopted.times = {}
+
+    def is_newer(self, change):
+        """Whether a peer's change wins over this site's latest change to the same station
+
+        The later edit time wins, so the dashboards' clocks are assumed to be set
+        (NTP); on equal times the origin (the source id of the site the edit was
+        made on) decides, so every site settles on the same winner.
+        """
+        with self._lock:
+            local = self._latest.get(change["name"])
+        if local is None:
+            return True
+        return (change.get("at", 0), change.get("origin", "")) > (local["at"], local.get("origin", ""))
+
+    def _record(self, name, station):
+        at, origin = getattr(self._adopted, "times", {}).get(name, (None, None))
+        with self._lock:
+            previous = self._latest.get(name)
+            if (previous["station"] if previous else None) == station:
+                return
+            self.revision += 1
+            self._latest[name] = {"rev": self.revision, "name": name,
+                                  "station": dict(station) if station is not None else None,
+                                  "at": at if at is not None else round(time.time(), 3),
+                                  "origin": origin if at is not None else self.source}
+            self._revs.append(self.revision)
+            self._names.append(name)
+            # Superseded entries are skipped by changes(); drop them once they dominate
+            if len(self._revs) > 2 * len(self._latest) + 64:
+                self._reindex()
+            self._dirty = True
+        self._wake.set()
+
+    # Queries
+
+    def changes(self, since=0, limit=1000):
+        """The newest change of each station modified after revision `since`, oldest first
+
+        Returns at most `limit` changes; when "more" is set, ask again with since=next.
+        A `since` ahead of this history (the log was lost) answers from the start with "reset".
+        """
+        since, limit = max(0, int(since)), max(1, int(limit))
+        with self._lock:
+            reset = since > self.revision
+            if reset:
+                since = 0
+            changes, last = [], since
+            for i in range(bisect_right(self._revs, since), len(self._revs)):
+                rev, name = self._revs[i], self._names[i]
+                if self._latest[name]["rev"] != rev:
+                    continue
+                if len(changes) == limit:
+                    break
+                changes.append(self._latest[name])
+                last = rev
+            more = len(changes) == limit and last < self.revision
+            return {"source": self.source, "revision": self.revision, "since": since, "reset": reset,
+                    "next": last if more else self.revision, "more": more, "changes": changes}
+
+    def status(self):
+        with self._lock:
+            return {"source": self.source, "revision": self.revision, "stations": len(self._latest),
+                    "deleted": sum(1 for change in self._latest.values() if change["station"] is None)}
+
+    # Writer thread
+
+    def start(self):
+        """Start the thread that writes log_file shortly after changes"""
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="station-changes", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._dirty:
+            self.save()
+
+    def _run(self):
+        while self._running:
+            self._wake.wait()
+            self._wake.clear()
+            # A batch of synced or imported stations is written once, not once per station
+            time.sleep(self.save_delay)
+            if self._dirty:
+                self.save()
+
+
+class StationSync:
+    def __init__(self, station_manager, peers=(), state_file="sync_state.json", interval=60.0,
+                 page_size=1000, timeout=10.0, lock=None, change_log=None):
+        """
+        station_manager: StationManager that pulled changes are applied to
+        change_log: this site's StationChangeLog; with it a pulled change only wins over a
+            local one made later than it (last writer wins), without it the peer always wins
+        peers: base URLs of other dashboards, e.g. "http://10.0.0.5:5050"
+        state_file: where the revision reached on each peer is kept
+        interval: seconds between automatic pulls (0 pulls only on request)
+        lock: held while applying, when station_manager is also edited from other threads
+        """
+        self.station_manager = station_manager
+        self.peers = [peer.rstrip("/") for peer in peers]
+        self.state_file = state_file
+        self.interval = interval
+        self.page_size = page_size
+        self.timeout = timeout
+        self.lock = lock or threading.RLock()
+        self.change_log = change_log
+
+        self._cursors = {}  # peer -> {"source": ..., "revision": ...}
+        self._reports = {}
+        self._session = requests.Session()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+        self.load()
+
+    # Persistence
+
+    def load(self):
+        try:
+            if self.state_file and os.path.exists(self.state_file):
+                with open(self.state_file, 'r') as f:
+                    self._cursors = json.load(f).get("peers", {})
+        except Exception as e:
+            log.error("Error loading sync state: %s", e)
+        return len(self._cursors)
+
+    def save(self):
+        if not self.state_file:
+            return True
+        try:
+            tmp_file = self.state_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({"peers": self._cursors}, f)
+            os.replace(tmp_file, self.state_file)
+            return True
+        except Exception as e:
+            log.error("Error saving sync state: %s", e)
+            return False
+
+    # Pulling
+
+    def _fetch(self, peer, since):
+        response = self._session.get(f"{peer}/stations/changes", params={"since": since, "limit": self.page_size},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json(), len(response.content)
+
+    def pull(self, peer):
+        """Fetch the changes made on `peer` since the last pull and apply them as one batch"""
+        peer = peer.rstrip("/")
+        started = time.monotonic()
+        cursor = self._cursors.get(peer, {})
+        since = cursor.get("revision", 0)
+        report = {"peer": peer, "from": since, "pages": 0, "bytes": 0, "changes": 0, "applied": 0, "stale": 0}
+        try:
+            with span("station_sync.pull", peer=peer):
+                pending, source = {}, None
+                while True:
+                    page, size = self._fetch(peer, since)
+                    if cursor.get("source") not in (None, page["source"]) and since:
+                        # The peer's history was rebuilt: our revision means nothing there any more
+                        log.info("Station history of %s changed, pulling everything", peer)
+                        cursor, since, pending = {}, 0, {}
+                        continue
+                    source = page["source"]
+                    report["pages"] += 1
+                    report["bytes"] += size
+                    for change in page["changes"]:
+                        pending[change["name"]] = change
+                    since = page["next"]
+                    if not page["more"]:
+                        break
+                if pending:
+                    with self.lock:
+                        report["applied"], report["stale"] = self._apply(list(pending.values()))
+            report["changes"] = len(pending)
+            report["to"] = since
+            self._cursors[peer] = {"source": source, "revision": since}
+            self.save()
+        except Exception as e:
+            log.warning("Error pulling stations from %s: %s", peer, e)
+            report["error"] = str(e)
+        report["ms"] = round((time.monotonic() - started) * 1000, 1)
+        report["at"] = round(time.time(), 3)
+        self._reports[peer] = report
+        if report["applied"]:
+            log.info("Applied %d station changes from %s (revision %s to %s)", report["applied"], peer,
+                     report["from"], report.get("to"), extra={"sync": report})
+        return report
+
+    def _apply(self, changes):
+        """Apply the changes newer than the local ones; returns (applied, skipped as stale)"""
+        if self.change_log is None:
+            return self.station_manager.apply_changes(changes), 0
+        newer = [change for change in changes if self.change_log.is_newer(change)]
+        with self.change_log.adopting(newer):
+            return self.station_manager.apply_changes(newer), len(changes) - len(newer)
+
+    def pull_all(self):
+        return [self.pull(peer) for peer in self.peers]
+
+    def status(self):
+        return {"peers": self.peers, "interval": self.interval, "cursors": self._cursors,
+                "last": list(self._reports.values())}
+
+    # Background thread
+
+    def start(self):
+        """Start pulling every `interval` seconds when peers are configured"""
+        if not self.peers or not self.interval:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="station-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def _run(self):
+        while self._running:
+            self.pull_all()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+# Two instances when run directly: B follows a 20,000 station A through /stations/changes
+if __name__ == "__main__":
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+    from stations import StationManager
+
+    workdir = tempfile.mkdtemp()
+    site_a = StationManager(os.path.join(workdir, "a.json"))
+    site_a.replace_stations([{"name": f"Station {i}", "uri": f"http://radio.example/{i}.mp3"} for i in range(20000)])
+    changes_a = StationChangeLog(site_a, os.path.join(workdir, "a_changes.json"))
+
+    class ChangesHandler(BaseHTTPRequestHandler):
+        """The /stations/changes route of dashboard A"""
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            body = json.dumps(changes_a.changes(query.get("since", ["0"])[0], query.get("limit", ["1000"])[0]))
+            data = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChangesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    peer = f"http://127.0.0.1:{server.server_address[1]}"
+
+    site_b = StationManager(os.path.join(workdir, "b.json"))
+    changes_b = StationChangeLog(site_b, os.path.join(workdir, "b_changes.json"))
+    sync_b = StationSync(site_b, [peer], os.path.join(workdir, "b_sync.json"), change_log=changes_b)
+
+    first = sync_b.pull(peer)
+    print(f"first pull: {first['changes']} changes in {first['pages']} pages, {first['bytes'] / 1024:.0f} KB, "
+          f"{first['ms']:.0f} ms")
+
+    site_a.add_station("Station 7", "http://radio.example/7-hq.aac")
+    site_a.add_station("New Station", "http://radio.example/new.mp3")
+    site_a.remove_stations(["Station 10", "Station 11"])
+    second = sync_b.pull(peer)
+    print(f"after 4 edits on A: {second['changes']} changes, {second['bytes']} bytes, {second['ms']:.1f} ms "
+          f"(revision {second['from']} -> {second['to']})")
+    idle = sync_b.pull(peer)
+    print(f"nothing new: {idle['changes']} changes, {idle['bytes']} bytes, {idle['ms']:.1f} ms")
+
+    names_a = {s["name"]: s["uri"] for s in site_a.stations}
+    names_b = {s["name"]: s["uri"] for s in site_b.stations}
+    assert names_a.items() <= names_b.items(), "B should hold every station of A"
+    assert "Station 10" not in names_b and names_b["Station 7"].endswith("7-hq.aac")
+    assert second["changes"] == 4 and second["bytes"] < 2000 and idle["changes"] == 0
+    # B's own revisions for the synced stations don't bounce back to A as changes
+    assert changes_b.changes(changes_b.revision)["changes"] == []
+    server.shutdown()
+    print("OK")
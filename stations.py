@@ -5,6 +5,11 @@ Handles loading, saving, and managing radio station presets
 """
 import os
 import json
+import logging
+
+from tracing import span
+
+log = logging.getLogger(__name__)
 
 # Default preset stations that come with the application
 DEFAULT_STATIONS = [
@@ -18,7 +23,26 @@ class StationManager:
         """Initialize with path to stations file"""
         self.stations_file = stations_file
         self._stations = None
+        # False while the list is the built-in defaults that were never saved
+        self.saved = False
+        self._listeners = []
         self.load()
+
+    def add_listener(self, callback):
+        """Call callback(event, data) after every change
+
+        event is "add" or "remove" with the station dict, "update" with
+        {"old": ..., "new": ...} when a station is changed in place, or "reset"
+        with the whole new list (load, import, replace, reset to defaults).
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, event, data):
+        for callback in self._listeners:
+            try:
+                callback(event, data)
+            except Exception:
+                log.exception("Error in station listener")
     
     @property
     def stations(self):
@@ -31,18 +55,23 @@ class StationManager:
         """Load stations from file or use defaults if file doesn't exist"""
         try:
             if os.path.exists(self.stations_file):
-                with open(self.stations_file, 'r') as f:
+                with span("stations.load", file=self.stations_file), open(self.stations_file, 'r') as f:
                     self._stations = json.load(f)
-                    print(f"Loaded {len(self._stations)} stations from {self.stations_file}")
+                    self.saved = True
+                    log.info("Loaded %d stations from %s", len(self._stations), self.stations_file)
+                    self._notify("reset", self._stations)
                     return self._stations
             else:
-                print(f"Stations file {self.stations_file} not found, using defaults")
+                log.info("Stations file %s not found, using defaults", self.stations_file)
                 self._stations = DEFAULT_STATIONS.copy()
+                self.saved = False
                 # Do NOT save immediately – wait for user action
         except Exception as e:
-            print(f"Error loading stations: {e}")
+            log.error("Error loading stations: %s", e)
             self._stations = DEFAULT_STATIONS.copy()
+            self.saved = False
 
+        self._notify("reset", self._stations)
         return self._stations
 
 
@@ -52,12 +81,13 @@ class StationManager:
             # Create directory if it doesn't exist
             os.makedirs(os.path.dirname(self.stations_file) or '.', exist_ok=True)
             
-            with open(self.stations_file, 'w') as f:
+            with span("stations.save", stations=len(self._stations)), open(self.stations_file, 'w') as f:
                 json.dump(self._stations, f)
-            print(f"Saved {len(self._stations)} stations to {self.stations_file}")
+            self.saved = True
+            log.debug("Saved %d stations to %s", len(self._stations), self.stations_file)
             return True
         except Exception as e:
-            print(f"Error saving stations: {e}")
+            log.error("Error saving stations: %s", e)
             return False
     
     def export_json(self, filename):
@@ -67,7 +97,7 @@ class StationManager:
                 json.dump(self._stations, f, indent=2)
             return True
         except Exception as e:
-            print(f"Error exporting stations to JSON: {e}")
+            log.error("Error exporting stations to JSON: %s", e)
             return False
     
     def import_json(self, filename, replace=False):
@@ -82,6 +112,7 @@ class StationManager:
                 
             if replace:
                 self._stations = imported
+                self._notify("reset", self._stations)
             else:
                 # Merge with existing stations, avoiding duplicates by name
                 existing_names = {s['name'] for s in self._stations}
@@ -89,11 +120,12 @@ class StationManager:
                     if station['name'] not in existing_names:
                         self._stations.append(station)
                         existing_names.add(station['name'])
+                        self._notify("add", station)
             
             self.save()
             return True
         except Exception as e:
-            print(f"Error importing stations from JSON: {e}")
+            log.error("Error importing stations from JSON: %s", e)
             return False
     
     def add_station(self, name, uri):
@@ -102,21 +134,29 @@ class StationManager:
         for i, station in enumerate(self._stations):
             if station['name'] == name:
                 # Update existing station
-                self._stations[i] = {"name": name, "uri": uri}
+                self._replace(i, {"name": name, "uri": uri})
                 self.save()
                 return True
         
         # Add new station
         self._stations.append({"name": name, "uri": uri})
+        self._notify("add", self._stations[-1])
         self.save()
         return True
     
+    def _replace(self, i, station):
+        old, self._stations[i] = self._stations[i], station
+        if old != station:
+            self._notify("update", {"old": old, "new": station})
+
     def remove_station(self, name):
         """Remove a station by name"""
-        initial_count = len(self._stations)
+        removed = [s for s in self._stations if s['name'] == name]
         self._stations = [s for s in self._stations if s['name'] != name]
-        
-        if len(self._stations) < initial_count:
+        for station in removed:
+            self._notify("remove", station)
+
+        if removed:
             self.save()
             return True
         return False
@@ -126,10 +166,12 @@ class StationManager:
         if not names:
             return False
             
-        initial_count = len(self._stations)
+        removed = [s for s in self._stations if s['name'] in names]
         self._stations = [s for s in self._stations if s['name'] not in names]
-        
-        if len(self._stations) < initial_count:
+        for station in removed:
+            self._notify("remove", station)
+
+        if removed:
             self.save()
             return True
         return False
@@ -141,9 +183,47 @@ class StationManager:
                 return station
         return None
     
+    def apply_changes(self, changes):
+        """Apply a batch of {"name", "station"} changes (station None removes it) with one save
+
+        Returns how many changes modified the list; ones already in effect are skipped.
+        """
+        index = {s['name']: i for i, s in enumerate(self._stations)}
+        removed = set()
+        applied = 0
+        for change in changes:
+            name, station = change['name'], change.get('station')
+            i = index.get(name)
+            if station is None:
+                if i is not None and i not in removed:
+                    removed.add(i)
+                    self._notify("remove", self._stations[i])
+                    applied += 1
+            elif i is None or i in removed:
+                self._stations.append(dict(station))
+                index[name] = len(self._stations) - 1
+                self._notify("add", self._stations[-1])
+                applied += 1
+            elif self._stations[i] != station:
+                self._replace(i, dict(station))
+                applied += 1
+
+        if removed:
+            self._stations = [s for i, s in enumerate(self._stations) if i not in removed]
+        if applied:
+            self.save()
+        return applied
+
+    def replace_stations(self, stations):
+        """Replace the whole station list"""
+        self._stations = list(stations)
+        self._notify("reset", self._stations)
+        return self.save()
+
     def reset_to_defaults(self):
         """Reset to default stations"""
         self._stations = DEFAULT_STATIONS.copy()
+        self._notify("reset", self._stations)
         self.save()
         return True
 
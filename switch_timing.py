@@ -0,0 +1,261 @@
+# switch_timing.py
+"""
+Station Switch Timing
+Click-to-sound measurement: each station switch is timestamped from the HTTP
+request through SetAVTransportURI and Play to the first TRANSITIONING and
+PLAYING transport states, kept as a rolling history with per-station percentiles
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+# Phases of a switch, as milliseconds after the request arrived
+PHASES = ("set_uri_ms", "play_ms", "transitioning_ms", "playing_ms")
+
+FORMATS = {
+    ".m3u8": "hls", ".m3u": "m3u", ".pls": "pls", ".asx": "asx", ".mp3": "mp3",
+    ".aac": "aac", ".ogg": "ogg", ".opus": "opus", ".flac": "flac", ".wav": "wav",
+}
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def stream_format(uri):
+    """Rough container/playlist type of a stream URI, from its path extension"""
+    path = urlparse(uri or "").path.lower()
+    for extension, name in FORMATS.items():
+        if path.endswith(extension):
+            return name
+    return "stream"
+
+
+def summarize(entries):
+    """Count, p50/p90/p99 click-to-sound and median phases of a set of switches"""
+    played = [entry for entry in entries if entry["outcome"] == "playing"]
+    audio = [entry["playing_ms"] for entry in played]
+    summary = {
+        "switches": len(entries),
+        "failed": sum(1 for entry in entries if entry["outcome"] in ("timeout", "error")),
+        "p50_ms": _percentile(audio, 0.5),
+        "p90_ms": _percentile(audio, 0.9),
+        "p99_ms": _percentile(audio, 0.99),
+    }
+    for phase in PHASES[:3]:
+        summary[phase.replace("_ms", "_p50_ms")] = _percentile(
+            [entry[phase] for entry in played if entry[phase] is not None], 0.5)
+    return summary
+
+
+class SwitchTimer:
+    def __init__(self, device, history_file="switch_times.json", keep=500, poll_interval=0.05, timeout=20.0):
+        """
+        device: HeosDevice whose transport state is watched after each switch
+        poll_interval: seconds between GetTransportInfo calls while a switch is pending
+        timeout: seconds after which a switch that never reached PLAYING is recorded as a timeout
+        """
+        self.device = device
+        self.history_file = history_file
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=keep)
+        self._pending = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+        self.load()
+
+    # Persistence
+
+    def load(self):
+        try:
+            if self.history_file and os.path.exists(self.history_file):
+                with open(self.history_file, 'r') as f:
+                    self._history.extend(json.load(f).get("switches", []))
+        except Exception as e:
+            log.error("Error loading switch timings: %s", e)
+        return len(self._history)
+
+    def save(self):
+        if not self.history_file:
+            return True
+        try:
+            with self._lock:
+                data = {"switches": list(self._history)}
+            tmp_file = self.history_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.history_file)
+            return True
+        except Exception as e:
+            log.error("Error saving switch timings: %s", e)
+            return False
+
+    # Recording
+
+    def begin(self, station, uri, clicked, uri_set, played, error=None):
+        """Start timing a switch; clicked/uri_set/played are time.monotonic() readings
+
+        The monotonic clock is system-wide, so a web worker can pass its own
+        readings to the state daemon.
+        """
+        entry = {
+            "id": uuid.uuid4().hex[:12],
+            "station": station or uri,
+            "uri": uri,
+            "format": stream_format(uri),
+            "device": f"{self.device.ip}:{self.device.port}",
+            "started_at": round(time.time() - (time.monotonic() - clicked), 3),
+            "set_uri_ms": round((uri_set - clicked) * 1000, 1),
+            "play_ms": round((played - clicked) * 1000, 1),
+            "transitioning_ms": None,
+            "playing_ms": None,
+            "outcome": "pending",
+            "poll_ms": round(self.poll_interval * 1000),
+        }
+        with self._lock:
+            previous, self._pending = self._pending, (entry, clicked)
+        if previous is not None:
+            self._finish(previous[0], "superseded")
+        if error:
+            with self._lock:
+                self._pending = None
+            entry["error"] = error
+            self._finish(entry, "error")
+            return entry
+        self.start()
+        self._wake.set()
+        return entry
+
+    def _finish(self, entry, outcome):
+        entry["outcome"] = outcome
+        with self._lock:
+            self._history.append(entry)
+        if outcome == "playing":
+            log.info("Station %s playing %.0f ms after the click", entry["station"], entry["playing_ms"],
+                     extra={"switch": entry})
+        else:
+            log.info("Station switch to %s ended as %s", entry["station"], outcome, extra={"switch": entry})
+        self.save()
+
+    def poll_once(self):
+        """Check the transport of the pending switch; returns False once nothing is pending"""
+        with self._lock:
+            pending = self._pending
+        if pending is None:
+            return False
+        entry, clicked = pending
+        state = self.device.get_status().get("Transport State")
+        elapsed = round((time.monotonic() - clicked) * 1000, 1)
+        with self._lock:
+            if self._pending is not pending:
+                return True
+            if state == "TRANSITIONING" and entry["transitioning_ms"] is None:
+                entry["transitioning_ms"] = elapsed
+            done = None
+            if state == "PLAYING":
+                entry["playing_ms"] = elapsed
+                done = "playing"
+            elif elapsed > self.timeout * 1000:
+                done = "timeout"
+            if done:
+                self._pending = None
+        if done:
+            self._finish(entry, done)
+        return True
+
+    # Queries
+
+    def history(self, limit=50, station=None):
+        """Most recent switches first, including one still in flight"""
+        with self._lock:
+            entries = list(self._history)
+            if self._pending is not None:
+                entries.append(dict(self._pending[0]))
+        entries = [entry for entry in entries if station is None or entry["station"] == station]
+        return entries[::-1][:limit]
+
+    def summary(self, since=None):
+        """Overall, per-station, per-format and per-device percentiles"""
+        with self._lock:
+            entries = [entry for entry in self._history
+                       if entry["outcome"] != "pending" and (since is None or entry["started_at"] >= since)]
+        report = {"overall": summarize(entries)}
+        for key, label in (("station", "stations"), ("format", "formats"), ("device", "devices")):
+            groups = {}
+            for entry in entries:
+                groups.setdefault(entry[key], []).append(entry)
+            report[label] = sorted(({key: name, **summarize(group)} for name, group in groups.items()),
+                                   key=lambda row: -(row["p50_ms"] or float("inf")))
+        return report
+
+    # Watcher thread
+
+    def start(self):
+        """Start the watcher thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="switch-timer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def _run(self):
+        while self._running:
+            try:
+                active = self.poll_once()
+            except Exception as e:
+                log.warning("Error watching station switch: %s", e)
+                active = True
+            # Poll fast while a switch is in flight, otherwise sleep until the next one
+            self._wake.wait(self.poll_interval if active else None)
+            self._wake.clear()
+
+
+# Example usage when run directly: click-to-sound against fake renderers of varying speed
+if __name__ == "__main__":
+    import random
+    from heos_api import HeosDevice
+    from fake_renderer import FakeRenderer
+
+    stations = {"Fast MP3": "http://radio.example/fast.mp3", "Slow playlist": "http://radio.example/slow.pls",
+                "HLS": "http://radio.example/live/index.m3u8"}
+    # How long each kind of stream takes to start buffering on this (fake) receiver
+    buffering = {"mp3": 0.15, "pls": 0.6, "hls": 1.1}
+
+    renderer = FakeRenderer(latency=0.02, jitter=0.02).start()
+    device = HeosDevice(renderer.ip, renderer.port)
+    timer = SwitchTimer(device, history_file=None)
+    for switch in range(15):
+        name, uri = random.choice(list(stations.items()))
+        renderer.start_delay = buffering[stream_format(uri)] * random.uniform(0.8, 1.3)
+        clicked = time.monotonic()
+        device.set_uri(uri)
+        uri_set = time.monotonic()
+        device.play()
+        timer.begin(name, uri, clicked, uri_set, time.monotonic())
+        while timer.history(1)[0]["outcome"] == "pending":
+            time.sleep(0.05)
+    timer.stop()
+    renderer.stop()
+
+    for row in timer.summary()["stations"]:
+        print(f"{row['station']:>14}: {row['switches']} switches, click-to-sound p50 {row['p50_ms']} ms, "
+              f"p90 {row['p90_ms']} ms (SetAVTransportURI {row['set_uri_p50_ms']} ms, "
+              f"Play {row['play_p50_ms']} ms, TRANSITIONING {row['transitioning_p50_ms']} ms)")
@@ -0,0 +1,45 @@
+import os
+import sys
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import copy
+import json
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def renderer():
+    """A fake receiver for the whole test session"""
+    from fake_renderer import FakeRenderer
+
+    renderer = FakeRenderer().start()
+    yield renderer
+    renderer.stop()
+
+
+@pytest.fixture(scope="session")
+def dashboard(renderer, tmp_path_factory):
+    """The app module, imported in a scratch directory with its device on the fake renderer
+
+    app.py builds its services at import time from ./config.json and keeps its
+    data files relative to the working directory, so the directory stays
+    switched for the session.
+    """
+    from config import DEFAULT_CONFIG
+
+    workdir = tmp_path_factory.mktemp("dashboard")
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config["device"].update(ip=renderer.ip, port=renderer.port)
+    config["app"].update(debug=False, media_servers=[])
+    (workdir / "config.json").write_text(json.dumps(config))
+
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app
+        yield app
+    finally:
+        os.chdir(previous)
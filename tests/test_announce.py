@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from announce import Announcer
+from fake_renderer import FakeRenderer
+from heos_api import HeosDevice
+
+CHIME, CLIP_LENGTH = "http://127.0.0.1/chime.mp3", 1.5
+TRACK = "http://nas/album/track3.flac"
+
+
+class FlakyRenderer(FakeRenderer):
+    """Answers the actions in `failing` with a UPnP fault"""
+
+    failing = ()
+
+    def handle_action(self, action, body):
+        if action in self.failing:
+            return None
+        return super().handle_action(action, body)
+
+
+@pytest.fixture
+def playing():
+    # 20 ms per SOAP call and 150 ms of buffering before audio starts, like a receiver on Wi-Fi
+    renderer = FlakyRenderer(latency=0.02, start_delay=0.15, durations={CHIME: CLIP_LENGTH, TRACK: 300}).start()
+    device = HeosDevice(renderer.ip, renderer.port)
+    device.set_uri(TRACK, "<DIDL-Lite>track 3</DIDL-Lite>")
+    device.play()
+    device.set_volume(25)
+    time.sleep(0.5)
+    yield renderer, device
+    renderer.stop()
+
+
+def test_interrupts_for_the_clip_and_restores(playing):
+    renderer, device = playing
+    report = Announcer(device, volume=55).announce(CHIME)
+
+    assert report["outcome"] == "completed"
+    assert renderer.uri == TRACK and renderer.state in ("TRANSITIONING", "PLAYING")
+    assert renderer.metadata == "<DIDL-Lite>track 3</DIDL-Lite>" and renderer.volume == 25
+    assert 55 in [args["volume"] for _, action, args in renderer.log if action == "SetVolume"]
+    # The clip itself plus detection (one poll) and a few round trips, nothing like a fixed sleep
+    assert report["interrupt_ms"] < CLIP_LENGTH * 1000 + 500, report["interrupt_ms"]
+    assert report["restore_ms"] < 150, report["restore_ms"]
+
+
+def test_unreadable_volume_is_left_alone(playing):
+    renderer, device = playing
+    renderer.failing = ("GetVolume",)
+    report = Announcer(device, volume=55).announce(CHIME)
+
+    assert report["outcome"] == "completed"
+    assert report["volume"] is None
+    assert renderer.volume == 25
+    assert [args["volume"] for _, action, args in renderer.log if action == "SetVolume"] == [25]
+    assert renderer.uri == TRACK
+
+
+def test_unreadable_media_info_skips_the_announcement(playing):
+    renderer, device = playing
+    renderer.failing = ("GetMediaInfo",)
+    report = Announcer(device, volume=55).announce(CHIME)
+
+    assert report["outcome"].startswith("skipped")
+    assert CHIME not in [args.get("uri") for _, action, args in renderer.log if action == "SetAVTransportURI"]
+    assert renderer.uri == TRACK and renderer.volume == 25
@@ -0,0 +1,50 @@
+import pytest
+from flask import Flask
+
+import assets
+from assets import AssetError, StaticAssets, missing_vendor
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    """A static tree with one pinned vendor file whose content is known"""
+    data = b"body{margin:0}"
+    monkeypatch.setattr(assets, "VENDOR", {"vendor/tiny.css": ("https://cdn.example/tiny.css", assets._sri(data))})
+    (tmp_path / "static" / "vendor").mkdir(parents=True)
+    return tmp_path / "static", data
+
+
+def test_shipped_vendor_files_pass_the_check():
+    assert missing_vendor() == []
+
+
+def test_missing_vendor_files_refuse_to_start(static_dir):
+    static, _ = static_dir
+    assert missing_vendor(str(static)) == ["vendor/tiny.css"]
+    with pytest.raises(AssetError, match="vendor/tiny.css"):
+        StaticAssets(Flask(__name__), static_dir=str(static))
+
+
+def test_corrupt_vendor_file_counts_as_missing(static_dir):
+    static, _ = static_dir
+    (static / "vendor" / "tiny.css").write_bytes(b"tampered")
+    assert missing_vendor(str(static)) == ["vendor/tiny.css"]
+
+
+def test_vendored_files_are_served_locally(static_dir):
+    static, data = static_dir
+    (static / "vendor" / "tiny.css").write_bytes(data)
+    app = Flask(__name__)
+    static_assets = StaticAssets(app, static_dir=str(static))
+    with app.test_request_context():
+        url = static_assets.url("vendor/tiny.css")
+    assert url.startswith("/assets/vendor/tiny.")
+    assert app.test_client().get(url).data == data
+
+
+def test_cdn_only_with_explicit_fallback(static_dir):
+    static, _ = static_dir
+    app = Flask(__name__)
+    static_assets = StaticAssets(app, static_dir=str(static), cdn_fallback=True)
+    with app.test_request_context():
+        assert static_assets.url("vendor/tiny.css") == "https://cdn.example/tiny.css"
@@ -0,0 +1,69 @@
+import json
+
+from catalog import CatalogStore, _synthetic_dump
+
+
+def test_store_without_catalog(tmp_path):
+    store = CatalogStore(str(tmp_path / "catalog.idx"))
+    assert store.get(0) is None
+    assert store.page(0, 10) == []
+
+
+def test_store_pages_and_gets_without_wrapping(tmp_path):
+    dump = tmp_path / "dump.ndjson"
+    _synthetic_dump(str(dump), 30)
+    store = CatalogStore(str(tmp_path / "catalog.idx"))
+    assert store.import_dump(str(dump)) == 30
+
+    assert store.get(0)["index"] == 0
+    assert store.get(-1) is None and store.get(30) is None
+    assert [station["index"] for station in store.page(-5, 3)] == [0, 1, 2]
+    assert len(store.page(25, 10)) == 5
+
+
+def test_catalog_routes_clamp_and_404(dashboard):
+    client = dashboard.app.test_client()
+    assert client.get("/api/catalog?start=-5&count=3").status_code == 200
+    response = client.post("/add_catalog_station", data={"index": "-1"})
+    assert response.status_code == 404
+
+
+def test_import_skips_invalid_rows(tmp_path):
+    rows = [
+        {"name": "Good", "url": "http://a.example/live", "bitrate": "128", "tags": "jazz, news"},
+        {"name": 1234, "url": "http://b.example/live", "bitrate": -64},
+        {"name": ["not", "text"], "url": "http://c.example/live"},
+        {"name": "No URI", "url": {"href": "http://d.example"}},
+        {"name": "Huge", "url": "http://e.example/live", "bitrate": 10 ** 9, "tags": [1, None, "rock"]},
+        {"name": "Odd bitrate", "url": "http://f.example/live", "bitrate": "fast", "codec": 3},
+        {"name": "Again", "url": "http://a.example/live"},
+        "not a row",
+    ]
+    dump = tmp_path / "dump.ndjson"
+    dump.write_text("\n".join(json.dumps(row) for row in rows) + "\n{broken\n")
+    store = CatalogStore(str(tmp_path / "catalog.idx"))
+
+    assert store.import_dump(str(dump)) == 4
+    stations = {station["name"]: station for station in store.page(0, 10)}
+    assert stations["Good"]["bitrate"] == 128 and stations["Good"]["tags"] == ["jazz", "news"]
+    assert stations["1234"]["bitrate"] == 0
+    assert stations["Huge"]["bitrate"] == 65535 and stations["Huge"]["tags"] == ["1", "rock"]
+    assert stations["Odd bitrate"]["bitrate"] == 0 and stations["Odd bitrate"]["codec"] == "3"
+
+
+def test_search_pairs_results_with_the_catalog_it_searched(tmp_path):
+    first, second = tmp_path / "first.ndjson", tmp_path / "second.ndjson"
+    first.write_text(json.dumps({"name": "Jazz One", "url": "http://one.example/live"}) + "\n")
+    second.write_text(json.dumps({"name": "Rock Two", "url": "http://two.example/live"}) + "\n")
+    store = CatalogStore(str(tmp_path / "catalog.idx"))
+    store.import_dump(str(first))
+    store.search("jazz")
+
+    # An import lands between the index lookup and reading the URIs
+    index = store._search_index
+    search = index.search
+    index.search = lambda query, limit: (store.import_dump(str(second)), search(query, limit))[1]
+
+    results = store.search("jazz")
+    assert [result["uri"] for result in results] == ["http://one.example/live"]
+    assert [result["uri"] for result in store.search("rock")] == ["http://two.example/live"]
@@ -0,0 +1,39 @@
+import re
+
+
+def _title(html):
+    return re.search(r"<title>(.*?)</title>", html, re.S).group(1)
+
+
+def test_now_playing_poller_renders_once_in_the_body(dashboard, renderer):
+    dashboard.device.set_address(renderer.ip, renderer.port)
+    html = dashboard.app.test_client().get("/").get_data(as_text=True)
+
+    assert _title(html).strip() == "HEOS Dashboard"
+    assert html.count("function refreshNowPlaying") == 1
+    assert html.index("function refreshNowPlaying") > html.index("</title>")
+
+
+def test_offline_reload_script_renders_once_in_the_body(dashboard, renderer):
+    dashboard.device.set_address("127.0.0.1", 1)
+    try:
+        html = dashboard.app.test_client().get("/").get_data(as_text=True)
+    finally:
+        dashboard.device.set_address(renderer.ip, renderer.port)
+
+    assert 'id="offlineBanner"' in html
+    assert "<script" not in _title(html)
+    assert html.count("/api/device_health") == 1
+    assert html.index("/api/device_health") > html.index("</title>")
+
+
+def test_icy_lookup_is_limited_to_known_streams(dashboard, monkeypatch):
+    monkeypatch.setattr(dashboard.icy, "get_metadata", lambda uri: {"uri": uri, "title": "Song"})
+    client = dashboard.app.test_client()
+
+    response = client.get("/api/icy", query_string={"uri": "http://169.254.169.254/latest/meta-data"})
+    assert response.status_code == 403
+
+    saved = dashboard.station_manager.stations[0]["uri"]
+    response = client.get("/api/icy", query_string={"uri": saved})
+    assert response.status_code == 200 and response.get_json()["title"] == "Song"
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from fade import FadeError, VolumeFader
+from heos_api import HeosDevice
+
+
+def test_zero_duration_fades_always_return_their_state(renderer):
+    fader = VolumeFader(HeosDevice(renderer.ip, renderer.port))
+    for level in range(20, 40):
+        fade = fader.fade(level, 0, start=10)
+        assert fade["to"] == level
+    fader.cancel()
+
+
+def test_fade_on_an_unreachable_device_returns_its_state():
+    # set_volume fails fast once the breaker is open, so the fade thread can finish first
+    device = HeosDevice("127.0.0.1", 1)
+    device.get_volume_level()
+    fader = VolumeFader(device)
+    for _ in range(20):
+        assert fader.fade(30, 0, start=10)["to"] == 30
+
+
+def test_duck_refuses_when_the_volume_cannot_be_read():
+    fader = VolumeFader(HeosDevice("127.0.0.1", 1))
+    with pytest.raises(FadeError):
+        fader.duck(5)
+    # Nothing remembered, so a later restore can't turn the receiver down to 0
+    assert fader.restore() is None
+
+
+def test_duck_and_restore(renderer):
+    device = HeosDevice(renderer.ip, renderer.port)
+    device.set_volume(35)
+    fader = VolumeFader(device, step_interval=0.02)
+    fader.duck(5, duration=0.05)
+    fader._thread.join()
+    assert renderer.volume == 5
+
+    fader.restore(duration=0.05)
+    fader._thread.join()
+    assert renderer.volume == 35
+
+
+class BlockingDevice:
+    """Device stub whose volume requests hang until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.levels = []
+
+    def get_volume_level(self):
+        return 10
+
+    def set_volume(self, level):
+        self.release.wait(5)
+        self.levels.append(level)
+
+
+def test_fade_and_cancel_do_not_wait_for_a_request_in_flight():
+    device = BlockingDevice()
+    fader = VolumeFader(device, step_interval=0.01)
+    fader.fade(50, 0.05, start=10)
+    time.sleep(0.05)  # the first step is now stuck in set_volume
+
+    started = time.monotonic()
+    replaced = fader.fade(20, 0, start=40)
+    fader.cancel()
+    assert time.monotonic() - started < 0.5
+    assert replaced["to"] == 20
+
+    device.release.set()
+    fader.cancel(wait=True)
+    # The stuck step lands first; nothing from the cancelled fades follows it
+    assert len(device.levels) == 1
+
+
+def test_concurrent_fades_leave_one_running():
+    device = BlockingDevice()
+    device.release.set()
+    fader = VolumeFader(device, step_interval=0.01)
+    barrier = threading.Barrier(8)
+
+    def start(level):
+        barrier.wait()
+        fader.fade(level, 0.2, start=0)
+
+    threads = [threading.Thread(target=start, args=(level,)) for level in range(10, 90, 10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    fader._thread.join()
+    target = fader.last_report["to"]
+    assert not fader.last_report["cancelled"]
+    assert device.levels[-1] == target
+    assert fader.status()["active"] is None
@@ -0,0 +1,57 @@
+import time
+
+from health import DeviceHealth, CLOSED, OPEN
+
+
+def _wait(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_breaker_opens_and_probe_closes_it():
+    answers = [False, True]
+    health = DeviceHealth(lambda timeout: answers.pop(0), probe_interval=0.02, max_probe_interval=0.05)
+    health.record_failure(OSError("unreachable"))
+    assert health.state == OPEN and not health.allow_request()
+
+    assert _wait(lambda: health.state == CLOSED)
+    assert answers == []
+
+
+def test_probe_does_not_reopen_a_breaker_closed_by_a_request():
+    probes = []
+    health = DeviceHealth(lambda timeout: probes.append(timeout) or False, probe_interval=0.05)
+    health.record_failure(OSError("unreachable"))
+    # A request gets through before the first probe fires
+    health.record_success(0.01)
+
+    assert _wait(lambda: not health._probe_thread.is_alive())
+    assert health.state == CLOSED
+    assert probes == []
+
+
+def test_timeout_is_short_until_a_round_trip_is_measured():
+    health = DeviceHealth(lambda timeout: False, initial_timeout=0.5, max_timeout=5.0)
+    assert health.timeout == 0.5
+    health.record_success(0.02)
+    assert health.min_timeout <= health.timeout < health.max_timeout
+    health.reset()
+    assert health.timeout == 0.5
+
+
+def test_first_request_connects_with_the_short_timeout(renderer):
+    from heos_api import HeosDevice
+
+    device = HeosDevice(renderer.ip, renderer.port)
+    timeouts = []
+    post = device.session.post
+    device.session.post = lambda *args, **kwargs: timeouts.append(kwargs["timeout"]) or post(*args, **kwargs)
+
+    device.get_status()
+    device.get_status()
+    assert timeouts[0] == (device.health.initial_timeout, device.health.max_timeout)
+    assert timeouts[1][0] == timeouts[1][1] < device.health.max_timeout
@@ -0,0 +1,42 @@
+import io
+import json
+import socket
+
+from heos_api import HeosDevice
+from heos_cli import run_batch
+
+
+def test_batch_reports_unbalanced_quote_and_continues(renderer, capsys):
+    device = HeosDevice(renderer.ip, renderer.port)
+    script = io.StringIO('set_uri "http://radio.example/a.mp3\nvolume\n')
+
+    failures = run_batch(device, script, as_json=True)
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert failures == 1
+    assert [record["ok"] for record in records] == [False, True]
+    assert records[0]["error"].startswith("Parse error on line 1")
+
+
+def test_batch_stops_at_a_parse_error_when_asked(renderer, capsys):
+    device = HeosDevice(renderer.ip, renderer.port)
+    failures = run_batch(device, io.StringIO("play 'x\nvolume\n"), as_json=True, stop_on_error=True)
+
+    assert failures == 1
+    assert len(capsys.readouterr().out.splitlines()) == 1
+
+
+def test_batch_fails_every_command_against_an_unreachable_device(capsys):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # Nothing listens on the port any more: connections are refused
+    device = HeosDevice("127.0.0.1", port)
+
+    failures = run_batch(device, io.StringIO("status\nvolume\nplay\nset_uri http://radio.example/a.mp3\n"),
+                         as_json=True)
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert failures == 4
+    assert [record["ok"] for record in records] == [False, False, False, False]
+    assert records[1]["result"] is None
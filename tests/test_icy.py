@@ -0,0 +1,74 @@
+import time
+
+from icy import IcyMetadataService, IcyStandInServer
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_reader_follows_titles_and_stops_when_idle():
+    server = IcyStandInServer(["A - One", "B - Two"], metaint=1024, bytes_per_second=64000, title_seconds=0.2).start()
+    service = IcyMetadataService(idle_timeout=0.3)
+    try:
+        titles = []
+        token = service.subscribe(server.uri, lambda meta: titles.append(meta["title"]))
+        assert _wait(lambda: len(set(titles)) == 2)
+        service.unsubscribe(token)
+        assert _wait(lambda: service.active_readers() == [])
+    finally:
+        server.stop()
+
+
+def test_lookup_while_reader_retires_starts_a_new_reader():
+    server = IcyStandInServer(["A - One"], metaint=1024, bytes_per_second=64000).start()
+    service = IcyMetadataService(idle_timeout=0.2)
+    try:
+        service.get_metadata(server.uri)
+        first = service._readers[server.uri]
+        assert _wait(lambda: not first.is_alive())
+        # Whatever point the old reader was at, a lookup always ends with a live reader
+        service.get_metadata(server.uri)
+        assert service.active_readers() == [server.uri]
+        assert service._readers[server.uri].is_alive()
+
+        # Hammer lookups right at the idle boundary: every one must leave a live reader behind
+        for _ in range(20):
+            time.sleep(0.2)
+            service.get_metadata(server.uri)
+            reader = service._readers.get(server.uri)
+            assert reader is not None and reader.is_alive()
+    finally:
+        server.stop()
+
+
+def test_reader_limit_retires_the_idlest_reader_and_its_entries():
+    server = IcyStandInServer(["A - One"], metaint=1024, bytes_per_second=64000).start()
+    service = IcyMetadataService(max_readers=2)
+    first, second, third = (f"{server.uri}?n={n}" for n in range(3))
+    try:
+        service.get_metadata(first)
+        time.sleep(0.01)
+        service.get_metadata(second)
+        assert _wait(lambda: service.get_metadata(first)["title"] == "A - One")
+        retired = service._readers[second]
+
+        service.get_metadata(third)
+        assert service.active_readers() == sorted([first, third])
+        assert _wait(lambda: not retired.is_alive())
+        assert second not in service._cache and second not in service._last_lookup
+
+        # Subscribed readers are never retired: with none idle, the lookup is refused
+        tokens = [service.subscribe(uri, lambda meta: None) for uri in (first, third)]
+        refused = service.get_metadata(second)
+        assert refused["error"] and second not in service._last_lookup
+        assert service.active_readers() == sorted([first, third])
+        for token in tokens:
+            service.unsubscribe(token)
+    finally:
+        server.stop()
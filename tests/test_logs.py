@@ -0,0 +1,84 @@
+import io
+import json
+import logging
+import threading
+
+import pytest
+
+import logs
+
+
+@pytest.fixture
+def configure():
+    """setup_logging for one test, restoring the default setup afterwards"""
+    yield logs.setup_logging
+    logs.shutdown_logging()
+    logs.setup_logging()
+
+
+def test_text_is_the_default_format(configure):
+    stream = io.StringIO()
+    configure(stream=stream)
+    token = logs.request_id_var.set("req-1")
+    try:
+        logging.getLogger("test.logs").info("Saved %d stations", 3, extra={"stations": 3})
+    finally:
+        logs.request_id_var.reset(token)
+    logs.shutdown_logging()
+
+    line = stream.getvalue().strip()
+    assert line.endswith("INFO    test.logs [req-1] Saved 3 stations")
+    assert logs.stats()["format"] is None
+
+
+def test_json_format_is_opt_in(configure):
+    stream = io.StringIO()
+    configure({"format": "json"}, stream=stream)
+    assert logs.stats()["format"] == "json"
+    token = logs.request_id_var.set("req-2")
+    try:
+        logging.getLogger("test.logs").info("Saved %d stations", 3, extra={"stations": 3})
+    finally:
+        logs.request_id_var.reset(token)
+    logs.shutdown_logging()
+
+    entry = json.loads(stream.getvalue())
+    assert entry["msg"] == "Saved 3 stations" and entry["level"] == "INFO"
+    assert entry["request_id"] == "req-2" and entry["stations"] == 3
+
+
+class StuckStream:
+    """A sink that doesn't take writes until released, like a backed-up pipe"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lines = []
+
+    def write(self, text):
+        self.release.wait(5)
+        self.lines.append(text)
+
+    def flush(self):
+        pass
+
+
+def test_full_queue_drops_and_counts_records(configure):
+    stream = StuckStream()
+    configure({"queue_size": 2}, stream=stream)
+    log = logging.getLogger("test.logs")
+    for i in range(10):
+        log.info("record %d", i)
+
+    stats = logs.stats()
+    # One record is held by the stuck writer, two wait in the queue, the rest are dropped
+    assert stats["queue_size"] == 2 and stats["dropped"] >= 7
+
+    # Reconfiguring keeps the count
+    stream.release.set()
+    configure({"queue_size": 2}, stream=io.StringIO())
+    assert logs.stats()["dropped"] == stats["dropped"]
+
+
+def test_logging_status_route(dashboard):
+    reply = dashboard.app.test_client().get("/api/logging").get_json()
+    assert {"format", "queued", "queue_size", "dropped"} <= set(reply)
@@ -0,0 +1,87 @@
+import pytest
+
+from fake_media_server import FakeMediaServer
+from media_server import MediaLibrary, build_didl, parse_didl_objects
+
+
+@pytest.fixture
+def media():
+    server = FakeMediaServer(tracks=500).start()
+    yield server
+    server.stop()
+
+
+def make_library(media, **kwargs):
+    library = MediaLibrary(locations=[media.location], discover_timeout=0, prefetch=False, **kwargs)
+    server_id = library.discover(timeout=0)[0]["id"]
+    return library, server_id
+
+
+def browses(media, start):
+    return sum(1 for _, _, args in media.actions("Browse") if args["start"] == str(start))
+
+
+def test_build_didl_round_trips_through_the_parser():
+    item = {"id": "track-1", "parent_id": "albums/\"best\"", "title": "Rock & Roll <Live>",
+            "class": "object.item.audioItem.musicTrack", "artist": "AC/DC", "album": "If You Want Blood",
+            "album_art": "http://nas/art?id=1&size=300", "uri": "http://nas/media/1.flac?format=flac&id=1",
+            "protocol_info": "http-get:*:audio/flac:DLNA.ORG_OP=01", "duration": "0:04:13.000"}
+
+    containers, items = parse_didl_objects(build_didl(item))
+    assert containers == []
+    assert items == [item]
+
+    # Only the title and URI given: the defaults parse back too
+    _, items = parse_didl_objects(build_didl({"title": "Stream", "uri": "http://radio/live"}))
+    assert items[0]["class"] == "object.item.audioItem.musicTrack"
+    assert items[0]["protocol_info"] == "http-get:*:*:*" and items[0]["artist"] is None
+
+
+def test_browse_parses_containers_and_items(media):
+    library, server_id = make_library(media)
+    root = library.browse(server_id, "0")
+    assert [(c["id"], c["child_count"]) for c in root["containers"]] == [("tracks", 500), ("playlists", 0)]
+
+    page = library.browse(server_id, "tracks", 0, 10)
+    assert page["total"] == 500 and len(page["items"]) == 10
+    assert page["items"][0]["uri"].endswith("/media/1.mp3?format=mp3&id=1")
+
+
+def test_pages_are_cached_until_the_system_update_id_changes(media):
+    library, server_id = make_library(media, check_interval=0)
+    library.browse(server_id, "tracks", 0, 50)
+    library.browse(server_id, "tracks", 0, 50)
+    assert browses(media, 0) == 1
+
+    media.bump("playlists")
+    library.browse(server_id, "tracks", 0, 50)
+    assert browses(media, 0) == 2
+    assert library.cache_info()["invalidated"] >= 1
+
+
+def test_new_container_update_id_drops_the_containers_pages(media):
+    # A long check interval leaves the container UpdateID as the only signal
+    library, server_id = make_library(media, check_interval=3600)
+    library.browse(server_id, "0")
+    library.browse(server_id, "tracks", 0, 50)
+    library.browse(server_id, "tracks", 50, 50)
+
+    media.bump("tracks")
+    library.browse(server_id, "tracks", 100, 50)
+    library.browse(server_id, "tracks", 0, 50)
+    library.browse(server_id, "0")
+    assert browses(media, 0) == 3   # root once, tracks page 0 twice
+    assert library.cache_info()["invalidated"] == 2
+
+
+def test_least_recently_used_page_is_evicted(media):
+    library, server_id = make_library(media, cache_pages=2, check_interval=3600)
+    library.browse(server_id, "tracks", 0, 10)
+    library.browse(server_id, "tracks", 10, 10)
+    library.browse(server_id, "tracks", 0, 10)      # page 0 is now the most recent
+    library.browse(server_id, "tracks", 20, 10)     # evicts page 10
+
+    library.browse(server_id, "tracks", 0, 10)
+    library.browse(server_id, "tracks", 10, 10)
+    assert browses(media, 0) == 1 and browses(media, 10) == 2
+    assert library.cache_info()["pages"] == 2
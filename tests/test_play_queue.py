@@ -0,0 +1,167 @@
+import threading
+
+from play_queue import PlayQueue
+
+
+class RacingDevice:
+    """Renderer stub: a user play() lands while poll_once is asking for the track"""
+
+    def __init__(self):
+        self.state, self.track_uri = "PLAYING", "http://nas/a.flac"
+        self.during_poll = None
+        self.calls = []
+
+    def get_status(self):
+        return {"Transport State": self.state}
+
+    def get_position_info(self):
+        reading = {"TrackURI": self.track_uri}
+        if self.during_poll:
+            self.during_poll, during = None, self.during_poll
+            during()
+        return reading
+
+    def set_uri(self, uri, metadata=""):
+        self.calls.append(("set_uri", uri))
+        self.track_uri, self.state = uri, "STOPPED"
+        return "ok"
+
+    def play(self):
+        self.calls.append(("play",))
+        return "ok"
+
+    def set_next_uri(self, uri, metadata=""):
+        return "<e>not supported"
+
+    def next(self):
+        return "<e>not supported"
+
+
+def make_queue():
+    device = RacingDevice()
+    queue = PlayQueue(device, queue_file=None)
+    for name in ("a", "b", "c", "d"):
+        queue.enqueue(f"http://nas/{name}.flac", name)
+    queue.start = lambda: None
+    return device, queue
+
+
+def test_stale_playing_reading_does_not_mark_a_new_item_as_played():
+    device, queue = make_queue()
+    queue.play(0)
+    device.state, device.track_uri = "PLAYING", "http://nas/a.flac"
+    device.during_poll = lambda: queue.play(2)
+
+    queue.poll_once()
+    assert queue.position == 2
+    assert queue._seen_playing is False
+
+    # c is still buffering (STOPPED); the queue must not skip past it
+    device.calls.clear()
+    queue.poll_once()
+    assert queue.position == 2
+    assert device.calls == []
+
+
+def test_stale_stopped_reading_does_not_skip_a_users_play():
+    device, queue = make_queue()
+    queue.play(0)
+    device.state, device.track_uri = "PLAYING", "http://nas/a.flac"
+    queue.poll_once()
+    device.state = "STOPPED"
+    done = threading.Event()
+    device.during_poll = lambda: (queue.play(3), done.set())
+
+    queue.poll_once()
+    assert done.is_set()
+    assert queue.position == 3
+    assert device.calls[-2:] == [("set_uri", "http://nas/d.flac"), ("play",)]
+
+
+def test_item_end_still_advances():
+    device, queue = make_queue()
+    queue.play(0)
+    device.state, device.track_uri = "PLAYING", "http://nas/a.flac"
+    queue.poll_once()
+    device.state = "STOPPED"
+    queue.poll_once()
+    assert queue.position == 1
+    assert ("set_uri", "http://nas/b.flac") in device.calls
+
+
+FAULT = ('<s:Fault xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"><detail><UPnPError xmlns="urn:schemas-upnp-org:control-1-0"><errorCode>{code}</errorCode>'
+         '</UPnPError></detail></s:Fault>')
+
+
+class StagingDevice(RacingDevice):
+    """Answers SetNextAVTransportURI from a script of replies"""
+
+    def __init__(self, replies):
+        super().__init__()
+        self.replies = list(replies)
+        self.staged = []
+
+    def set_next_uri(self, uri, metadata=""):
+        reply = self.replies.pop(0) if self.replies else ""
+        if reply == "":
+            self.staged.append(uri)
+        return reply
+
+
+def staging_queue(replies):
+    device = StagingDevice(replies)
+    queue = PlayQueue(device, queue_file=None)
+    queue.start = lambda: None
+    for name in ("a", "b", "c"):
+        queue.enqueue(f"http://nas/{name}.flac", name)
+    return device, queue
+
+
+def test_connection_error_keeps_gapless_and_retries_on_the_next_poll():
+    device, queue = staging_queue(["<e>Connection failed: timed out</e>"])
+    queue.play(0)
+    assert queue.gapless and queue.staged is None
+
+    device.state, device.track_uri = "PLAYING", "http://nas/a.flac"
+    queue.poll_once()
+    assert queue.gapless
+    assert device.staged == ["http://nas/b.flac"]
+    assert queue.staged == queue.items[1]["id"]
+
+
+def test_unsupported_action_turns_gapless_off():
+    device, queue = staging_queue([FAULT.format(code=401)])
+    queue.play(0)
+    assert not queue.gapless
+
+
+def test_item_fault_skips_only_that_item():
+    device, queue = staging_queue([FAULT.format(code=714)])
+    queue.play(0)
+    device.state, device.track_uri = "PLAYING", "http://nas/a.flac"
+    queue.poll_once()
+    assert queue.gapless and queue.staged is None
+    assert device.staged == []
+
+
+def test_clear_and_removing_the_staged_item_clear_the_renderer():
+    from fake_renderer import FakeRenderer
+    from heos_api import HeosDevice
+
+    renderer = FakeRenderer().start()
+    try:
+        queue = PlayQueue(HeosDevice(renderer.ip, renderer.port), queue_file=None)
+        queue.start = lambda: None
+        for name in ("a", "b"):
+            queue.enqueue(f"http://nas/{name}.flac", name)
+        queue.play(0)
+        assert renderer.next_uri == "http://nas/b.flac"
+        queue.remove(queue.items[1]["id"])
+        assert renderer.next_uri == ""
+
+        queue.enqueue("http://nas/c.flac", "c")
+        assert renderer.next_uri == "http://nas/c.flac"
+        queue.clear()
+        assert renderer.next_uri == ""
+    finally:
+        renderer.stop()
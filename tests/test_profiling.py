@@ -0,0 +1,69 @@
+from flask import Flask, jsonify, request
+
+from profiling import RequestProfiler
+
+
+def make_app(tmp_path, **settings):
+    profiler = RequestProfiler(dict(enabled=True, dir=str(tmp_path), mode="sample", **settings))
+    app = Flask(__name__)
+    profiler.init_app(app)
+
+    @app.route("/work")
+    def work():
+        return "done"
+
+    @app.route("/debug/profiles")
+    def debug_profiles():
+        if not profiler.authorized(request):
+            return jsonify({"success": False}), 404
+        return jsonify(profiler.store.list())
+
+    return app, profiler
+
+
+def test_tokenless_config_captures_paths_but_keeps_index_closed(tmp_path):
+    app, profiler = make_app(tmp_path, paths=["/work"])
+    client = app.test_client()
+    response = client.get("/work")
+    assert "X-Profile-Id" in response.headers
+    assert client.get("/debug/profiles").status_code == 404
+    assert client.get("/debug/profiles?token=").status_code == 404
+
+
+def test_index_needs_the_token(tmp_path):
+    app, profiler = make_app(tmp_path, token="s3cret")
+    client = app.test_client()
+    assert client.get("/debug/profiles").status_code == 404
+    assert client.get("/debug/profiles", headers={"X-Profile-Token": "wrong"}).status_code == 404
+    assert client.get("/debug/profiles", headers={"X-Profile-Token": "s3cre"}).status_code == 404
+    assert client.get("/debug/profiles", headers={"X-Profile-Token": "s3cret"}).status_code == 200
+    # Never from the query string, where it would be written to access logs
+    assert client.get("/debug/profiles?token=s3cret").status_code == 404
+
+
+def test_browser_signs_in_with_a_cookie(dashboard, monkeypatch):
+    monkeypatch.setitem(dashboard.request_profiler.options, "token", "s3cret")
+    client = dashboard.app.test_client()
+    assert client.get("/debug/traces").status_code == 404
+
+    refused = client.post("/debug/login", data={"token": "wrong", "next": "/debug/traces"})
+    assert refused.status_code == 403
+    assert client.get("/debug/traces").status_code == 404
+
+    signed_in = client.post("/debug/login", data={"token": "s3cret", "next": "/debug/traces"})
+    assert signed_in.status_code == 302 and signed_in.headers["Location"].endswith("/debug/traces")
+    cookie = signed_in.headers["Set-Cookie"]
+    assert "s3cret" not in cookie and "HttpOnly" in cookie and "Path=/debug/" in cookie
+    assert client.get("/debug/traces").status_code == 200
+
+    # Changing the token signs the browser out
+    monkeypatch.setitem(dashboard.request_profiler.options, "token", "n3w")
+    assert client.get("/debug/traces").status_code == 404
+
+
+def test_sign_in_only_redirects_to_debug_pages(dashboard, monkeypatch):
+    monkeypatch.setitem(dashboard.request_profiler.options, "token", "s3cret")
+    client = dashboard.app.test_client()
+    for target in ("https://evil.example/", "//evil.example/debug/", "/settings"):
+        reply = client.post("/debug/login", data={"token": "s3cret", "next": target})
+        assert reply.headers["Location"].endswith("/debug/profiles")
@@ -0,0 +1,120 @@
+import heapq
+import json
+import time
+from datetime import datetime
+
+from scheduler import PlaybackScheduler, next_occurrence
+
+
+def make_scheduler(tmp_path, **kwargs):
+    return PlaybackScheduler(None, str(tmp_path / "schedules.json"), **kwargs)
+
+
+def stored(tmp_path):
+    with open(tmp_path / "schedules.json") as f:
+        return json.load(f)["scenes"]
+
+
+def wait_for(check, timeout=3):
+    deadline = time.time() + timeout
+    while not check() and time.time() < deadline:
+        time.sleep(0.02)
+    return check()
+
+
+def test_next_occurrence_rolls_over_to_the_next_allowed_day():
+    monday_8am = datetime(2026, 10, 19, 8, 0).timestamp()
+    daily = {"id": "a", "time": "07:00", "days": []}
+    assert next_occurrence(daily, monday_8am) == datetime(2026, 10, 20, 7, 0).timestamp()
+    assert next_occurrence(dict(daily, time="09:30"), monday_8am) == datetime(2026, 10, 19, 9, 30).timestamp()
+    # Monday-only scene already past today: a week later
+    mondays = dict(daily, days=[0])
+    assert next_occurrence(mondays, monday_8am) == datetime(2026, 10, 26, 7, 0).timestamp()
+    # Across the end of the week
+    sunday_late = datetime(2026, 10, 25, 23, 59).timestamp()
+    assert next_occurrence(mondays, sunday_late) == datetime(2026, 10, 26, 7, 0).timestamp()
+    # Strictly after: a scene at exactly its firing time moves on
+    assert next_occurrence(mondays, datetime(2026, 10, 26, 7, 0).timestamp()) == \
+        datetime(2026, 11, 2, 7, 0).timestamp()
+
+
+def test_scenes_are_listed_and_queued_soonest_first(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    for i, time_of_day in enumerate(["23:10", "06:00", "12:45", "00:05", "18:30"]):
+        scheduler.add_scene(f"scene {i}", time_of_day, days=[i])
+
+    scenes = scheduler.list_scenes()
+    now = time.time()
+    assert [s["next_fire"] for s in scenes] == sorted(next_occurrence(s, now) for s in scenes)
+    assert scheduler._heap[0][2] == scenes[0]["id"]
+
+
+def test_removed_scene_is_never_fired(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    kept = scheduler.add_scene("kept", "07:00")
+    removed = scheduler.add_scene("removed", "07:00")
+    assert scheduler.remove_scene(removed["id"])
+    assert not scheduler.remove_scene(removed["id"])
+    assert [s["id"] for s in scheduler.list_scenes()] == [kept["id"]]
+
+    # Make every queued entry, including the stale one, due now
+    fired = []
+    scheduler.run_scene = lambda scene: fired.append(scene["id"])
+    scheduler._heap = [(time.time() - 1,) + entry[1:] for entry in scheduler._heap]
+    heapq.heapify(scheduler._heap)
+    scheduler.start()
+    try:
+        assert wait_for(lambda: fired)
+        time.sleep(0.1)
+    finally:
+        scheduler.stop()
+    assert fired == [kept["id"]]
+    assert [s["id"] for s in stored(tmp_path)] == [kept["id"]]
+
+
+def test_removals_compact_the_heap(tmp_path):
+    scheduler = make_scheduler(tmp_path, save_delay=60)
+    scheduler.start()
+    try:
+        ids = [scheduler.add_scene(f"scene {i}", "07:00")["id"] for i in range(300)]
+        for scene_id in ids[:290]:
+            scheduler.remove_scene(scene_id)
+        assert len(scheduler.list_scenes()) == 10
+        assert len(scheduler._heap) <= 2 * 10 + 64
+    finally:
+        scheduler.stop()
+
+
+def test_changes_are_saved_together_after_a_delay(tmp_path):
+    scheduler = make_scheduler(tmp_path, save_delay=0.2)
+    saves = []
+    save = scheduler.save
+    scheduler.save = lambda: saves.append(1) or save()
+    scheduler.start()
+    try:
+        for i in range(50):
+            scheduler.add_scene(f"scene {i}", "07:00")
+        assert saves == []
+        assert wait_for(lambda: saves)
+        assert len(stored(tmp_path)) == 50
+        assert len(saves) == 1
+    finally:
+        scheduler.stop()
+
+
+def test_changes_are_saved_at_once_without_the_timer_thread(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    scheduler.add_scene("alarm", "07:00")
+    assert [s["name"] for s in stored(tmp_path)] == ["alarm"]
+
+
+def test_stop_writes_pending_changes(tmp_path):
+    scheduler = make_scheduler(tmp_path, save_delay=60)
+    scheduler.start()
+    scheduler.add_scene("alarm", "07:00")
+    scheduler.stop()
+    assert [s["name"] for s in stored(tmp_path)] == ["alarm"]
+
+    reloaded = make_scheduler(tmp_path)
+    reloaded.load()
+    assert [s["name"] for s in reloaded.list_scenes()] == ["alarm"]
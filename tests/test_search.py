@@ -0,0 +1,28 @@
+from search import StationSearchIndex
+from stations import StationManager
+
+
+def test_same_named_stations_stay_separate_results():
+    index = StationSearchIndex.from_stations([
+        {"name": "Jazz FM", "uri": "http://a/jazz"},
+        {"name": "Jazz FM", "uri": "http://b/jazz"},
+        {"name": "Rock FM", "uri": "http://a/rock"},
+    ])
+    assert sorted(result["uri"] for result in index.search("jazz")) == ["http://a/jazz", "http://b/jazz"]
+
+
+def test_index_follows_updates_and_removals(tmp_path):
+    manager = StationManager(str(tmp_path / "stations.json"))
+    manager.replace_stations([{"name": "Jazz FM", "uri": "http://a/jazz"},
+                              {"name": "Jazz FM", "uri": "http://b/jazz"}])
+    index = StationSearchIndex.from_stations(manager.stations).attach(manager)
+
+    # add_station updates the first station of that name in place
+    manager.add_station("Jazz FM", "http://c/jazz")
+    assert sorted(result["uri"] for result in index.search("jazz")) == ["http://b/jazz", "http://c/jazz"]
+
+    manager.add_station("Jazz Café", "http://d/jazz")
+    assert len(index.search("jazz")) == 3
+
+    manager.remove_station("Jazz FM")
+    assert [result["uri"] for result in index.search("jazz")] == ["http://d/jazz"]
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+from soap_trace import TraceRecorder, load_trace, process_path
+
+URL = "http://127.0.0.1:60006/upnp/control/renderer_dvc/AVTransport"
+SERVICE = "urn:schemas-upnp-org:service:AVTransport:1"
+REPLY = b"<CurrentTransportState>PLAYING</CurrentTransportState>"
+
+
+def record(recorder, count):
+    for _ in range(count):
+        recorder.record("GetTransportInfo", SERVICE, URL, "<InstanceID>0</InstanceID>",
+                        status=200, response=REPLY, elapsed=0.01)
+
+
+def test_restart_appends_a_session(tmp_path):
+    for path in (str(tmp_path / "trace.jsonl"), str(tmp_path / "trace.jsonl.gz")):
+        for calls in (2, 3):
+            recorder = TraceRecorder(path, device="receiver")
+            record(recorder, calls)
+            recorder.close()
+        header, calls = load_trace(path)
+        assert header["device"] == "receiver" and header["sessions"] == 2
+        assert len(calls) == 5
+        assert all(call["text"] == REPLY.decode() for call in calls)
+
+
+def test_killed_gzip_recorder_leaves_a_readable_trace(tmp_path):
+    path = str(tmp_path / "trace.jsonl.gz")
+    recorder = TraceRecorder(path)
+    record(recorder, 3)
+    # What is on disk if the process dies now: flushed calls, no end-of-stream marker
+    shutil.copy(path, tmp_path / "killed.jsonl.gz")
+    recorder.close()
+
+    header, calls = load_trace(str(tmp_path / "killed.jsonl.gz"))
+    assert header["sessions"] == 1
+    assert len(calls) == 3
+
+
+def test_partial_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    recorder = TraceRecorder(path)
+    record(recorder, 2)
+    recorder.close()
+    with open(path, "a") as f:
+        f.write('{"t":1.0,"action":"GetTr')
+    assert len(load_trace(path)[1]) == 2
+
+
+def test_process_path():
+    assert process_path("/var/log/trace.jsonl.gz") == f"/var/log/trace.{os.getpid()}.jsonl.gz"
+    assert process_path("trace") == f"trace.{os.getpid()}"
@@ -0,0 +1,63 @@
+import threading
+
+from state_server import StateClient, replace_in_place
+
+
+class FakeDaemonClient(StateClient):
+    """StateClient answering config snapshots locally, counting round trips"""
+
+    def __init__(self, snapshots, **kwargs):
+        super().__init__("unused.sock", **kwargs)
+        self.snapshots = snapshots
+        self.calls = 0
+
+    def call(self, service, method, *args, **kwargs):
+        self.calls += 1
+        return self.snapshots()
+
+
+def test_replace_in_place_keeps_identity_and_drops_stale_keys():
+    config = {"device": {"ip": "a"}, "old": 1}
+    same = replace_in_place(config, {"device": {"ip": "b"}, "ui": {}})
+    assert same is config
+    assert config == {"device": {"ip": "b"}, "ui": {}}
+
+
+def test_sync_config_is_never_seen_empty():
+    revision = [0]
+
+    def snapshots():
+        revision[0] += 1
+        return {"revision": revision[0], "config": {"device": {"ip": str(revision[0])}, "app": {}}}
+
+    client = FakeDaemonClient(snapshots, config_max_age=0)
+    config = {"device": {"ip": "0"}, "app": {}}
+    stop = threading.Event()
+    missing = []
+
+    def reader():
+        while not stop.is_set():
+            if "device" not in config or "app" not in config:
+                missing.append(dict(config))
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for _ in range(20000):
+        client.sync_config(config)
+    stop.set()
+    thread.join()
+    assert missing == []
+
+
+def test_sync_config_asks_the_daemon_at_most_once_per_max_age():
+    client = FakeDaemonClient(lambda: {"revision": 1, "config": {"app": {}}}, config_max_age=60)
+    config = {}
+    for _ in range(100):
+        client.sync_config(config)
+    assert client.calls == 1
+    assert config == {"app": {}}
+
+    # After saving, the next request re-reads without waiting for the age to run out
+    client.config_revision = None
+    client.sync_config(config)
+    assert client.calls == 2
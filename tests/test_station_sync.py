@@ -0,0 +1,145 @@
+import copy
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Dashboard:
+    """`python app.py` in its own directory, syncing with `peer`"""
+
+    def __init__(self, workdir, port, peer_port):
+        from config import DEFAULT_CONFIG
+
+        config = copy.deepcopy(DEFAULT_CONFIG)
+        # Nothing listens on the device port; station routes don't need the receiver
+        config["device"].update(ip="127.0.0.1", port=free_port())
+        config["app"].update(host="127.0.0.1", port=port, debug=False, media_servers=[],
+                             sync_peers=[f"http://127.0.0.1:{peer_port}"], sync_interval=0)
+        workdir.mkdir()
+        (workdir / "config.json").write_text(json.dumps(config))
+        self.url = f"http://127.0.0.1:{port}"
+        self.peer = config["app"]["sync_peers"][0]
+        self.output = open(workdir / "app.log", "w")
+        env = dict(os.environ, HEOS_STATE_SOCKET="")
+        self.process = subprocess.Popen([sys.executable, os.path.join(REPO, "app.py")], cwd=workdir,
+                                        stdout=self.output, stderr=subprocess.STDOUT, env=env)
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                return requests.get(f"{self.url}/api/stations/sync", timeout=1).json()
+            except requests.RequestException:
+                assert self.process.poll() is None, "app.py exited, see app.log"
+                time.sleep(0.2)
+        raise TimeoutError(f"{self.url} did not start")
+
+    def stations(self):
+        """Stations as this dashboard offers them to peers (edited ones; unsaved defaults aren't)"""
+        changes = requests.get(f"{self.url}/stations/changes", params={"since": 0}, timeout=5).json()["changes"]
+        return {change["name"]: change["station"]["uri"] for change in changes if change["station"]}
+
+    def add(self, name, uri):
+        requests.post(f"{self.url}/add_station", data={"name": name, "uri": uri}, timeout=5).raise_for_status()
+
+    def remove(self, name):
+        requests.post(f"{self.url}/remove_station", data={"name": name}, timeout=5).raise_for_status()
+
+    def pull(self):
+        reply = requests.post(f"{self.url}/stations/sync", data={"peer": self.peer}, timeout=10).json()
+        assert reply["success"], reply
+        return reply["reports"][0]
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(10)
+        self.output.close()
+
+
+@pytest.fixture
+def pair(tmp_path):
+    port_a, port_b = free_port(), free_port()
+    a = Dashboard(tmp_path / "a", port_a, port_b)
+    b = Dashboard(tmp_path / "b", port_b, port_a)
+    try:
+        a.wait_ready()
+        b.wait_ready()
+        yield a, b
+    finally:
+        a.stop()
+        b.stop()
+
+
+def test_fresh_dashboard_does_not_bring_back_deleted_defaults(pair):
+    a, b = pair
+    a.remove("NPR")
+    a.add("Jazz", "http://radio.example/jazz.mp3")
+
+    # B's defaults were never saved or edited there, so they are nothing to offer A
+    assert a.pull()["changes"] == 0
+    assert "NPR" not in a.stations()
+    b.pull()
+    assert "NPR" not in b.stations() and b.stations()["Jazz"] == "http://radio.example/jazz.mp3"
+
+
+def test_later_edit_wins_in_both_directions(pair):
+    a, b = pair
+    a.add("Jazz", "http://radio.example/jazz-a.mp3")
+    time.sleep(0.05)
+    b.add("Jazz", "http://radio.example/jazz-b.mp3")
+
+    report = b.pull()
+    assert report["stale"] == 1
+    assert b.stations()["Jazz"] == "http://radio.example/jazz-b.mp3"
+    a.pull()
+    assert a.stations()["Jazz"] == "http://radio.example/jazz-b.mp3"
+    # Settled: nothing flows back
+    assert b.pull()["applied"] == 0 and a.pull()["applied"] == 0
+
+
+def test_defaults_are_seeded_older_than_any_edit(tmp_path):
+    from stations import DEFAULT_STATIONS, StationManager
+    from station_sync import StationChangeLog
+
+    stations = StationManager(str(tmp_path / "stations.json"))
+    changes = StationChangeLog(stations, str(tmp_path / "changes.json"))
+    assert changes.changes(0)["changes"] == []
+    npr = DEFAULT_STATIONS[0]["name"]
+    assert changes.is_newer({"name": npr, "station": None, "at": 1, "origin": "peer"})
+
+    # Saving writes the defaults to stations.json; after a restart they still aren't offered
+    stations.add_station("Jazz", "http://radio.example/jazz.mp3")
+    changes.save()
+    restarted = StationChangeLog(StationManager(str(tmp_path / "stations.json")), str(tmp_path / "changes.json"))
+    assert [change["name"] for change in restarted.changes(0)["changes"]] == ["Jazz"]
+    assert restarted.is_newer({"name": npr, "station": None, "at": 1, "origin": "peer"})
+
+
+def test_equal_edit_times_pick_the_same_winner_everywhere(tmp_path):
+    from stations import StationManager
+    from station_sync import StationChangeLog
+
+    stations = StationManager(str(tmp_path / "stations.json"))
+    changes = StationChangeLog(stations, None)
+    edit = {"name": "Jazz", "station": {"name": "Jazz", "uri": "http://radio.example/a.mp3"}, "at": 5.0}
+    with changes.adopting([dict(edit, origin="bbb")]):
+        stations.apply_changes([edit])
+
+    assert changes.is_newer(dict(edit, origin="ccc"))
+    assert not changes.is_newer(dict(edit, origin="aaa"))
+    # The change echoed back from a peer that adopted it is not newer
+    assert not changes.is_newer(dict(edit, origin="bbb"))
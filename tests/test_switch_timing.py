@@ -0,0 +1,91 @@
+import time
+
+from switch_timing import SwitchTimer, summarize
+
+
+class ScriptedDevice:
+    """Reports the transport states in `states`, then keeps repeating the last one"""
+
+    ip, port = "127.0.0.1", 1
+
+    def __init__(self, *states):
+        self.states = list(states)
+
+    def get_status(self):
+        state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        return {"Transport State": state}
+
+
+def make_timer(device, **kwargs):
+    timer = SwitchTimer(device, history_file=None, **kwargs)
+    # Driven through poll_once here instead of the watcher thread
+    timer.start = lambda: None
+    return timer
+
+
+def begin(timer, station, uri="http://radio.example/live.mp3", **kwargs):
+    now = time.monotonic()
+    return timer.begin(station, uri, now, now, now, **kwargs)
+
+
+def entry(playing_ms, outcome="playing", **fields):
+    return dict({"outcome": outcome, "playing_ms": playing_ms, "set_uri_ms": 5.0, "play_ms": 10.0,
+                 "transitioning_ms": 20.0}, **fields)
+
+
+def test_summarize_percentiles_count_only_switches_that_played():
+    entries = [entry(float(ms)) for ms in range(1, 101)]
+    entries += [entry(None, "timeout"), entry(None, "error"), entry(None, "superseded")]
+    summary = summarize(entries)
+
+    assert summary["switches"] == 103 and summary["failed"] == 2
+    assert (summary["p50_ms"], summary["p90_ms"], summary["p99_ms"]) == (51.0, 90.0, 99.0)
+    assert summary["set_uri_p50_ms"] == 5.0 and summary["transitioning_p50_ms"] == 20.0
+
+    empty = summarize([entry(None, "timeout")])
+    assert empty["p50_ms"] is None and empty["failed"] == 1
+
+
+def test_switch_records_transitioning_then_playing():
+    timer = make_timer(ScriptedDevice("STOPPED", "TRANSITIONING", "PLAYING"))
+    begin(timer, "Jazz")
+    for _ in range(3):
+        timer.poll_once()
+
+    switch = timer.history(1)[0]
+    assert switch["outcome"] == "playing"
+    assert switch["transitioning_ms"] is not None and switch["playing_ms"] >= switch["transitioning_ms"]
+    assert not timer.poll_once()
+
+
+def test_new_switch_supersedes_the_pending_one():
+    timer = make_timer(ScriptedDevice("TRANSITIONING", "PLAYING"))
+    begin(timer, "Jazz")
+    begin(timer, "News")
+    timer.poll_once()
+    timer.poll_once()
+
+    outcomes = [(switch["station"], switch["outcome"]) for switch in timer.history()]
+    assert outcomes == [("News", "playing"), ("Jazz", "superseded")]
+    overall = timer.summary()["overall"]
+    assert overall["switches"] == 2 and overall["failed"] == 0
+
+
+def test_switch_that_never_plays_times_out():
+    timer = make_timer(ScriptedDevice("STOPPED"), timeout=0.05)
+    begin(timer, "Dead stream")
+    assert timer.poll_once()
+    assert timer.history(1)[0]["outcome"] == "pending"
+    time.sleep(0.06)
+    timer.poll_once()
+
+    switch = timer.history(1)[0]
+    assert switch["outcome"] == "timeout" and switch["playing_ms"] is None
+    assert timer.summary()["overall"]["failed"] == 1
+
+
+def test_failed_request_is_recorded_as_an_error():
+    timer = make_timer(ScriptedDevice("STOPPED"))
+    switch = begin(timer, "Jazz", error="Connection failed")
+    assert switch["outcome"] == "error" and switch["error"] == "Connection failed"
+    assert not timer.poll_once()
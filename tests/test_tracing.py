@@ -0,0 +1,62 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import TraceStore, finish_trace, propagate, span, start_trace
+
+
+def test_spans_follow_propagate_into_other_threads():
+    def read(name):
+        with span(name):
+            with span("request"):
+                pass
+
+    trace, token = start_trace("GET /", sampled=True)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        with span("snapshot"):
+            for future in [pool.submit(propagate(read), name) for name in ("status", "volume")]:
+                future.result()
+        # Without propagate the worker has no active trace and records nothing
+        pool.submit(read, "lost").result()
+    finish_trace(trace, token)
+
+    spans = {s["id"]: s for s in trace.spans}
+    by_name = {}
+    for s in trace.spans:
+        by_name.setdefault(s["name"], []).append(s)
+    snapshot = by_name["snapshot"][0]
+    assert snapshot["parent"] == 0
+    assert {s["parent"] for s in by_name["status"] + by_name["volume"]} == {snapshot["id"]}
+    assert sorted(spans[s["parent"]]["name"] for s in by_name["request"]) == ["status", "volume"]
+    assert "lost" not in by_name
+
+
+def test_trace_file_rolls_over_and_keeps_the_backups(tmp_path):
+    trace_file = str(tmp_path / "traces.jsonl")
+    store = TraceStore(trace_file, max_bytes=400, backups=2, keep=100)
+    for i in range(30):
+        store.record({"id": f"t{i}", "name": "GET /", "start": i, "duration_ms": float(i), "spans": []})
+
+    files = sorted(os.listdir(tmp_path))
+    assert files == ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"]
+    assert all(os.path.getsize(tmp_path / name) <= 400 for name in files)
+    with open(trace_file) as f:
+        newest = [json.loads(line)["id"] for line in f]
+    assert newest[-1] == "t29"
+    assert store.slowest(1)[0]["id"] == "t29"
+
+    # A restart picks the current file back up
+    reopened = TraceStore(trace_file, max_bytes=400, backups=2, keep=100)
+    assert [trace["id"] for trace in reopened.recent(len(newest))][::-1] == newest
+
+
+def test_debug_traces_need_the_token(dashboard, monkeypatch):
+    client = dashboard.app.test_client()
+    assert client.get("/debug/traces").status_code == 404
+    assert client.get("/debug/traces/abc").status_code == 404
+
+    monkeypatch.setitem(dashboard.request_profiler.options, "token", "s3cret")
+    assert client.get("/debug/traces", headers={"X-Profile-Token": "wrong"}).status_code == 404
+    assert client.get("/debug/traces", headers={"X-Profile-Token": "s3cret"}).status_code == 200
+    missing = client.get("/debug/traces/abc", headers={"X-Profile-Token": "s3cret"})
+    assert missing.status_code == 404 and missing.get_json()["message"] == "Trace not found"
@@ -0,0 +1,210 @@
+# tracing.py
+"""
+Request Tracing
+Lightweight spans around routes, SOAP calls and storage I/O, kept for slow or
+sampled requests in a rolling JSON-lines file and shown as waterfalls
+"""
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import itertools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_TRACING = {
+    "enabled": True,
+    "sample_rate": 0.05,     # fraction of ordinary requests kept
+    "slow_ms": 250,          # requests at least this slow are always kept
+    "file": "traces.jsonl",
+    "max_bytes": 5 * 1024 * 1024,
+    "backups": 2,
+    "keep": 500,             # traces held in memory for /debug/traces
+}
+
+# (trace, id of the innermost open span) for the code currently running
+_active = contextvars.ContextVar("active_trace", default=None)
+
+
+class Trace:
+    def __init__(self, name, sampled, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.sampled = sampled
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self._ids = itertools.count(1)
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "start": round(self.started_at, 3),
+                "duration_ms": self.duration_ms, "sampled": self.sampled, "attrs": self.attrs,
+                "spans": self.spans}
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the enclosed block as a child of the current span; free when no trace is active
+
+    Yields the span's attribute dict (or None) so callers can add results.
+    """
+    current = _active.get()
+    if current is None:
+        yield None
+        return
+    trace, parent = current
+    span_id = next(trace._ids)
+    token = _active.set((trace, span_id))
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        end = time.perf_counter()
+        _active.reset(token)
+        # list.append is atomic, so spans from helper threads can land here too
+        trace.spans.append({"id": span_id, "parent": parent, "name": name,
+                            "start_ms": round((start - trace.t0) * 1000, 3),
+                            "duration_ms": round((end - start) * 1000, 3), "attrs": attrs})
+
+
+def start_trace(name, sampled, **attrs):
+    """Make a new trace current; returns (trace, token) for finish_trace"""
+    trace = Trace(name, sampled, **attrs)
+    return trace, _active.set((trace, 0))
+
+
+def finish_trace(trace, token=None):
+    trace.duration_ms = round((time.perf_counter() - trace.t0) * 1000, 3)
+    if token is not None:
+        _active.reset(token)
+    return trace
+
+
+def current_trace():
+    current = _active.get()
+    return current[0] if current else None
+
+
+def propagate(fn):
+    """Wrap `fn` to run in a copy of the caller's context (for thread pools)"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class TraceStore:
+    """Recent kept traces in memory plus a size-capped rolling file"""
+
+    def __init__(self, trace_file="traces.jsonl", max_bytes=5 * 1024 * 1024, backups=2, keep=500):
+        self.trace_file = trace_file
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=keep)
+        self._load_tail()
+
+    def _load_tail(self):
+        """Pick up where the previous run left off"""
+        try:
+            with open(self.trace_file, "rb") as f:
+                f.seek(max(0, os.path.getsize(self.trace_file) - self.max_bytes))
+                lines = f.read().splitlines()[-self._recent.maxlen:]
+        except OSError:
+            return
+        for line in lines:
+            try:
+                self._recent.append(json.loads(line))
+            except ValueError:
+                pass
+
+    def _rotate(self):
+        for i in range(self.backups, 0, -1):
+            source = self.trace_file if i == 1 else f"{self.trace_file}.{i - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.trace_file}.{i}")
+
+    def record(self, trace):
+        """Store one finished trace (a dict from Trace.to_dict)"""
+        line = json.dumps(trace, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._recent.append(trace)
+            if not self.trace_file:
+                return True
+            try:
+                if os.path.exists(self.trace_file) and os.path.getsize(self.trace_file) + len(line) > self.max_bytes:
+                    self._rotate()
+                with open(self.trace_file, "a") as f:
+                    f.write(line)
+            except OSError:
+                pass
+        return True
+
+    def slowest(self, limit=20, since=None):
+        """Slowest kept traces, optionally only those started after `since` (epoch seconds)"""
+        with self._lock:
+            traces = [t for t in self._recent if since is None or t["start"] >= since]
+        return sorted(traces, key=lambda t: t["duration_ms"], reverse=True)[:limit]
+
+    def recent(self, limit=50):
+        with self._lock:
+            return list(self._recent)[-limit:][::-1]
+
+    def get(self, trace_id):
+        with self._lock:
+            for trace in self._recent:
+                if trace["id"] == trace_id:
+                    return trace
+        return None
+
+
+def init_app(app, store, settings=None):
+    """Trace every Flask request; keep slow, sampled or forced (X-Trace: 1) ones in `store`"""
+    from flask import request, g, template_rendered, before_render_template
+
+    options = dict(DEFAULT_TRACING)
+    options.update(settings or {})
+    if not options["enabled"]:
+        return
+
+    @app.before_request
+    def begin_request_trace():
+        if request.path.startswith(("/assets/", "/static/", "/debug/")):
+            return
+        forced = request.headers.get("X-Trace") == "1" or request.args.get("trace") == "1"
+        sampled = forced or random.random() < options["sample_rate"]
+        g.trace, g.trace_token = start_trace(f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+                                             sampled, path=request.path)
+
+    @app.after_request
+    def end_request_trace(response):
+        trace = g.pop("trace", None)
+        if trace is None:
+            return response
+        finish_trace(trace, g.pop("trace_token", None))
+        trace.attrs["status"] = response.status_code
+        if trace.sampled or trace.duration_ms >= options["slow_ms"]:
+            response.headers["X-Trace-Id"] = trace.id
+            # Hand the trace over once the response has gone out
+            response.call_on_close(lambda: store.record(trace.to_dict()))
+        return response
+
+    def render_started(sender, template, context, **extra):
+        if current_trace() is not None:
+            manager = span("render", template=template.name)
+            manager.__enter__()
+            g.setdefault("render_spans", []).append(manager)
+
+    def render_finished(sender, template, context, **extra):
+        spans = g.get("render_spans")
+        if spans:
+            spans.pop().__exit__(None, None, None)
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)